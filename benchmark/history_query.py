@@ -0,0 +1,71 @@
+from array import array
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import random
+import sys
+import os
+
+from state.history import StatHistory, SAMPLE_INTERVAL, TIMESTAMP_TYPE, VALUE_TYPE
+
+
+MEMBER_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+SAMPLE_COUNT = 365 * 24 * 60  # a year of one-minute samples
+QUERY_COUNT = 100000
+START_TIME = 1600000000
+
+
+def main():
+    with TemporaryDirectory() as tmp:
+        StatHistory.folder = tmp
+        folder = os.path.join(tmp, "xp")
+        os.makedirs(folder)
+
+        startTime = perf_counter()
+        timestamps = array(TIMESTAMP_TYPE, range(START_TIME, 
+            START_TIME + SAMPLE_COUNT * SAMPLE_INTERVAL, SAMPLE_INTERVAL))
+        values = array(VALUE_TYPE, (float(i * 100) for i in range(SAMPLE_COUNT)))
+        with open(os.path.join(folder, "0.ts"), "wb") as f:
+            timestamps.tofile(f)
+        with open(os.path.join(folder, "0.val"), "wb") as f:
+            values.tofile(f)
+        # every member shares the same data on disk, each still gets its own mapping
+        for i in range(1, MEMBER_COUNT):
+            os.link(os.path.join(folder, "0.ts"), os.path.join(folder, f"{i}.ts"))
+            os.link(os.path.join(folder, "0.val"), os.path.join(folder, f"{i}.val"))
+        buildTime = perf_counter() - startTime
+
+        ids = [str(i) for i in range(MEMBER_COUNT)]
+        endTime = START_TIME + SAMPLE_COUNT * SAMPLE_INTERVAL
+
+        startTime = perf_counter()
+        for id_ in ids:
+            StatHistory.get_series("xp", id_).map()
+        mapTime = perf_counter() - startTime
+
+        queries = []
+        for _ in range(QUERY_COUNT):
+            start = random.randrange(START_TIME, endTime)
+            queries.append((random.choice(ids), start, random.randrange(start, endTime + 1)))
+
+        startTime = perf_counter()
+        for id_, start, end in queries:
+            StatHistory.gained("xp", id_, start, end)
+        queryTime = perf_counter() - startTime
+
+        startTime = perf_counter()
+        samples = StatHistory.get_series("xp", "0").samples(endTime - 86400 * 7, endTime)
+        rangeTime = perf_counter() - startTime
+
+        for series in StatHistory.series.values():
+            series.unmap()
+
+    size = SAMPLE_COUNT * (timestamps.itemsize + values.itemsize)
+    print(f"{MEMBER_COUNT} members x {SAMPLE_COUNT} samples, {size / 1024 / 1024:.1f}MB per series")
+    print(f"build   {buildTime * 1000:8.1f}ms")
+    print(f"map     {mapTime * 1000:8.1f}ms for {MEMBER_COUNT} series")
+    print(f"gained  {queryTime / QUERY_COUNT * 1e6:8.2f}us per query ({QUERY_COUNT} queries)")
+    print(f"range   {rangeTime * 1000:8.2f}ms for {len(samples)} samples of the last 7 days")
+
+
+if __name__ == "__main__":
+    main()
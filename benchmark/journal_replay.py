@@ -0,0 +1,69 @@
+from datetime import timedelta
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import random
+import os
+
+from state.journal import Journal, encode_record, decode_records
+from state.statistic import Statistic
+
+
+EVENT_COUNT = 100000
+MEMBER_COUNT = 100
+
+
+def make_events(ids):
+    events = []
+    reals = {id_: 0 for id_ in ids}
+    for _ in range(EVENT_COUNT):
+        id_ = random.choice(ids)
+        roll = random.random()
+        if roll < 0.4:
+            diff = random.randint(1, 100000)
+            reals[id_] += diff
+            events.append(("xpChange", id_, diff, reals[id_]))
+        elif roll < 0.5:
+            events.append(("emeraldChange", id_, 10, 10))
+        elif roll < 0.55:
+            events.append(("warIncrement", id_))
+        elif roll < 0.95:
+            events.append(("onlineTimeAccumulate", id_, 60.0))
+        else:
+            events.append(("offline", id_))
+    return events
+
+
+def main():
+    ids = [f"{i:032x}" for i in range(MEMBER_COUNT)]
+    events = make_events(ids)
+
+    with TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.journal")
+
+        startTime = perf_counter()
+        raw = b"".join(encode_record(*event) for event in events)
+        encodeTime = perf_counter() - startTime
+        with open(path, "wb") as file:
+            file.write(raw)
+            file.flush()
+            os.fsync(file.fileno())
+
+        startTime = perf_counter()
+        with open(path, "rb") as file:
+            Journal.records, _ = decode_records(file.read())
+        decodeTime = perf_counter() - startTime
+
+        Statistic.stats = {id_: Statistic(id_) for id_ in ids}
+        startTime = perf_counter()
+        applied = Journal.replay(Statistic)
+        replayTime = perf_counter() - startTime
+
+    print(f"{EVENT_COUNT} events, {len(raw)} bytes ({len(raw) / EVENT_COUNT:.1f} bytes/event)")
+    print(f"encode  {encodeTime * 1000:8.1f}ms")
+    print(f"decode  {decodeTime * 1000:8.1f}ms")
+    print(f"replay  {replayTime * 1000:8.1f}ms ({applied} applied)")
+    print(f"total   {(decodeTime + replayTime) * 1000:8.1f}ms to recover")
+
+
+if __name__ == "__main__":
+    main()
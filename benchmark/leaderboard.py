@@ -0,0 +1,99 @@
+from time import perf_counter
+import random
+import sys
+
+from state.leaderboard import Leaderboard
+
+
+MEMBER_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+UPDATE_COUNT = 100000
+RANK_COUNT = 100000
+
+
+def update_list(lb, values, id_):
+    # the previous plain list leader board
+    lb.remove(id_)
+    lo = 0
+    hi = len(lb)
+    val = values[id_]
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if val > values[lb[mid]]:
+            hi = mid
+        else:
+            lo = mid + 1
+    lb.insert(lo, id_)
+
+
+def apply_gains(values, ids, gains):
+    # the list board needs every other entry in place, so values change one at a time
+    for id_, gain in zip(ids, gains):
+        values[id_] += gain
+        yield id_
+
+
+def measure(func, *args):
+    startTime = perf_counter()
+    func(*args)
+    return perf_counter() - startTime
+
+
+def main():
+    ids = [str(i) for i in range(MEMBER_COUNT)]
+    values = {id_: random.randrange(10 ** 6) for id_ in ids}
+    updates = [random.choice(ids) for _ in range(UPDATE_COUNT)]
+    gains = [random.randrange(10 ** 4) for _ in range(UPDATE_COUNT)]
+    ranked = [random.choice(ids) for _ in range(RANK_COUNT)]
+
+    listLb = sorted(ids, key=lambda id_: -values[id_])
+    tree = Leaderboard(values.__getitem__, listLb)
+
+    def run_updates(update):
+        for id_, gain in zip(updates, gains):
+            values[id_] += gain
+            update(id_)
+
+    # both boards go through the same value changes, the second run only re-applies them
+    startValues = dict(values)
+    listUpdate = measure(run_updates, lambda id_: update_list(listLb, values, id_))
+    values.update(startValues)
+    treeUpdate = measure(run_updates, tree.update)
+    assert list(tree) == listLb
+
+    listRank = measure(lambda: [listLb.index(id_) for id_ in ranked])
+    treeRank = measure(lambda: [tree.index(id_) for id_ in ranked])
+
+    # what a stats message does for every member, one rank per leader board
+    listAll = measure(lambda: [listLb.index(id_) for id_ in ids for _ in range(7)])
+    treeAll = measure(lambda: [tree.index(id_) for id_ in ids for _ in range(7)])
+
+    # one api payload, a quarter of the members changed, each board is updated once
+    tick = random.sample(ids, MEMBER_COUNT // 4)
+    tickGains = [random.randrange(10 ** 4) for _ in tick]
+    batchTree = Leaderboard(values.__getitem__, list(tree))
+    startValues = dict(values)
+    listTick = measure(lambda: [update_list(listLb, values, id_) for id_ in apply_gains(values,
+        tick, tickGains)])
+    values.update(startValues)
+    treeTick = measure(lambda: [tree.update(id_) for id_ in apply_gains(values, tick,
+        tickGains)])
+    batchTick = measure(batchTree.update_many, tick)
+    assert list(tree) == list(batchTree) == listLb
+
+    listPage = measure(lambda: [listLb[i:i + 10] for i in range(0, MEMBER_COUNT, 10)])
+    treePage = measure(lambda: [tree[i:i + 10] for i in range(0, MEMBER_COUNT, 10)])
+
+    print(f"{MEMBER_COUNT} members")
+    print("%-22s %12s %12s" % ("", "list", "leaderboard"))
+    print("%-22s %10.2fus %10.2fus" % ("update", listUpdate / UPDATE_COUNT * 1e6,
+        treeUpdate / UPDATE_COUNT * 1e6))
+    print("%-22s %10.2fus %10.2fus" % ("rank of", listRank / RANK_COUNT * 1e6,
+        treeRank / RANK_COUNT * 1e6))
+    print("%-22s %10.1fms %10.1fms" % ("7 ranks of everyone", listAll * 1000, treeAll * 1000))
+    print("%-22s %10.1fms %10.1fms" % ("tick of 25%", listTick * 1000, treeTick * 1000))
+    print("%-22s %12s %10.1fms" % ("tick of 25%, batched", "", batchTick * 1000))
+    print("%-22s %10.1fms %10.1fms" % ("every page of 10", listPage * 1000, treePage * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+from datetime import timedelta
+from time import perf_counter
+import random
+import sys
+
+from state.statistic import Statistic, METRICS, ACCUMULATORS
+from state.statengine import StatEngine
+from cog.snapshotmanager import STAT_FIELDS
+
+
+MEMBER_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+REPEAT = 20
+
+
+def make_stats():
+    stats = {}
+    for i in range(MEMBER_COUNT):
+        stat = Statistic(str(i))
+        stat.xp.update(0)
+        stat.xp.update(random.randrange(10 ** 7))
+        stat.war.accumulate(random.randrange(100))
+        stat.onlineTime.accumulate(timedelta(seconds=random.randrange(10 ** 5)))
+        stats[stat.id] = stat
+    return stats
+
+
+def reset_biweekly(stats):
+    # Statistic.reset_biweekly without the leader boards and the event
+    if Statistic.engine:
+        for metric in METRICS.values():
+            for field in metric.resets:
+                Statistic.engine.reset(metric.name, field)
+    else:
+        for stat in stats.values():
+            stat._reset_biweekly()
+
+
+def measure(func):
+    startTime = perf_counter()
+    for _ in range(REPEAT):
+        func()
+    return (perf_counter() - startTime) / REPEAT
+
+
+def run(stats):
+    Statistic.stats = stats
+    ids = list(stats)
+    return {
+        "bi-weekly reset": measure(lambda: reset_biweekly(stats)),
+        "guild total": measure(lambda: Statistic.total("xp", "total")),
+        "percentile": measure(lambda: Statistic.percentile(random.choice(ids), "xp", "total")),
+        "snapshot rows": measure(lambda: Statistic.value_rows(STAT_FIELDS))
+    }
+
+
+def main():
+    if not StatEngine.available:
+        print("numpy is not installed")
+        return
+    stats = make_stats()
+    plain = run(stats)
+
+    Statistic.engine = StatEngine()
+    for stat in stats.values():
+        Statistic.engine.bind(stat, *ACCUMULATORS)
+    columnar = run(stats)
+
+    print(f"{MEMBER_COUNT} members")
+    print("%-22s %12s %12s" % ("", "objects", "columns"))
+    for name in plain:
+        print("%-22s %10.2fms %10.2fms" % (name, plain[name] * 1000, columnar[name] * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+from time import perf_counter
+import pickle
+import random
+import sys
+import tracemalloc
+
+from state.window import RingCounter, WINDOWS, BUCKET_COUNT
+
+
+MEMBER_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+HOURS = 24 * 7
+UPDATES_PER_HOUR = 4
+
+
+def sum_events(events, hour, size):
+    # what a plain list of timestamped gains costs to read
+    return sum(val for h, val in events if hour - size < h <= hour)
+
+
+def main():
+    tracemalloc.start()
+    counters = {str(i): RingCounter(0) for i in range(MEMBER_COUNT)}
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    events = {id_: [] for id_ in counters}
+    startTime = perf_counter()
+    for hour in range(HOURS):
+        for id_ in random.sample(list(counters), MEMBER_COUNT // 4):
+            for _ in range(UPDATES_PER_HOUR):
+                val = random.randrange(10 ** 4)
+                counters[id_].add(hour, val)
+                events[id_].append((hour, val))
+    addTime = perf_counter() - startTime
+    updateCount = HOURS * MEMBER_COUNT // 4 * UPDATES_PER_HOUR
+
+    startTime = perf_counter()
+    for counter in counters.values():
+        counter.advance(HOURS)
+    rollTime = perf_counter() - startTime
+
+    startTime = perf_counter()
+    ringTotals = [counter.sums[window] for counter in counters.values() for window in WINDOWS]
+    ringTime = perf_counter() - startTime
+    startTime = perf_counter()
+    listTotals = [sum_events(events[id_], HOURS, size) for id_ in counters
+        for size in WINDOWS.values()]
+    listTime = perf_counter() - startTime
+    assert ringTotals == listTotals
+
+    stored = sum(len(pickle.dumps(counter)) for counter in counters.values())
+    print(f"{MEMBER_COUNT} members, {BUCKET_COUNT} hourly buckets each, {HOURS} hours of gains")
+    print("%-28s %10.2fMB" % ("memory", memory / 2 ** 20))
+    print("%-28s %10.2fMB" % ("stored", stored / 2 ** 20))
+    print("%-28s %10.2fus" % ("add", addTime / updateCount * 10 ** 6))
+    print("%-28s %10.2fms" % ("roll one hour", rollTime * 1000))
+    print("%-28s %10.2fms" % ("read every window, buckets", ringTime * 1000))
+    print("%-28s %10.2fms" % ("read every window, events", listTime * 1000))
+
+
+if __name__ == "__main__":
+    main()
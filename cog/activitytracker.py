@@ -6,16 +6,17 @@ from discord.ext import commands, tasks
 
 from logger import Logger
 from event import Event
-from wynnapi import WynnAPI
+from wynnapi import WynnAPI, ServerListDelta, StaleNotice
 from msgmaker import *
-from reactablemessage import RMessage
 from util.cmdutil import parser
 from util.timeutil import now as utcNow
 from util.discordutil import Discord
 from state.config import Config
 from state.guildmember import GuildMember
+from state.metric import Metric
 from cog.datamanager import DataManager
 from cog.snapshotmanager import SnapshotManager
+from cog.leaderboards import Leaderboards
 
 
 ACTIVITY_UPDATE_INTERVAL = 1  # in minutes
@@ -26,57 +27,123 @@ class ActivityTracker(commands.Cog):
     
     def __init__(self, bot: commands.Bot):
         self._snapManager: SnapshotManager = bot.get_cog("SnapshotManager")
-        self._serverListReceiver = WynnAPI.serverList.create_receiver()
+        self._leaderboards: Leaderboards = bot.get_cog("Leaderboards")
 
         self.lastUpdateTime = utcNow()
         self.bot = bot
 
+        self._onlineIds = set()
+        # members that became active since the last server list, they may already be online
+        self._newlyActiveIds = set()
+        self._isStale = False
+        # online time observed since the last activity update, counted once per interval
+        self._pendingTime = {}
+
         self._snapManager.add("ActivityTracker", self)
+        self._leaderboards.set_update_info("onlineTime", 
+            lambda: {"lastUpdate": self._get_last_update_dt()})
+
+        Event.listen("memberAdd", self._on_member_active)
+        Event.listen("memberStatusChange", self._on_member_active)
         
     async def __snap__(self):
-        return await self._make_activity_pages()
+        return None
     
     async def __loaded__(self):
-        self._activity_update.start()
+        self._updateTask = self.bot.loop.create_task(self._activity_update())
+        self._accumulate_online_time.start()
     
+    async def _activity_update(self):
+        await self.bot.wait_until_ready()
+        Logger.bot.debug("Starting activity update loop")
+
+        async for delta in WynnAPI.serverList.subscribe(notifyStale=True):
+            if isinstance(delta, StaleNotice):
+                # online time can't be observed during an outage, so it isn't counted.
+                self._isStale = self._isStale or delta.isStale
+                continue
+            try:
+                await self._on_server_list(delta)
+            except Exception as e:
+                Logger.bot.error(f"failed to update activity with {delta}: {e!r}")
+
     @tasks.loop(minutes=ACTIVITY_UPDATE_INTERVAL)
-    async def _activity_update(self):        
-        serverList = self._serverListReceiver.getData()
-        if not serverList:
-            return
-        
-        filter_ = lambda m: m.status == GuildMember.ACTIVE
-        with GuildMember.members:
-            tracked = {m.ign async for m in GuildMember.members.avalues(filter_)}
+    async def _accumulate_online_time(self):
+        pending = self._pendingTime
+        self._pendingTime = {}
+        async with Statistic.batch():
+            for id_, dt in pending.items():
+                await Statistic.stats[id_].accumulate_online_time(dt)
+
+    @_accumulate_online_time.before_loop
+    async def _before_accumulate_online_time(self):
+        await self.bot.wait_until_ready()
 
+    async def _flush_online_time(self, id_):
+        # the time of a session is counted before it ends and resets the current entry
+        if id_ in self._pendingTime:
+            await Statistic.stats[id_].accumulate_online_time(self._pendingTime.pop(id_))
+
+    async def _on_member_active(self, id_, prevStatus=None):
+        if GuildMember.members[id_].status == GuildMember.ACTIVE:
+            self._newlyActiveIds.add(id_)
+
+    async def _on_server_list(self, delta: ServerListDelta):
         now = utcNow()
-        if self.lastUpdateTime:
+        if self.lastUpdateTime and not self._isStale:
             interval = now - self.lastUpdateTime
         else:
             interval = timedelta(seconds=0)
+        self._isStale = False
 
-        for server, players in serverList.items():
-            for ign in players:
-                if ign in tracked:
+        # ign -> new world (None when offline) of every player whose world changed.
+        moves = {}
+        if delta.isInitial:
+            filter_ = lambda m: m.status == GuildMember.ACTIVE and Statistic.stats[m.id].world
+            with GuildMember.members:
+                async for member in GuildMember.members.avalues(filter_):
+                    moves[member.ign] = None
+            self._onlineIds.clear()
+        for world, igns in delta.left.items():
+            for ign in igns:
+                moves.setdefault(ign, None)
+        for world, igns in delta.joined.items():
+            for ign in igns:
+                moves[ign] = world
+        if self._newlyActiveIds:
+            # they have no move if they were online before becoming active
+            newlyActive = {GuildMember.members[id_].ign for id_ in self._newlyActiveIds
+                if id_ not in self._onlineIds}
+            self._newlyActiveIds.clear()
+            for world, igns in delta.worlds.items():
+                for ign in newlyActive.intersection(igns):
+                    moves.setdefault(ign, world)
 
-                    stat: Statistic = Statistic.stats[GuildMember.ignIdMap[ign]]
+        async with Statistic.batch():
+            for id_ in list(self._onlineIds):
+                stat: Statistic = Statistic.stats[id_]
+                if not stat.world:
+                    self._onlineIds.discard(id_)
+                    await self._flush_online_time(id_)
+                    continue
+                world = moves.get(GuildMember.members[id_].ign, stat.world)
+                if world and not world.startswith("lobby"):
+                    self._pendingTime[id_] = self._pendingTime.get(id_, timedelta()) + interval
 
-                    if stat.world and not server.startswith("lobby"):
-                            await stat.accumulate_online_time(interval)
-                    
-                    await stat.update_world(server)
-                    tracked.remove(ign)
-        
-        for ign in tracked:
-            await Statistic.stats[GuildMember.ignIdMap[ign]].update_world(None)
+            for ign, world in moves.items():
+                if not GuildMember.is_ign_active(ign):
+                    continue
+                id_ = GuildMember.ignIdMap[ign]
+                if not world:
+                    await self._flush_online_time(id_)
+                await Statistic.stats[id_].update_world(world)
+                if world:
+                    self._onlineIds.add(id_)
+                else:
+                    self._onlineIds.discard(id_)
         
         self.lastUpdateTime = now
     
-    @_activity_update.before_loop
-    async def _before_activity_update(self):
-        await self.bot.wait_until_ready()
-        Logger.bot.debug("Starting activity update loop")
-    
     def _get_last_update_dt(self):
         dt = utcNow() - self.lastUpdateTime
         return f"{trunc(dt.seconds)} seconds ago"
@@ -91,26 +158,10 @@ class ActivityTracker(commands.Cog):
             title="Online Members", lastUpdate=self._get_last_update_dt())
         await ctx.send(text)
     
-    async def _make_activity_pages(self):
-        valGetter = lambda m: format_act_dt(Statistic.stats[m.id].onlineTime["biweek"])
-        pages = make_entry_pages(await make_stat_entries(
-            valGetter, group=False, lb=Statistic.onlineTimeBwLb), 
-            title="Activities", lastUpdate=self._get_last_update_dt())
-
-        return pages
-    
-    @parser("act", "-snap", isGroup=True)
-    async def display_activity(self, ctx: commands.Context, snap):
-        if snap:
-            pages = await self._snapManager.get_snapshot_cmd(ctx, snap, 
-                "ActivityTracker")
-            if not pages:
-                return
-        else:
-            pages = await self._make_activity_pages()
-
-        rMsg = RMessage(await ctx.send(pages[0]))
-        await rMsg.add_pages(pages)
+    @parser("act", "-snap", "--window", isGroup=True)
+    async def display_activity(self, ctx: commands.Context, snap, window):
+        await self._leaderboards.send_lb(ctx, Metric.registry["onlineTime"], "biweek", snap,
+            window)
     
     @parser("act reset", parent=display_activity)
     async def reset_activity(self, ctx: commands.Context):
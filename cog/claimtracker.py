@@ -4,7 +4,7 @@ from math import trunc
 from discord.ext import commands, tasks
 
 from logger import Logger
-from wynnapi import WynnAPI
+from wynnapi import WynnAPI, TerritoryListDelta
 from msgmaker import *
 from util.timeutil import now, add_tz_info
 from util.cmdutil import parser
@@ -13,7 +13,6 @@ from state.config import Config
 from cog.datamanager import DataManager
 
 
-CLAIM_UPDATE_INTERVAL = 6
 CLAIM_ALERT_DElAY = 6  # in minutes
 
 
@@ -24,8 +23,7 @@ class ClaimTracker(commands.Cog):
         self._claims = {}
         self._claimNameOrder = []
         self._allTerrs = set()
-
-        self._terrListReceiver = WynnAPI.terrList.create_receiver()
+        self._pendingClaims = set()
 
         self._hasInitClaimUpdate = False
         # -1 = disabled
@@ -42,28 +40,33 @@ class ClaimTracker(commands.Cog):
         self._claimNameOrder = list(self._claims.keys())
         self._order_claim_names()
 
-        self._claim_update.start()
+        self._updateTask = self.bot.loop.create_task(self._claim_update())
 
-    @tasks.loop(seconds=CLAIM_UPDATE_INTERVAL)
     async def _claim_update(self):
-        claimList = self._terrListReceiver.getData()
-        if not claimList:
-            return
-        claimList = claimList["territories"]
+        await self.bot.wait_until_ready()
+        Logger.bot.debug("starting claim update loop")
+
+        async for delta in WynnAPI.terrList.subscribe():
+            try:
+                await self._on_terr_list(delta)
+            except Exception as e:
+                Logger.bot.error(f"failed to update claims with {delta}: {e!r}")
 
-        if not self._hasInitClaimUpdate:
+    async def _on_terr_list(self, delta: TerritoryListDelta):
+        claimList = delta.territories
+        if not self._hasInitClaimUpdate or delta.isInitial:
             self._allTerrs = set(claimList.keys())
             self._hasInitClaimUpdate = True
         
-        isClaimAttacked = False
         isClaimReclaimed = False
         isClaimChanged = False
+
+        changedClaims = self._pendingClaims.union(delta.changed).intersection(self._claims)
+        self._pendingClaims.clear()
         
-        for claim in self._claims:
+        for claim in changedClaims:
+            currGuild, acquired = claimList[claim]
             prevGuild = self._claims[claim]["guild"]
-            currGuild = claimList[claim]["guild"]
-            if currGuild != "HackForums":
-                isClaimAttacked = True
             self._claims[claim]["guild"] = currGuild
             if prevGuild != currGuild:
                 isClaimChanged = True
@@ -77,10 +80,16 @@ class ClaimTracker(commands.Cog):
                 text = f"{emoji} **{claim}**  __{prevGuild}__  ->  __{currGuild}__"
                 await Discord.send(Config.channel_claimLog, text)
 
-            acquired = self._parse_acquired(claimList[claim]["acquired"])
-            self._claims[claim]["acquired"] = acquired
+            self._claims[claim]["acquired"] = self._parse_acquired(acquired)
         
-        self._order_claim_names()
+        if changedClaims:
+            self._order_claim_names()
+
+        await self.check_alert(isClaimReclaimed)
+
+    async def check_alert(self, isClaimReclaimed=False):
+        # also called by WarTracker when a war ends, the claims may not change after it
+        isClaimAttacked = any(c["guild"] != "HackForums" for c in self._claims.values())
 
         if isClaimAttacked:
             await self.update_alert()
@@ -89,11 +98,6 @@ class ClaimTracker(commands.Cog):
                 return
         await self.dismiss_alert()
     
-    @_claim_update.before_loop
-    async def _before_claim_update(self):
-        await self.bot.wait_until_ready()
-        Logger.bot.debug("starting claim update loop")
-    
     def schedule_alert(self):
         if Config.role_claimAlert and not self._alertStatus:
             Logger.bot.info(f"claim alert is scheduled")
@@ -219,6 +223,7 @@ class ClaimTracker(commands.Cog):
                 "acquired": now()
             }
             self._claimNameOrder.append(terr)
+            self._pendingClaims.add(terr)
         self._order_claim_names
         
         invalidTerrs = terrs.difference(self._allTerrs)
@@ -1,9 +1,11 @@
 from inspect import iscoroutinefunction
+from time import perf_counter
 
 from discord.ext import commands, tasks
 
 from logger import Logger
 from util.pickleutil import PickleUtil
+from util.aioutil import AIOUtil
 from state.state import State
 
 
@@ -14,6 +16,7 @@ class DataManager(commands.Cog):
     _classes = {}
     _idFuncs = {}
     _mappers = {}
+    _digests = {}
 
     @classmethod
     def register(cls, *attributes, idFunc=None, mapper=None):
@@ -28,10 +31,14 @@ class DataManager(commands.Cog):
         return decorator
     
     @classmethod
-    def make_data_file_path(cls, obj):
+    def make_data_name(cls, obj):
         targetCls = obj.__class__
         id_ = "." + cls._idFuncs[targetCls](obj) if targetCls in cls._idFuncs else ""
-        return f"./data/{targetCls.__name__}{id_}.data"
+        return f"{targetCls.__name__}{id_}"
+
+    @classmethod
+    def make_data_file_path(cls, obj):
+        return f"./data/{cls.make_data_name(obj)}.data"
 
     @classmethod
     async def load(cls, obj):
@@ -39,7 +46,12 @@ class DataManager(commands.Cog):
         dataFile = cls.make_data_file_path(obj)
         Logger.bot.debug(f"loading {dataFile} into {obj}")
 
-        attrMap = PickleUtil.load(dataFile)
+        attrMap = None
+        if State.store:
+            attrMap = await AIOUtil.run("store.load", State.store.load_blob, 
+                cls.make_data_name(obj))
+        if attrMap is None:
+            attrMap = await AIOUtil.run("state.load", PickleUtil.load, dataFile)
         if attrMap:
             Logger.bot.debug(f"data found: {attrMap}")
 
@@ -70,21 +82,64 @@ class DataManager(commands.Cog):
         self._save_loop.start()
 
     def save(self):
+        startTime = perf_counter()
+        written = 0
+        for op, func, *args in self.prepare_save():
+            try:
+                written += func(*args) or 0
+            except Exception as e:
+                Logger.bot.error(f"failed {op} of {args[1]}: {e!r}")
+        written += State.save()
+        self._log_save(written, startTime)
+
+    async def save_async(self):
+        startTime = perf_counter()
+        jobs = self.prepare_save()
+        written = 0
+        # a failed write keeps the previous digest, so it is retried on the next save
+        for op, func, *args in jobs:
+            try:
+                written += await AIOUtil.run(op, func, *args) or 0
+            except Exception as e:
+                Logger.bot.error(f"failed {op} of {args[1]}: {e!r}")
+        written += await State.save_async()
+        self._log_save(written, startTime)
+
+    def prepare_save(self):
+        jobs = []
         for [attributes, instances] in DataManager._classes.values():
             for obj in instances:
                 attrMap = {attr: getattr(obj, attr) for attr in attributes \
                     if hasattr(obj, attr)}
                 dataFile = self.make_data_file_path(obj)
+
+                raw = PickleUtil.dumps(attrMap)
+                digest = PickleUtil.digest(raw)
+                if DataManager._digests.get(dataFile) == digest:
+                    continue
+
                 Logger.bot.debug(f"saving {obj} {attrMap} into {dataFile}")
-                PickleUtil.save(dataFile, attrMap)
-        State.save()
+                jobs.append(("state.write", self._write, obj, dataFile, raw, digest))
+        return jobs
+    
+    def _write(self, obj, dataFile, raw, digest):
+        if State.store:
+            written = State.store.save_blob(self.make_data_name(obj), raw)
+        else:
+            written = PickleUtil.write(dataFile, raw)
+        DataManager._digests[dataFile] = digest
+        return written
+    
+    def _log_save(self, written, startTime):
+        duration = (perf_counter() - startTime) * 1000
+        Logger.bot.info(f"saved {written} bytes of data in {duration:.1f}ms")
 
     def cog_unload(self):
         self.save()
     
     @tasks.loop(minutes=SAVE_INTERVAL)
     async def _save_loop(self):
-        self.save()
+        await self.save_async()
     
     @_save_loop.before_loop
     async def _before_save_loop(self):
@@ -49,13 +49,13 @@ class DateClock(commands.Cog):
         self._update_loop_interval()
     
     async def _daily_callback(self):
-        archiveNames = Logger.reset()
+        archiveNames = await Logger.reset()
         self._remoteDebugger.add_archives(*archiveNames)
 
     async def _bw_callback(self):
         Logger.bot.debug(f"Bi week transitioned at {timeutil.now()}")
         await self._snapshotManager.save_snapshot()
-        Statistic.reset_biweekly()
+        await Statistic.reset_biweekly()
 
     def _update_loop_interval(self):
         now = timeutil.now()
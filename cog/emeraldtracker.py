@@ -9,9 +9,11 @@ from util.timeutil import now
 from util.discordutil import Discord
 from state.config import Config
 from state.guildmember import GuildMember
+from state.metric import Metric
 from state.statistic import Statistic
 from cog.datamanager import DataManager
 from cog.snapshotmanager import SnapshotManager
+from cog.leaderboards import Leaderboards
 
 
 @DataManager.register("lastUpdateTimeStr")
@@ -23,15 +25,15 @@ class EmeraldTracker(commands.Cog):
         self.lastUpdateTimeStr = "owo"
 
         self._snapshotManager: SnapshotManager = bot.get_cog("SnapshotManager")
+        self._leaderboards: Leaderboards = bot.get_cog("Leaderboards")
 
         self._snapshotManager.add("EmeraldTracker", self)
+        self._leaderboards.set_update_info("emerald", 
+            lambda: {"lastUpdate": self.lastUpdateTimeStr})
     
     async def __snap__(self):
-        title = "Emerald Contribution Leader Board"
-        return (
-            await self.make_emerald_lb_pages(False),
-            await self.make_emerald_lb_pages(True)
-        )
+        # the leader boards are part of the shared snapshot data
+        return None
     
     @commands.Cog.listener()
     async def on_message(self, message: Message):
@@ -58,48 +60,24 @@ class EmeraldTracker(commands.Cog):
 
     async def parse_gu_list(self, text: str):
         failedLineNum = 0
-        for line in text.split("\n"):
-            if not line:
-                continue
-            try:
-                sections = line.split(" - ")
-                ign = sections[0].split(" ")[-1]
-                if GuildMember.is_ign_active(ign):
-                    em = int(sections[2][:-1])
-                    await Statistic.stats[GuildMember.ignIdMap[ign]].update_emerald(em)
-            except Exception:
-                failedLineNum += 1
+        async with Statistic.batch():
+            for line in text.split("\n"):
+                if not line:
+                    continue
+                try:
+                    sections = line.split(" - ")
+                    ign = sections[0].split(" ")[-1]
+                    if GuildMember.is_ign_active(ign):
+                        em = int(sections[2][:-1])
+                        await Statistic.stats[GuildMember.ignIdMap[ign]].update_emerald(em)
+                except Exception:
+                    failedLineNum += 1
         return failedLineNum
     
-    async def make_emerald_lb_pages(self, total):
-        if total:
-            lb = Statistic.emeraldTotalLb
-            field = "total"
-            titlePrefix = "Total "
-        else:
-            lb = Statistic.emeraldLb
-            field = "biweek"
-            titlePrefix = "Bi-Weekly "
-
-        valGetter = lambda m: Statistic.stats[m.id].emerald[field]
-        filter_ = lambda m: m.status != GuildMember.REMOVED
-        
-        return make_entry_pages(await make_stat_entries(
-            valGetter, filter_=filter_, lb=lb),
-            title=titlePrefix + "Emerald Leader Board", lastUpdate=self.lastUpdateTimeStr)
-
-    @parser("em", ["total"], "-snap", isGroup=True)
-    async def display_emerald(self, ctx: commands.Context, total, snap):
-        if snap:
-            pages = await self._snapshotManager.get_snapshot_cmd(ctx, snap, 
-                "EmeraldTracker", total)
-            if not pages:
-                return
-        else:
-            pages = await self.make_emerald_lb_pages(total)
-
-        rMsg = RMessage(await ctx.send(pages[0]))
-        await rMsg.add_pages(pages)
+    @parser("em", ["total"], "-snap", "--window", isGroup=True)
+    async def display_emerald(self, ctx: commands.Context, total, snap, window):
+        await self._leaderboards.send_lb(ctx, Metric.registry["emerald"], 
+            "total" if total else "biweek", snap, window)
 
     @parser("em parse", parent=display_emerald)
     async def start_parse(self, ctx: commands.Context):
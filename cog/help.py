@@ -6,6 +6,7 @@ from discord.ext import commands
 
 from msgmaker import decorate_text, make_alert, COLOR_INFO
 from util.cmdutil import parser
+from util.aioutil import AIOUtil
 from util.discordutil import Discord
 
 
@@ -32,8 +33,7 @@ class Help(commands.Cog):
         f = HELP_FOLDER + f + ".txt"
 
         if os.path.isfile(f):
-            with open(f, "r") as helpFile:
-                text = "".join(helpFile.readlines())
+            text = await AIOUtil.read_text(f, "help.read")
 
             [title, text, *fields, subtext] = text.split("\n\n\n")
 
@@ -0,0 +1,108 @@
+from asyncio import Lock
+from datetime import timedelta
+from functools import partial
+from time import time
+
+from discord.ext import tasks, commands
+
+from logger import Logger
+from event import Event
+from msgmaker import *
+from util.cmdutil import parser
+from util.aioutil import AIOUtil
+from state.guildmember import GuildMember
+from state.metric import Metric
+from state.history import StatHistory, METRICS
+
+
+FLUSH_INTERVAL = 1  # in minutes
+DEFAULT_DAYS = 7
+MAX_DAYS = 30
+BAR_WIDTH = 20
+
+
+class HistoryTracker(commands.Cog):
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        # keeps queries from mapping files while a flush is appending to them
+        self._lock = Lock()
+
+        for metric in Metric.registry.values():
+            Event.listen(metric.event, partial(self._on_metric_change, metric), batch=True)
+
+        self._flush.start()
+
+    async def _on_metric_change(self, metric: Metric, changes):
+        # a batch of changes comes from one update, they all share its timestamp
+        timestamp = time()
+        for id_, diff in changes:
+            if isinstance(diff, timedelta):
+                diff = diff.total_seconds()
+            StatHistory.accumulate(metric.name, id_, diff, timestamp)
+
+    async def _load(self, series=None):
+        unloaded = StatHistory.unloaded(series)
+        if unloaded:
+            bases = await AIOUtil.run("history.load", StatHistory.read_bases, unloaded)
+            StatHistory.resolve(unloaded, bases)
+
+    @tasks.loop(minutes=FLUSH_INTERVAL)
+    async def _flush(self):
+        async with self._lock:
+            await self._load()
+            jobs = StatHistory.begin_flush()
+            if jobs:
+                written = await AIOUtil.run("history.write", StatHistory.write, jobs)
+                stale = StatHistory.end_flush(jobs, written)
+                if stale:
+                    await AIOUtil.run("history.unmap", StatHistory.close_mapped, stale)
+
+    @_flush.before_loop
+    async def _before_flush(self):
+        await self.bot.wait_until_ready()
+        Logger.bot.debug("Starting history flushing loop")
+
+    def cog_unload(self):
+        self._flush.cancel()
+        StatHistory.flush()
+
+    def _format_val(self, metric, val):
+        if Metric.registry[metric].valType is timedelta:
+            return format_act_dt(timedelta(seconds=val))
+        return f"{int(val):,}"
+
+    @parser("history", "ign", ["metric", METRICS], "-days")
+    async def display_history(self, ctx: commands.Context, ign, metric, days):
+        if ign not in GuildMember.ignIdMap:
+            await ctx.send(embed=make_alert(f"{ign} is/was not in the guild."))
+            return
+        if days and (not days.isnumeric() or not 0 < int(days) <= MAX_DAYS):
+            await ctx.send(embed=make_alert(f"days has to be between 1 and {MAX_DAYS}."))
+            return
+        days = int(days) if days else DEFAULT_DAYS
+        id_ = GuildMember.ignIdMap[ign]
+
+        series = StatHistory.get_series(metric, id_)
+        async with self._lock:
+            await self._load([series])
+            unmapped = StatHistory.unmapped([series])
+            if unmapped:
+                mappings = await AIOUtil.run("history.map", StatHistory.open_mappings, unmapped)
+                StatHistory.attach(unmapped, mappings)
+
+        curr = int(time())
+        gains = [StatHistory.gained(metric, id_, curr - (day + 1) * 86400, curr - day * 86400)
+            for day in range(days)]
+        maxGain = max(gains) or 1
+
+        text = ""
+        for day, gain in enumerate(gains):
+            bar = "#" * round(gain / maxGain * BAR_WIDTH)
+            text += "%3dd ago  %-*s  %s\n" % (day + 1, BAR_WIDTH, bar,
+                self._format_val(metric, gain))
+        text += "\n"
+        for span in (1, 7, 30):
+            text += "last %2d days  %s\n" % (span,
+                self._format_val(metric, StatHistory.gained(metric, id_, curr - span * 86400)))
+        await ctx.send(decorate_text(text, title=f"{ign}'s {metric} History"))
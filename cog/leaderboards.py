@@ -0,0 +1,100 @@
+from datetime import timedelta
+
+from discord.ext import commands
+
+from msgmaker import *
+from reactablemessage import RMessage
+from util.cmdutil import parser
+from state.guildmember import GuildMember
+from state.metric import Metric
+from state.statistic import Statistic
+from state.window import StatWindow, WINDOWS
+from cog.snapshotmanager import SnapshotManager, Snapshot, LB_PART
+
+
+class Leaderboards(commands.Cog):
+
+    def __init__(self, bot: commands.Bot):
+        self._snapshotManager: SnapshotManager = bot.get_cog("SnapshotManager")
+
+        # metric name -> function returning how a live board tells when it was updated
+        self._updateInfo = {}
+
+    def set_update_info(self, metricName, getter):
+        self._updateInfo[metricName] = getter
+
+    async def make_lb_pages(self, metric: Metric, field, snap: Snapshot = None):
+        lbName = metric.lbs[field]
+        if snap:
+            await snap.load("members", "stats", LB_PART + lbName)
+            if lbName not in snap.lbs:
+                return None
+            lb = snap.lbs[lbName]
+            stats = snap.stats
+            guildTotal = sum((getattr(stat, metric.name)[field] for stat in stats.values()),
+                metric.valType())
+            decoArgs = {"lastUpdate": snap.timeStr}
+        else:
+            lb = getattr(Statistic, lbName)
+            stats = Statistic.stats
+            guildTotal = Statistic.total(metric.name, field)
+            decoArgs = self._updateInfo.get(metric.name, dict)()
+
+        isTime = metric.valType is timedelta
+        format_ = format_act_dt if isTime else (lambda val: val)
+        valGetter = lambda m: format_(getattr(stats[m.id], metric.name)[field])
+        filter_ = lambda m: m.status != GuildMember.REMOVED
+        totalStr = format_act_dt(guildTotal) if isTime else f"{guildTotal:,}"
+
+        return make_entry_pages(await make_stat_entries(
+            valGetter, group=not isTime, filter_=filter_, lb=lb,
+            members=snap.members if snap else None), title=metric.make_lb_title(field),
+            info=f"Guild total: {totalStr}", **decoArgs)
+
+    async def make_window_pages(self, metric: Metric, window):
+        StatWindow.roll()
+        lb = StatWindow.lbs[metric.name, window]
+        guildTotal = sum((StatWindow.get_value(id_, metric.name, window) for id_ in lb),
+            metric.valType())
+
+        isTime = metric.valType is timedelta
+        format_ = format_act_dt if isTime else (lambda val: val)
+        valGetter = lambda m: format_(StatWindow.get_value(m.id, metric.name, window))
+        filter_ = lambda m: m.status != GuildMember.REMOVED
+        totalStr = format_act_dt(guildTotal) if isTime else f"{guildTotal:,}"
+
+        return make_entry_pages(await make_stat_entries(
+            valGetter, group=not isTime, filter_=filter_, lb=lb),
+            title=f"Last {window} {metric.title} Leader Board",
+            info=f"Guild total: {totalStr}", **self._updateInfo.get(metric.name, dict)())
+
+    async def send_lb(self, ctx: commands.Context, metric: Metric, field, snap=None, window=None):
+        if window:
+            if window not in WINDOWS:
+                await ctx.send(embed=make_alert(f"window has to be one of {', '.join(WINDOWS)}."))
+                return
+            if snap:
+                await ctx.send(embed=make_alert("rolling windows are not kept in snapshots."))
+                return
+            pages = await self.make_window_pages(metric, window)
+        elif snap:
+            pages = await self._snapshotManager.get_snapshot_cmd(ctx, snap,
+                lambda s: self.make_lb_pages(metric, field, s),
+                *metric.legacyPaths.get(field, ()))
+            if not pages:
+                return
+        else:
+            pages = await self.make_lb_pages(metric, field)
+
+        rMsg = RMessage(await ctx.send(pages[0]))
+        await rMsg.add_pages(pages)
+
+    @parser("lb", ["metric", Metric.get_names()], ["total"], "-snap", "--window")
+    async def display_lb(self, ctx: commands.Context, metric, total, snap, window):
+        metric = Metric.get(metric)
+        # the first leader board of a metric is its default one
+        field = "total" if total else next(iter(metric.lbs))
+        if field not in metric.lbs:
+            await ctx.send(embed=make_alert(f"{metric.name} has no {field} leader board."))
+            return
+        await self.send_lb(ctx, metric, field, snap, window)
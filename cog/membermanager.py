@@ -1,12 +1,11 @@
 from typing import Dict, List, Callable, Set
-from asyncio import sleep
 
 from discord import Member, Embed, User
-from discord.ext import tasks, commands
+from discord.ext import commands
 
 from logger import Logger
 from event import Event
-from wynnapi import WynnAPI
+from wynnapi import WynnAPI, GuildStatsDelta
 from msgmaker import *
 from reactablemessage import RMessage
 from util.cmdutil import parser
@@ -14,12 +13,11 @@ from util.discordutil import Discord
 from state.config import Config
 from state.guildmember import GuildMember
 from state.statistic import Statistic
-from cog.snapshotmanager import SnapshotManager
+from cog.snapshotmanager import SnapshotManager, Snapshot, LB_NAMES, LB_PART, SECTION_PART
 
 
-IG_MEMBERS_UPDATE_INTERVAL = 3
-
 IG_RANKS = ["Recruit", "Recruiter", "Captain", "Chief", "Owner"]
+MAX_TREND = 26  # in bi-weeks
 
 
 class MemberManager(commands.Cog):
@@ -27,69 +25,62 @@ class MemberManager(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.hasInitMembersUpdate = False
 
-        self._guildStatsReceiver = WynnAPI.guildStats.create_receiver()
         self._igMembers: Set[str] = set()
         self._snapshotManager: SnapshotManager = bot.get_cog("SnapshotManager")
 
         self._snapshotManager.add("MemberManager", self)
 
         self.bot = bot
-        self._ig_members_update.start()
+        self._updateTask = bot.loop.create_task(self._ig_members_update())
 
     async def __snap__(self):
-        with GuildMember.members:
-            statsSnaps = {m.ign: self.make_stats_msg(m) async for m in 
-                GuildMember.members.avalues()}
-        return {
-            "stats": statsSnaps,
-            "members": await self.make_members_pages(False),
-            "members.idle": await self.make_members_pages(True),
-            "members.missing": await self.make_members_missing_msg()
-        }
+        return {"igMembers": sorted(self._igMembers)}
     
-    @tasks.loop(seconds=IG_MEMBERS_UPDATE_INTERVAL)
     async def _ig_members_update(self):
-        guildStats = self._guildStatsReceiver.getData()
-        if not guildStats:
-            return
-        
+        await self.bot.wait_until_ready()
+        Logger.bot.debug("Starting in-game members update loop")
+
+        async for delta in WynnAPI.guildStats.subscribe():
+            try:
+                await self._on_guild_stats(delta)
+            except Exception as e:
+                Logger.bot.error(f"failed to update in-game members with {delta}: {e!r}")
+
+    async def _on_guild_stats(self, delta: GuildStatsDelta):
         if not self.hasInitMembersUpdate:
-            self._igMembers = {m["name"] for m in guildStats["members"]}
+            self._igMembers = set(delta.members)
             await self._bulk_update_members()
             self.hasInitMembersUpdate = True
+            return
 
+        if delta.isInitial:
+            # the list after an outage is compared to the last one seen before it
+            joined = delta.members.keys() - self._igMembers
+            left = self._igMembers - delta.members.keys()
         else:
-            prevIgMembers = self._igMembers
-            currIgMembers = set()
-
-            for memberData in guildStats["members"]:
-                ign = memberData["name"]
-                currIgMembers.add(ign)
-
-                if ign not in prevIgMembers:
-                    text = ign + " has joined the guild"
-                    await Discord.send(Config.channel_memberLog, text)
-
-                member: GuildMember = GuildMember.get_member_named(ign)
-                if member and member.status == GuildMember.IDLE:
-                    await GuildMember.set_status(member.id, GuildMember.ACTIVE)
-                
-            missingIgns = prevIgMembers.difference(currIgMembers)
-            self._igMembers = currIgMembers
-            
-            for ign in missingIgns:
-
-                text = ign + " has left the guild"
-                await Discord.send(Config.channel_memberLog, text)
-
-                if GuildMember.is_ign_active(ign):
-                    member = GuildMember.get_member_named(ign)
-                    await GuildMember.set_status(member.id, GuildMember.IDLE)
-    
-    @_ig_members_update.before_loop
-    async def _before_ig_members_update(self):
-        await self.bot.wait_until_ready()
-        Logger.bot.debug("Starting in-game members update loop")
+            joined, left = delta.joined, delta.left
+        await self._on_members_change(joined, left)
+
+    async def _on_members_change(self, joined, left):
+        for ign in joined:
+            self._igMembers.add(ign)
+
+            text = ign + " has joined the guild"
+            await Discord.send(Config.channel_memberLog, text)
+
+            member: GuildMember = GuildMember.get_member_named(ign)
+            if member and member.status == GuildMember.IDLE:
+                await GuildMember.set_status(member.id, GuildMember.ACTIVE)
+
+        for ign in left:
+            self._igMembers.discard(ign)
+
+            text = ign + " has left the guild"
+            await Discord.send(Config.channel_memberLog, text)
+
+            if GuildMember.is_ign_active(ign):
+                member = GuildMember.get_member_named(ign)
+                await GuildMember.set_status(member.id, GuildMember.IDLE)
 
     @commands.Cog.listener()
     async def on_member_update(self, before: Member, after: Member):
@@ -105,7 +96,7 @@ class MemberManager(commands.Cog):
             ignAfter = after.nick.split(" ")[-1]
             id_ = GuildMember.ignIdMap[ignBefore]
             if ignBefore != ignAfter:
-                if not await GuildMember.ign_check(id_):
+                if not await GuildMember.ign_check(id_, ignAfter):
                     await GuildMember.remove(id_)
                     await GuildMember.add(after, isGMemberAfter)
             else:
@@ -121,6 +112,10 @@ class MemberManager(commands.Cog):
             filter(Discord.get_rank, Discord.guild.members)))
         prevDiscordIds = set(GuildMember.discordIdMap.keys())
 
+        # resolve every ign up front so the lookups below are served from the cache.
+        await WynnAPI.get_player_ids({Discord.guild.get_member(id_).nick.split(" ")[-1] 
+            for id_ in currDiscordIds})
+
         joined = currDiscordIds.difference(prevDiscordIds)
         for id_ in joined:
             dMember = Discord.guild.get_member(id_)
@@ -142,7 +137,7 @@ class MemberManager(commands.Cog):
             ign = dMember.nick.split(" ")[-1]
 
             if gMember.ign != ign:
-                if not await GuildMember.ign_check(gMember.id):
+                if not await GuildMember.ign_check(gMember.id, ign):
                     await GuildMember.remove(gMember.id)
                     await GuildMember.add(dMember, Discord.get_rank(dMember))
             else:
@@ -153,8 +148,15 @@ class MemberManager(commands.Cog):
             else:
                 await GuildMember.set_status(gMember.id, GuildMember.IDLE)
     
-    def make_stats_msg(self, member: GuildMember):        
-        stat: Statistic = Statistic.stats[member.id]
+    def make_stats_msg(self, member: GuildMember, snap: Snapshot = None):
+        if snap:
+            stat = snap.stats[member.id]
+            lbs = snap.lbs
+            title = member.title
+        else:
+            stat: Statistic = Statistic.stats[member.id]
+            lbs = {name: getattr(Statistic, name) for name in LB_NAMES}
+            title = make_member_title(member)
 
         statNames = ("xp", "emerald", "war")
         biWeekStats = {name: f"{getattr(stat, name)['biweek']:,}" for name in statNames}
@@ -163,35 +165,81 @@ class MemberManager(commands.Cog):
         maxStatLen = max(
             max(map(len, biWeekStats.values())), 
             max(map(len, totalStats.values())), 11)
-        fmt = f"%-8s  %-{maxStatLen}s #%d\n"
+        fmt = f"%-8s  %-{maxStatLen}s #%-{len(str(len(lbs['xpLb'])))}d%s\n"
+        # how much of the guild is at or above the member, only for the live stats
+        top = lambda name, field: "" if snap else \
+            "  top %d%%" % max(round(100 - Statistic.percentile(stat.id, name, field)), 1)
 
         text = "--Bi-Weekly--\n"
         for name, val in biWeekStats.items():
-            rank = getattr(Statistic, name + "Lb").index(stat.id) + 1
-            text += fmt % (name, val, rank)
+            rank = lbs[name + "Lb"].index(stat.id) + 1
+            text += fmt % (name, val, rank, top(name, "biweek"))
 
         text += fmt % (
             "activity", format_act_dt(stat.onlineTime["biweek"]), 
-            Statistic.onlineTimeBwLb.index(stat.id) + 1) 
+            lbs["onlineTimeBwLb"].index(stat.id) + 1, top("onlineTime", "biweek")) 
         
         text += "--Total--\n"
         for name, val in totalStats.items():
-            rank = getattr(Statistic, name + "TotalLb").index(stat.id) + 1
-            text += fmt % (name, val, rank)
+            rank = lbs[name + "TotalLb"].index(stat.id) + 1
+            text += fmt % (name, val, rank, top(name, "total"))
 
-        return decorate_text(text, title=make_member_title(member))
+        return decorate_text(text, title=title)
 
-    @parser("stats", "ign", "-snap")
-    async def display_stats(self, ctx: commands.Context, ign, snap):
-        if snap:
-            statsSnap = await self._snapshotManager.get_snapshot_cmd(ctx, snap,
-                "MemberManager", "stats")
-            if not statsSnap:
+    async def make_trend_msg(self, ctx: commands.Context, ign, count):
+        snapshots = await self._snapshotManager.get_member_indexes(ctx, count)
+        if not snapshots:
+            return
+        member = GuildMember.get_member_named(ign)
+        if member:
+            id_ = member.id
+        else:
+            id_ = next((row.id for snap in reversed(snapshots) 
+                for row in snap.memberIndex.values() if row.ign == ign), None)
+        if not id_:
+            await ctx.send(embed=make_alert(f"{ign} is/was not in the guild."))
+            return
+
+        rows = []
+        for snap in snapshots:
+            row = snap.memberIndex.get(id_)
+            if row and row.stat:
+                lower, upper = snap.entry["range"]
+                rows.append((f"{lower:%m/%d}-{upper:%m/%d}", row.stat, row.ranks["xpLb"]))
+        if member:
+            rows.append(("current", Statistic.stats[id_], Statistic.xpLb.index(id_) + 1))
+
+        text = "%-11s  %13s  %11s  %5s  %11s  %s\n" % (
+            "bi-week", "xp", "emerald", "war", "activity", "xp rank")
+        prevRank = 0
+        for label, stat, rank in rows:
+            text += "%-11s  %13s  %11s  %5s  %11s  #%-3d %s\n" % (
+                label, f"{stat.xp['biweek']:,}", f"{stat.emerald['biweek']:,}", 
+                f"{stat.war['biweek']:,}", format_act_dt(stat.onlineTime["biweek"]), 
+                rank, format_rank_move(prevRank, rank) if prevRank else "")
+            prevRank = rank
+        return decorate_text(text, title=f"{ign}'s Bi-Weekly Trend")
+
+    @parser("stats", "ign", "-snap", "--trend")
+    async def display_stats(self, ctx: commands.Context, ign, snap, trend):
+        if trend:
+            if not trend.isnumeric() or not 0 < int(trend) <= MAX_TREND:
+                await ctx.send(embed=make_alert(f"trend has to be between 1 and {MAX_TREND}."))
                 return
-            if ign not in statsSnap:
-                await ctx.send(embed=make_alert(f"{ign} is/was not in the guild."))
+            text = await self.make_trend_msg(ctx, ign, int(trend))
+            if not text:
                 return
-            text = statsSnap[ign]
+        elif snap:
+            text = await self._snapshotManager.get_snapshot_cmd(ctx, snap,
+                lambda s: self._make_snap_stats_msg(ctx, ign, s), "MemberManager", "stats")
+            if not text:
+                return
+            if isinstance(text, dict):
+                # legacy snapshots hold the rendered stats of every member by ign
+                if ign not in text:
+                    await ctx.send(embed=make_alert(f"{ign} is/was not in the guild."))
+                    return
+                text = text[ign]
         else:
             if ign not in GuildMember.ignIdMap:
                 await ctx.send(embed=make_alert(f"{ign} is/was not in the guild."))
@@ -200,19 +248,62 @@ class MemberManager(commands.Cog):
         
         await ctx.send(text)
     
-    async def make_members_pages(self, idle):
+    async def _make_snap_stats_msg(self, ctx: commands.Context, ign, snap: Snapshot):
+        await snap.load("members", "stats", *(LB_PART + name for name in LB_NAMES))
+        member = snap.get_member_named(ign)
+        if not member:
+            await ctx.send(embed=make_alert(f"{ign} is/was not in the guild."))
+            return False
+        return self.make_stats_msg(member, snap)
+    
+    async def make_members_pages(self, idle, snap: Snapshot = None):
         title = ("Idle " if idle else "") + "Guild Members"
-        valGetter = lambda m: Discord.guild.get_member(
-            GuildMember.members[m.ownerId].discordId if m.ownerId else m.discordId)
+        if snap:
+            await snap.load("members")
+            valGetter = lambda m: (snap.members[m.ownerId] if m.ownerId else m).discordName
+        else:
+            valGetter = lambda m: Discord.guild.get_member(
+                GuildMember.members[m.ownerId].discordId if m.ownerId else m.discordId)
         filter_ = lambda m: m.status == (GuildMember.IDLE if idle else GuildMember.ACTIVE)
         
         return make_entry_pages(await make_stat_entries(
-            valGetter, group=False, filter_=filter_), title=title)
+            valGetter, group=False, filter_=filter_, members=snap.members if snap else None), 
+            title=title)
 
-    @parser("members", ["idle"], "-snap", isGroup=True)
-    async def display_members(self, ctx: commands.Context, idle, snap):
-        if snap:
+    async def make_members_diff_pages(self, ctx: commands.Context, index):
+        snap = await self._snapshotManager.get_member_index(ctx, index)
+        if not snap:
+            return
+        rows = snap.memberIndex
+        currMembers = {m.id: m for m in GuildMember.members.values() 
+            if m.status != GuildMember.REMOVED}
+        prevMembers = {id_: row for id_, row in rows.items() if row.status != GuildMember.REMOVED}
+
+        joined = [m.ign for id_, m in currMembers.items() if id_ not in prevMembers]
+        left = [row.ign for id_, row in prevMembers.items() if id_ not in currMembers]
+        changed = []
+        for id_, m in currMembers.items():
+            prev = prevMembers.get(id_)
+            if prev and prev.ign != m.ign:
+                changed.append(f"~ {prev.ign} -> {m.ign}")
+            if prev and prev.status != m.status:
+                changed.append(f"~ {m.ign} is now " + 
+                    ("idle" if m.status == GuildMember.IDLE else "active"))
+
+        entries = [f"+ {ign}" for ign in joined] + [f"- {ign}" for ign in left] + changed
+        info = f"{len(joined)} joined, {len(left)} left since {snap.id}"
+        return make_entry_pages(entries or ["no changes"], title="Guild Member Changes", 
+            info=info)
+
+    @parser("members", ["idle"], "-snap", "--diff", isGroup=True)
+    async def display_members(self, ctx: commands.Context, idle, snap, diff):
+        if diff:
+            pages = await self.make_members_diff_pages(ctx, diff)
+            if not pages:
+                return
+        elif snap:
             pages = await self._snapshotManager.get_snapshot_cmd(ctx, snap,
+                lambda s: self.make_members_pages(idle, s), 
                 "MemberManager", "members" + (".idle" if idle else ""))
             if not pages:
                 return
@@ -222,7 +313,17 @@ class MemberManager(commands.Cog):
         rMsg = RMessage(await ctx.send(pages[0]))
         await rMsg.add_pages(pages)
     
-    async def make_members_missing_msg(self):
+    async def make_members_missing_msg(self, snap: Snapshot = None):
+        if snap:
+            await snap.load("members", SECTION_PART + "MemberManager")
+            section = snap.sections.get("MemberManager")
+            if not section:
+                return None
+            igns = set(section["igMembers"])
+            igns.difference_update(m.ign for m in snap.members.values() 
+                if m.status == GuildMember.ACTIVE)
+            return ", ".join(igns)
+
         igns = self._igMembers.copy()
         filter_ = lambda m: m.status == GuildMember.ACTIVE
         mapper = lambda m: igns.remove(m.ign)
@@ -237,7 +338,7 @@ class MemberManager(commands.Cog):
             return
         if snap:
             text = await self._snapshotManager.get_snapshot_cmd(ctx, snap,
-                "MemberManager", "members.missing")
+                self.make_members_missing_msg, "MemberManager", "members.missing")
             if not text:
                 return
         else:
@@ -248,9 +349,14 @@ class MemberManager(commands.Cog):
     async def fix_members(self, ctx):
         if not await Discord.user_check(ctx, *Config.user_dev):
             return
-        for member in self.members.avalues():
-            member.mcId = await WynnAPI.get_player_id(member.ign)
-            await sleep(0.2)
+        ids = await WynnAPI.get_player_ids([m.ign for m in GuildMember.members.values()])
+        # an ign that now belongs to another player is stale, the member's id is its uuid
+        for member in list(GuildMember.members.values()):
+            id_ = ids[member.ign]
+            if id_ and member.id != id_:
+                Logger.bot.info(f"{member.ign} now belongs to {id_}, checking ign of {member.id}")
+                await GuildMember.ign_check(member.id)
+        await ctx.message.add_reaction("✅")
     
     @parser("alt", isGroup=True)
     async def display_alt(self, ctx):
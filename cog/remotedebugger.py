@@ -1,11 +1,13 @@
 import os
 import gzip
+import pickle
 import zipfile
 from pprint import pformat
 from io import StringIO, BytesIO
 from typing import List
 
 from discord import File, Message
+from discord.utils import find
 from discord.ext import commands
 
 from logger import DEBUG_FILE, ARCHIVE_FOLDER, LOG_FILE, Logger
@@ -13,7 +15,9 @@ from msgmaker import *
 from reactablemessage import RMessage
 from util.cmdutil import parser
 from util.pickleutil import PickleUtil
+from util.aioutil import AIOUtil, MAX_IO_WORKERS
 from util.discordutil import Discord
+from state.state import State
 from state.config import Config
 
 
@@ -40,34 +44,82 @@ class RemoteDebugger(commands.Cog):
         await rMsg.add_list_selection(archives, self.send_archive_cb, ctx.channel)
     
     async def send_archive_cb(self, fileName, channel):
-        with gzip.open(os.path.join(ARCHIVE_FOLDER, fileName), "r") as f:
-            await channel.send(file=File(f, filename=fileName[:-3]))
+        raw = await AIOUtil.run("log.read", self._read_archive, 
+            os.path.join(ARCHIVE_FOLDER, fileName))
+        await channel.send(file=File(BytesIO(raw), filename=fileName[:-3]))
+    
+    @staticmethod
+    def _read_archive(path):
+        with gzip.open(path, "r") as f:
+            return f.read()
 
-    @parser("debug data", "dataName", parent=debug_root)
-    async def get_data(self, ctx: commands.Context, dataName):
-        fileName = f"./data/{dataName}.data"
-        data = PickleUtil.load(fileName)
+    @parser("debug data", "dataName", "-key", parent=debug_root)
+    async def get_data(self, ctx: commands.Context, dataName, key):
+        targetCls = find(lambda c: c.__name__ == dataName, State.rowAttributes.keys())
+        if targetCls and State.is_stored(targetCls):
+            f = await AIOUtil.run("store.query", self._query_rows, targetCls, key)
+        else:
+            f = await AIOUtil.run("state.load", self._load_data, dataName)
 
-        if not data:
+        if not f:
             alert = make_alert("Data doesn't exist")
             await ctx.send(embed=alert)
             return
         
-        f = StringIO(pformat(data))
         await ctx.send(file=File(f, filename=f"{dataName}.data.txt"))
     
+    def _load_data(self, dataName):
+        data = State.store.load_blob(dataName) if State.store else None
+        if data is None:
+            data = PickleUtil.load(f"./data/{dataName}.data")
+        return StringIO(pformat(data)) if data else None
+    
+    def _query_rows(self, targetCls, key):
+        f = StringIO()
+        for attr in State.rowAttributes[targetCls]:
+            table = State.store.make_table_name(targetCls, attr)
+            if key:
+                row = State.store.get_row(table, key)
+                if row is not None:
+                    f.write(f"{attr}[{key!r}] = {pformat(row)}\n")
+                continue
+            for id_, data in State.store.get_rows(table):
+                f.write(f"{attr}[{id_!r}] = {pformat(pickle.loads(data))}\n")
+        f.seek(0)
+        return f if f.getvalue() else None
+    
     @parser("debug rawdata", parent=debug_root)
     async def get_raw_data(self, ctx: commands.Context):
+        f = await AIOUtil.run("data.zip", self._make_raw_data_zip)
+        await ctx.send(file=File(f, filename=f"raw_data.zip"))
+    
+    def _make_raw_data_zip(self):
         f = BytesIO()
         zFile = zipfile.ZipFile(f, "w", zipfile.ZIP_DEFLATED)
 
         for fileName in os.listdir("./data/"):
             if fileName.endswith(".data"):
                 zFile.write("./data/" + fileName, fileName)
+        if State.store:
+            backupFile = State.store.backup()
+            zFile.write(backupFile, os.path.basename(State.store.path))
+            os.remove(backupFile)
         
         zFile.close()
         f.seek(0)
-        await ctx.send(file=File(f, filename=f"raw_data.zip"))
+        return f
+    
+    @parser("debug io", parent=debug_root)
+    async def display_io_stats(self, ctx: commands.Context):
+        text = "%-18s  %6s  %6s  %7s  %7s  %7s\n" % ("op", "count", "failed", 
+            "p50", "p90", "max")
+        for op, stats in sorted(AIOUtil.stats.items()):
+            text += "%-18s  %6d  %6d  %5.1fms  %5.1fms  %5.1fms\n" % (op, stats.count, 
+                stats.failures, stats.percentile(50) * 1000, stats.percentile(90) * 1000,
+                stats.maxLatency * 1000)
+        text += "\n%d workers, %d operations in flight\n" % (
+            MAX_IO_WORKERS, AIOUtil.pending)
+        await ctx.send(decorate_text(text, title="Disk I/O"))
         
     def _search_archives(self):
         files = filter(lambda f: f.endswith(".log.gz"), os.listdir(ARCHIVE_FOLDER))
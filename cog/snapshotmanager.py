@@ -1,7 +1,7 @@
 from datetime import timedelta, datetime
 from io import StringIO
 from pprint import pformat
-from os import listdir
+from asyncio import gather
 
 from discord import File
 from discord.ext import commands
@@ -10,38 +10,260 @@ from logger import Logger
 from msgmaker import *
 from reactablemessage import RMessage
 from util.cmdutil import parser
-from util.pickleutil import PickleUtil, pickle
+from util.aioutil import AIOUtil
+from util.lrucache import LRUCache
+from util.memutil import deep_sizeof
 from util.timeutil import now, get_bw_range
 from util.discordutil import Discord
 from state.config import Config
+from state.metric import Metric
+from state.snapshotstore import SnapshotStore, encode_snapshot
+
+
+SNAPSHOT_VERSION = 2
+SNAPSHOT_CACHE_BYTES = 32 * 1024 * 1024
+SNAPSHOT_CACHE_TTL = 6 * 3600  # in seconds
+
+# layout of the per-member stat tuples, timedeltas are stored in seconds. Metrics added
+# later are appended, so older tuples and rank rows are a prefix of these.
+STAT_FIELDS = tuple((metric.name, field) for metric in Metric.registry.values() 
+    for field in metric.snapFields)
+LB_NAMES = tuple(metric.lbs[field] for metric in Metric.registry.values() 
+    for field in metric.snapFields)
+
+# names of the separately stored parts of a snapshot
+LEGACY_PART = "legacy"
+MEMBER_INDEX_PART = "memberIndex"
+LB_PART = "lb."
+SECTION_PART = "section."
+
+
+def split_snapshot_data(data):
+    if not isinstance(data, dict) or data.get("version", 1) < 2:
+        # version 1 snapshots hold the pre-rendered output of every command
+        try:
+            memberCount = len(data["MemberManager"]["stats"])
+        except Exception:
+            memberCount = 0
+        return {LEGACY_PART: data}, {"version": 1, "time": None, "members": memberCount}
+
+    parts = {"members": data["members"], "stats": data["stats"]}
+    for name, lb in data["lbs"].items():
+        parts[LB_PART + name] = lb
+    for id_, section in data["sections"].items():
+        parts[SECTION_PART + id_] = section
+    parts[MEMBER_INDEX_PART] = make_member_index(data)
+    info = {"version": data["version"], "time": data["time"], "members": len(data["members"])}
+    return parts, info
+
+
+def make_member_index(data):
+    # one row per member with everything cross-snapshot queries need, so they can
+    # read this part alone instead of the members, stats and every leader board.
+    ranks = {name: {id_: rank for rank, id_ in enumerate(lb, 1)}
+        for name, lb in data["lbs"].items()}
+    index = {}
+    for id_, (ign, status, *_) in data["members"].items():
+        index[id_] = (ign, status, data["stats"].get(id_),
+            tuple(ranks[name].get(id_, 0) if name in ranks else 0 for name in LB_NAMES))
+    return index
+
+
+def decode_part(name, raw):
+    if name == MEMBER_INDEX_PART:
+        return {id_: IndexRow(id_, *row) for id_, row in raw.items()}
+    if name == "members":
+        return {id_: SnapMember(id_, *fields) for id_, fields in raw.items()}
+    if name == "stats":
+        return {id_: SnapStat(id_, values) for id_, values in raw.items()}
+    return raw
+
+
+class SnapRow:
+
+    def __repr__(self):
+        s = f"<{type(self).__name__}"
+        for attr, val in vars(self).items():
+            s += f" {attr}={val!r}"
+        return s + ">"
+
+
+class SnapMember(SnapRow):
+
+    def __init__(self, id_, ign, status, ownerId, title, discordName):
+        self.id = id_
+        self.ign = ign
+        self.status = status
+        self.ownerId = ownerId
+        self.title = title
+        self.discordName = discordName
+
+
+class SnapStat(SnapRow):
+
+    def __init__(self, id_, values):
+        self.id = id_
+        for (name, field), val in zip(STAT_FIELDS, values):
+            if Metric.registry[name].valType is timedelta:
+                val = timedelta(seconds=val)
+            if not hasattr(self, name):
+                setattr(self, name, {})
+            getattr(self, name)[field] = val
+
+
+class IndexRow(SnapRow):
+
+    def __init__(self, id_, ign, status, values, ranks):
+        self.id = id_
+        self.ign = ign
+        self.status = status
+        self.stat = SnapStat(id_, values) if values else None
+        self.ranks = dict(zip(LB_NAMES, ranks))
+
+
+class Snapshot:
+
+    def __init__(self, entry, loader):
+        self.id = entry["id"]
+        self.entry = entry
+        self.version = entry["version"]
+        self.time = entry["time"]
+
+        self._loader = loader
+        self._parts = {}
+
+    async def load(self, *names):
+        # only the parts a command renders from are read and decompressed
+        missing = [n for n in names if n not in self._parts and n in self.entry["parts"]]
+        parts = await gather(*(self._loader(self.entry, name) for name in missing))
+        self._parts.update(zip(missing, parts))
+        return self
+
+    async def load_all(self):
+        return await self.load(*self.entry["parts"])
+
+    @property
+    def isLegacy(self):
+        return self.version < 2
+
+    @property
+    def timeStr(self):
+        return self.time.strftime("%b %d, %H:%M:%S (UTC)")
+
+    @property
+    def data(self):
+        if self.isLegacy:
+            return self._parts.get(LEGACY_PART)
+        return self._parts
+
+    @property
+    def memberIndex(self):
+        return self._parts[MEMBER_INDEX_PART]
+
+    @property
+    def members(self):
+        return self._parts["members"]
+
+    @property
+    def stats(self):
+        return self._parts["stats"]
+
+    @property
+    def lbs(self):
+        return {name[len(LB_PART):]: lb for name, lb in self._parts.items()
+            if name.startswith(LB_PART)}
+
+    @property
+    def sections(self):
+        return {name[len(SECTION_PART):]: section for name, section in self._parts.items()
+            if name.startswith(SECTION_PART)}
+
+    def get_member_named(self, ign):
+        for member in self.members.values():
+            if member.ign == ign:
+                return member
+        return None
+
 
 class SnapshotManager(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
         self._objects = {}
-        self._snapCache = {}
+        self._snapCache = LRUCache(SNAPSHOT_CACHE_BYTES, SNAPSHOT_CACHE_TTL)
+
+    async def load(self):
+        index, rebuilt = await AIOUtil.run("snapshot.index", SnapshotStore.load_index)
+        SnapshotStore.set_index(index)
+        if rebuilt:
+            Logger.bot.warning(f"Snapshot index rebuilt with {len(index)} snapshots")
+
+        migrated = await AIOUtil.run("snapshot.migrate", SnapshotStore.migrate_legacy,
+            split_snapshot_data)
+        for entry in migrated:
+            SnapshotStore.add(entry)
+        if migrated:
+            Logger.bot.info(f"Migrated {len(migrated)} snapshots to compressed parts")
+
+        if rebuilt or migrated:
+            await self._write_index()
+        await self.compact_snapshots()
+        return self
 
     def add(self, id_, obj):
         self._objects[id_] = obj
     
-    def make_snapshot_path(self, snapId):
-        return f"./snapshot/{snapId}.snapshot"
-    
     def make_snapshot_id(self, date):
         lower, upper = get_bw_range(date)
         return lower.strftime("%Y.%m.%d-") + upper.strftime("%Y.%m.%d")
     
+    async def _write_index(self):
+        await AIOUtil.run("snapshot.index", SnapshotStore.write_index,
+            SnapshotStore.dump_index())
+
     async def save_snapshot(self, offset=True):
         snapId = self.make_snapshot_id(now().date() - timedelta(days=offset))
         Logger.bot.info(f"Saving snapshot with id {snapId}")
-        snapshot = await self.make_snapshot()
-        self._snapCache[snapId] = snapshot
-        PickleUtil.save(self.make_snapshot_path(snapId), snapshot)
+        parts, info = split_snapshot_data(await self.make_snapshot())
+        raw, toc = await AIOUtil.run("snapshot.encode", encode_snapshot, snapId, parts, info)
+        entry = await AIOUtil.run("snapshot.save", SnapshotStore.write, snapId, raw, toc)
+
+        for name in toc["parts"]:
+            self._snapCache.pop((snapId, name))
+        SnapshotStore.add(entry)
+        await self._write_index()
+        await self.compact_snapshots()
         return snapId
     
     async def make_snapshot(self):
-        return {id_: await obj.__snap__() for id_, obj in self._objects.items()}
+        members = {}
+        for member in GuildMember.members.values():
+            dMember = Discord.guild.get_member(member.discordId) if member.discordId else None
+            members[member.id] = (member.ign, member.status, member.ownerId, 
+                make_member_title(member), str(dMember) if dMember else None)
+
+        stats = Statistic.value_rows(STAT_FIELDS)
+
+        return {
+            "version": SNAPSHOT_VERSION,
+            "time": now(),
+            "members": members,
+            "stats": stats,
+            "lbs": {name: list(getattr(Statistic, name)) for name in LB_NAMES},
+            "sections": {id_: await obj.__snap__() for id_, obj in self._objects.items()}
+        }
     
+    async def compact_snapshots(self):
+        # bi-weeks of past years are moved into one archive file per year
+        entries = SnapshotStore.get_compactable(now().year)
+        if not entries:
+            return
+        moved = await AIOUtil.run("snapshot.compact", SnapshotStore.compact, entries)
+        for entry in moved:
+            SnapshotStore.add(entry)
+        await self._write_index()
+        await AIOUtil.run("snapshot.compact", SnapshotStore.remove_files, entries)
+        Logger.bot.info(f"Compacted {len(moved)} snapshots into yearly archives")
+
     async def parse_index(self, ctx, index: str):
         if index.isnumeric():
             index = int(index)
@@ -61,52 +283,100 @@ class SnapshotManager(commands.Cog):
         return snapId
 
     async def get_snapshot(self, ctx: commands.Context, snapId: str):
-        if snapId in self._snapCache:
-            return self._snapCache[snapId]
-
-        try:
-            with open(self.make_snapshot_path(snapId), "rb") as f:
-                snapshot = pickle.load(f)
-        except FileNotFoundError:
+        entry = SnapshotStore.index.get(snapId)
+        if not entry:
             alert = make_alert(f"Snapshot with id {snapId} doesn't exist")
             await ctx.send(embed=alert)
             return
+        return Snapshot(entry, self._get_part)
+    
+    async def _get_part(self, entry, name):
+        key = (entry["id"], name)
+        return await self._snapCache.get_or_load(key, lambda: self._load_part(entry, name))
 
-        self._snapCache[snapId] = snapshot
-        return snapshot
+    async def _load_part(self, entry, name):
+        return await AIOUtil.run("snapshot.load", self._read_part, entry, name)
     
-    async def get_snapshot_cmd(self, ctx, index, *paths):
+    @staticmethod
+    def _read_part(entry, name):
+        part = decode_part(name, SnapshotStore.read_part(entry, name))
+        return part, deep_sizeof(part)
+    
+    async def get_member_index(self, ctx: commands.Context, index):
         snapId = await self.parse_index(ctx, index)
         if not snapId:
             return
         snapshot = await self.get_snapshot(ctx, snapId)
         if not snapshot:
             return
+        if MEMBER_INDEX_PART not in snapshot.entry["parts"]:
+            await ctx.send(embed=make_alert(f"Snapshot {snapId} is too old to be compared"))
+            return
+        return await snapshot.load(MEMBER_INDEX_PART)
 
-        result = snapshot
-        for path in paths:
-            try:
-                result = result[path]
-            except Exception:
-                await ctx.send("`The requested command was not saved in the given snapshot.`")
-                return
+    async def get_member_indexes(self, ctx: commands.Context, count):
+        # member indexes of the last count bi-weeks, oldest first, skipping missing snapshots
+        snapshots = []
+        for index in range(count, 0, -1):
+            snapId = self.make_snapshot_id(now().date() - timedelta(days=14 * index))
+            entry = SnapshotStore.index.get(snapId)
+            if entry and MEMBER_INDEX_PART in entry["parts"]:
+                snapshots.append(Snapshot(entry, self._get_part))
+        if not snapshots:
+            await ctx.send(embed=make_alert(
+                f"There are no snapshots with member index in the last {count} bi-weeks"))
+            return
+        await gather(*(s.load(MEMBER_INDEX_PART) for s in snapshots))
+        return snapshots
+
+    async def get_snapshot_cmd(self, ctx, index, render, *legacyPaths):
+        snapId = await self.parse_index(ctx, index)
+        if not snapId:
+            return
+        snapshot = await self.get_snapshot(ctx, snapId)
+        if not snapshot:
+            return
+
+        if snapshot.isLegacy and not legacyPaths:
+            result = None
+        elif snapshot.isLegacy:
+            result = (await snapshot.load(LEGACY_PART)).data
+            for path in legacyPaths:
+                try:
+                    result = result[path]
+                except Exception:
+                    result = None
+                    break
+        else:
+            result = await render(snapshot)
+        if result is None:
+            await ctx.send("`The requested command was not saved in the given snapshot.`")
+            return
 
         await ctx.send(decorate_text(f" following result is from Snapshot {snapId}"))
         return result
     
-    async def make_lb_snapshot(self, lb, **decoArgs):
-        pagesBw = await lb.create_pages(False, False, **decoArgs)
-        pagesAcc = await lb.create_pages(True, False, **decoArgs)
-        pagesTotal = await lb.create_pages(False, True, **decoArgs)
-        return [[pagesBw, pagesTotal], [pagesAcc, pagesAcc]]
-    
     @parser("snap", isGroup=True)
     async def display_snapshots(self, ctx: commands.Context):
-        ids = [f[:-9] for f in listdir("./snapshot/") if f.endswith(".snapshot")]
-        pages = make_entry_pages(ids, title="Snapshots")
+        entries = [f"{e['id']}  {e['members']:>3} members  {e['size'] / 1024:6.1f}KB"
+            for e in SnapshotStore.index.values()]
+        pages = make_entry_pages(entries, title="Snapshots")
         rMsg = RMessage(await ctx.send(pages[0]))
         await rMsg.add_pages(pages)
 
+    @parser("snap cache", parent=display_snapshots)
+    async def display_snapshot_cache(self, ctx: commands.Context):
+        cache = self._snapCache
+        lookups = cache.hits + cache.misses + cache.sharedLoads
+        text = "cached %d  size %.1fKB / %.1fKB  ttl %s\n" % (
+            len(cache), cache.size / 1024, cache.maxBytes / 1024, 
+            f"{cache.ttl}s" if cache.ttl else "none")
+        text += "hits %d  misses %d  shared loads %d  hit rate %d%%\n" % (
+            cache.hits, cache.misses, cache.sharedLoads, 
+            cache.hits / lookups * 100 if lookups else 0)
+        text += "evictions %d  expirations %d\n" % (cache.evictions, cache.expirations)
+        await ctx.send(decorate_text(text, title="Snapshot Cache"))
+
     @parser("snap forcemake", parent=display_snapshots)
     async def force_make_snapshot(self, ctx: commands.Context):
         if not await Discord.user_check(ctx, *Config.user_dev):
@@ -125,4 +395,5 @@ class SnapshotManager(commands.Cog):
         snapshot = await self.get_snapshot(ctx, snapId)
         if not snapshot:
             return
-        await ctx.send(file=File(StringIO(pformat(snapshot)), filename=f"{snapId}.txt"))
\ No newline at end of file
+        data = (await snapshot.load_all()).data
+        await ctx.send(file=File(StringIO(pformat(data)), filename=f"{snapId}.txt"))
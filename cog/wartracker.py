@@ -1,77 +1,77 @@
 from typing import Set, Dict, List
 
-from discord.ext import commands, tasks
+from discord.ext import commands
 
 from logger import Logger
-from wynnapi import WynnAPI
+from wynnapi import WynnAPI, ServerListDelta
 from msgmaker import *
-from reactablemessage import RMessage
 from util.cmdutil import parser
 from util.discordutil import Discord
 from state.config import Config
 from state.guildmember import GuildMember
+from state.metric import Metric
 from state.statistic import Statistic
 from cog.datamanager import DataManager
 from cog.snapshotmanager import SnapshotManager
+from cog.leaderboards import Leaderboards
 
 
-WAR_SERVERS_UPDATE_INTERVAL = 3
-
 @DataManager.register("currentWar")
 class WarTracker(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.prevInitdWars = []
         self.currentWar = None
         self.hasInitUpdated = False
 
-        self._serverListReceiver = WynnAPI.serverList.create_receiver()
         self._snapshotManager: SnapshotManager = bot.get_cog("SnapshotManager")
+        self._leaderboards: Leaderboards = bot.get_cog("Leaderboards")
 
-        self._update.start()
+        self._updateTask = bot.loop.create_task(self._update())
         self._snapshotManager.add("WarTracker", self)
+        self._leaderboards.set_update_info("war", lambda: {"endpoint": WynnAPI.serverList})
     
     async def __snap__(self):
-        return (
-            await self.make_war_lb_pages(False),
-            await self.make_war_lb_pages(True)
-        )
+        # the leader boards are part of the shared snapshot data
+        return None
     
-    @tasks.loop(seconds=WAR_SERVERS_UPDATE_INTERVAL)
     async def _update(self):
-        serverList = self._serverListReceiver.getData()
-        if not serverList:
-            return
-        
+        await self.bot.wait_until_ready()
+        Logger.bot.debug("Starting war tracking loop")
+
+        async for delta in WynnAPI.serverList.subscribe():
+            try:
+                await self._on_server_list(delta)
+            except Exception as e:
+                Logger.bot.error(f"failed to track wars with {delta}: {e!r}")
+
+    async def _on_server_list(self, delta: ServerListDelta):
         if not self.hasInitUpdated and not self.currentWar:
-            await self._init_update(serverList)
+            await self._init_update(delta.worlds)
             self.hasInitUpdated = True
+            return
         
         if self.currentWar:
-            if self.currentWar not in serverList:
+            if self.currentWar not in delta.worlds:
                 Logger.war.info(f"War at {self.currentWar} ended")
                 self.currentWar = None
-                self.prevInitdWars = []
+                await self.bot.get_cog("ClaimTracker").check_alert()
             else:
                 await self.bot.get_cog("ClaimTracker").dismiss_alert()
-        else:
-            for war in self.prevInitdWars:
-                if war not in serverList:
-                    continue
-                players = serverList[war]
-                if not players:
-                    continue
-                targetPlayers = set(filter(GuildMember.is_ign_active, players))
-                if targetPlayers:
-                    Logger.war.info(f"{war} started with {targetPlayers}")
-                    for ign in targetPlayers:
-                        await Statistic.stats[GuildMember.ignIdMap[ign]].increment_war()
-                    self.currentWar = war
-                    break
-        
-            initWarCheck = lambda w: w.startswith("WAR") and not serverList[w]
-            self.prevInitdWars = filter(initWarCheck, serverList.keys())
+            return
+
+        for war, joined in delta.joined.items():
+            # a war starts when players enter a war server that was empty before.
+            if not war.startswith("WAR") or war in delta.created or \
+               len(joined) != len(delta.worlds[war]):
+                continue
+            targetPlayers = set(filter(GuildMember.is_ign_active, joined))
+            if targetPlayers:
+                Logger.war.info(f"{war} started with {targetPlayers}")
+                for ign in targetPlayers:
+                    await Statistic.stats[GuildMember.ignIdMap[ign]].increment_war()
+                self.currentWar = war
+                break
 
     async def _init_update(self, serverList: dict):
         for war, players in serverList.items():
@@ -84,40 +84,10 @@ class WarTracker(commands.Cog):
                     self.currentWar = war
                     return
     
-    @_update.before_loop
-    async def _before_update(self):
-        await self.bot.wait_until_ready()
-        Logger.bot.debug("Starting war tracking loop")
-    
-    async def make_war_lb_pages(self, total):
-        if total:
-            lb = Statistic.warTotalLb
-            field = "total"
-            titlePrefix = "Total "
-        else:
-            lb = Statistic.warLb
-            field = "biweek"
-            titlePrefix = "Bi-Weekly "
-
-        valGetter = lambda m: Statistic.stats[m.id].war[field]
-        filter_ = lambda m: m.status != GuildMember.REMOVED
-        
-        return make_entry_pages(await make_stat_entries(
-            valGetter, filter_=filter_, lb=lb),
-            title=titlePrefix + "War Leader Board", endpoint=WynnAPI.serverList)
-
-    @parser("wc", ["total"], "-snap", isGroup=True)
-    async def display_war_count_lb(self, ctx: commands.Context, total, snap):
-        if snap:
-            pages = await self._snapshotManager.get_snapshot_cmd(ctx, snap, 
-                "WarTracker", total)
-            if not pages:
-                return
-        else:
-            pages = await self.make_war_lb_pages(total)
-
-        rMsg = RMessage(await ctx.send(pages[0]))
-        await rMsg.add_pages(pages)
+    @parser("wc", ["total"], "-snap", "--window", isGroup=True)
+    async def display_war_count_lb(self, ctx: commands.Context, total, snap, window):
+        await self._leaderboards.send_lb(ctx, Metric.registry["war"], 
+            "total" if total else "biweek", snap, window)
     
     @parser("wc fix", parent=display_war_count_lb)
     async def fix_wc(self, ctx: commands.Context):
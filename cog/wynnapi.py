@@ -2,19 +2,23 @@ import aiohttp
 from typing import Union
 from datetime import timedelta, datetime
 from time import time
-import backoff
 
 from discord.ext import tasks, commands
 
 import wynnapi
 from logger import Logger
-from msgmaker import decorate_text
+from msgmaker import decorate_text, make_alert
+from state.config import Config
 from state.apistamp import APIStamp
+from requestscheduler import RequestScheduler
 from util.timeutil import now
 from util.cmdutil import parser
+from util.discordutil import Discord
+from util.memutil import deep_sizeof, get_rss
 
 
-UPDATE_INTERVAL = 10  # Number of seconds between each update() call.
+SCHEDULE_INTERVAL = 1  # Number of seconds between each schedule() call.
+MIN_ENDPOINT_INTERVAL = 1
 
 
 class WynnAPI(commands.Cog):
@@ -22,24 +26,55 @@ class WynnAPI(commands.Cog):
     def __init__(self, bot, session: aiohttp.ClientSession):
         wynnapi.WynnAPI.init(session)
         self.bot = bot
-        self._update.start()
+        self._schedule.start()
 
-    @tasks.loop(seconds=UPDATE_INTERVAL)
-    async def _update(self):
-        await wynnapi.WynnAPI.update()
+    @tasks.loop(seconds=SCHEDULE_INTERVAL)
+    async def _schedule(self):
+        wynnapi.WynnAPI.schedule()
     
-    @_update.before_loop
-    async def _before_update(self):
+    @_schedule.before_loop
+    async def _before_schedule(self):
         await self.bot.wait_until_ready()
-        Logger.bot.debug("Starting Wynncraft API update loop")
+        Logger.bot.debug("Starting Wynncraft API update scheduler")
     
-    @parser("api")
+    def _format_ago(self, time):
+        if not time:
+            return "never"
+        return "%ds ago" % (now() - time).total_seconds()
+
+    @parser("api", isGroup=True)
     async def display_api_status(self, ctx: commands.Context):
         text = ""
-        curr = now()
-        endpoints = ("guildStats", "serverList", "terrList")
-        for ep in endpoints:
-            params = getattr(wynnapi.WynnAPI, ep).params
-            updateTime = APIStamp.stamps[id(params)][1]
-            text += "%-13s  %2ds\n" % (params["action"], (curr - updateTime).total_seconds())
-        await ctx.send(decorate_text(text, title="API Update Status"))
\ No newline at end of file
+        for name, ep in wynnapi.WynnAPI.endpoints.items():
+            telemetry = ep.telemetry
+            updateTime = APIStamp.stamps.get(name, (None, None))[1]
+
+            text += "%-13s  every %ds  circuit %s\n" % (name, ep.interval, ep.breaker.state)
+            text += "  updated %s  changed %s  unchanged %d/%d\n" % (
+                self._format_ago(updateTime), self._format_ago(telemetry.lastChanged),
+                ep.fingerprintHits, ep.fingerprintHits + ep.fingerprintMisses)
+            text += "  latency p50 %dms  p90 %dms  p99 %dms\n" % tuple(
+                telemetry.latency_percentile(p) * 1000 for p in (50, 90, 99))
+            text += "  size %.1fKB  kept %.1fKB  decode p50 %.1fms  ok %d  failed %d\n\n" % (
+                telemetry.lastSize / 1024, deep_sizeof(ep._data) / 1024, 
+                telemetry.decode_percentile(50) * 1000, telemetry.successes, 
+                telemetry.failures)
+        for host, bucket in RequestScheduler.buckets.items():
+            text += "%-18s  queued %d  wait avg %.2fs max %.2fs  throttled %d\n" % (
+                host, bucket.queueDepth, bucket.avgWaitTime, bucket.maxWaitTime, 
+                bucket.throttledCount)
+        text += "\nresident memory %.1fMB\n" % (get_rss() / 1024 / 1024)
+        await ctx.send(decorate_text(text, title="API Update Status"))
+    
+    @parser("api interval", ["endpoint", tuple(wynnapi.WynnAPI.endpoints)], "seconds",
+        parent=display_api_status)
+    async def set_api_interval(self, ctx: commands.Context, endpoint, seconds):
+        if not await Discord.user_check(ctx, *Config.user_dev):
+            return
+        if not seconds.isnumeric() or int(seconds) < MIN_ENDPOINT_INTERVAL:
+            await ctx.send(embed=make_alert(
+                f"interval has to be an integer of at least {MIN_ENDPOINT_INTERVAL}."))
+            return
+        wynnapi.WynnAPI.endpoints[endpoint].set_interval(int(seconds))
+        Logger.bot.info(f"{endpoint} update interval set to {seconds}s by {ctx.author}")
+        await ctx.message.add_reaction("✅")
@@ -2,19 +2,20 @@ from discord.ext import tasks, commands
 
 from logger import Logger
 from event import Event
-from wynnapi import WynnAPI
+from wynnapi import WynnAPI, GuildStatsDelta
 from msgmaker import *
 from reactablemessage import RMessage
 from util.cmdutil import parser
 from util.discordutil import Discord
 from state.config import Config
 from state.guildmember import GuildMember
+from state.metric import Metric
 from state.statistic import Statistic
 from cog.datamanager import DataManager
 from cog.snapshotmanager import SnapshotManager
+from cog.leaderboards import Leaderboards
 
 
-XP_UPDATE_INTERVAL = 30
 XP_LOG_INTERVAL = 5  # in minutes
 
 
@@ -24,44 +25,62 @@ class XPTracker(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
-        self._guildStatsReceiver = WynnAPI.guildStats.create_receiver()
         self._snapshotManager: SnapshotManager = bot.get_cog("SnapshotManager")
+        self._leaderboards: Leaderboards = bot.get_cog("Leaderboards")
 
         self._logEntries = {}
+        # contributed xp of the last guild stats, and members added since it
+        self._contributed = {}
+        self._newIds = set()
 
-        self._update.start()
+        self._updateTask = bot.loop.create_task(self._update())
         self._xp_log.start()
         self._snapshotManager.add("XPTracker", self)
+        self._leaderboards.set_update_info("xp", lambda: {"endpoint": WynnAPI.guildStats})
 
-        Event.listen("xpChange", self.on_xp_change)
+        Event.listen("xpChange", self.on_xp_change, batch=True)
+        Event.listen("memberAdd", self._on_member_add)
     
     async def __snap__(self):
-        return (
-            await self.make_xp_lb_pages(False),
-            await self.make_xp_lb_pages(True)
-        )
+        # the leader boards are part of the shared snapshot data
+        return None
 
-    async def on_xp_change(self, id_, diff):
-        if id_ not in self._logEntries:
-            self._logEntries[id_] = 0
-        self._logEntries[id_] += diff
+    async def on_xp_change(self, changes):
+        for id_, diff in changes:
+            if id_ not in self._logEntries:
+                self._logEntries[id_] = 0
+            self._logEntries[id_] += diff
 
-    @tasks.loop(seconds=XP_UPDATE_INTERVAL)
-    async def _update(self):
-        guildStats = self._guildStatsReceiver.getData()
-        if not guildStats:
-            return
+    async def _on_member_add(self, id_):
+        self._newIds.add(id_)
 
-        for memberData in guildStats["members"]:
-            if GuildMember.is_ign_active(memberData["name"]):
-                id_ = GuildMember.ignIdMap[ memberData["name"]]
-                await Statistic.stats[id_].update_xp(memberData["contributed"])
-    
-    @_update.before_loop
-    async def _before_update(self):
+    async def _update(self):
         await self.bot.wait_until_ready()
         Logger.bot.debug("Starting xp tracking loop")
-    
+
+        async for delta in WynnAPI.guildStats.subscribe():
+            try:
+                await self._on_guild_stats(delta)
+            except Exception as e:
+                Logger.bot.error(f"failed to track xp with {delta}: {e!r}")
+
+    async def _on_guild_stats(self, delta: GuildStatsDelta):
+        # added members start from the value before this payload, or their first gain
+        # would only set it. Joined members are part of the contributed ones.
+        newIds, self._newIds = self._newIds, set()
+        prevContributed, self._contributed = self._contributed, delta.members
+
+        async with Statistic.batch():
+            for id_ in newIds:
+                stat = Statistic.stats.get(id_)
+                ign = GuildMember.members[id_].ign
+                if stat and stat.xp.real is None and ign in prevContributed:
+                    await stat.update_xp(prevContributed[ign])
+            for ign, contributed in delta.contributed.items():
+                if GuildMember.is_ign_active(ign):
+                    id_ = GuildMember.ignIdMap[ign]
+                    await Statistic.stats[id_].update_xp(contributed)
+
     @tasks.loop(minutes=XP_LOG_INTERVAL)
     async def _xp_log(self):
         filter_ = lambda m: m.status == GuildMember.ACTIVE
@@ -83,32 +102,36 @@ class XPTracker(commands.Cog):
         await self.bot.wait_until_ready()
         Logger.bot.debug("Starting xp logging loop")
     
-    async def make_xp_lb_pages(self, total):
-        if total:
-            lb = Statistic.xpTotalLb
-            field = "total"
-            titlePrefix = "Total "
-        else:
-            lb = Statistic.xpLb
-            field = "biweek"
-            titlePrefix = "Bi-Weekly "
-
-        valGetter = lambda m: Statistic.stats[m.id].xp[field]
+    async def make_xp_since_pages(self, ctx: commands.Context, index):
+        snap = await self._snapshotManager.get_member_index(ctx, index)
+        if not snap:
+            return
+        rows = snap.memberIndex
+
+        prevStat = lambda id_: rows[id_].stat if id_ in rows else None
+        gains = {id_: stat.xp["total"] - (prev.xp["total"] if (prev := prevStat(id_)) else 0)
+            for id_, stat in Statistic.stats.items()}
+        currRanks = {id_: rank for rank, id_ in enumerate(Statistic.xpTotalLb, 1)}
+        prevRank = lambda id_: rows[id_].ranks["xpTotalLb"] if id_ in rows else 0
+
+        valGetter = lambda m: f"+{gains[m.id]:,}  " + \
+            format_rank_move(prevRank(m.id), currRanks.get(m.id, 0))
         filter_ = lambda m: m.status != GuildMember.REMOVED
-        
+
+        lb = sorted(gains, key=gains.get, reverse=True)
         return make_entry_pages(await make_stat_entries(
-            valGetter, filter_=filter_, lb=lb),
-            title=titlePrefix + "XP Leader Board", endpoint=WynnAPI.guildStats)
+            valGetter, group=False, filter_=filter_, lb=lb),
+            title=f"XP Gained Since {snap.id}", endpoint=WynnAPI.guildStats)
     
-    @parser("xp", ["total"], "-snap", isGroup=True)
-    async def display_xp_lb(self, ctx: commands.Context, total, snap):
-        if snap:
-            pages = await self._snapshotManager.get_snapshot_cmd(ctx, snap, 
-                "XPTracker", total)
-            if not pages:
-                return
-        else:
-            pages = await self.make_xp_lb_pages(total)
+    @parser("xp", ["total"], "-snap", "--since-snap", "--window", isGroup=True)
+    async def display_xp_lb(self, ctx: commands.Context, total, snap, sinceSnap, window):
+        if not sinceSnap:
+            await self._leaderboards.send_lb(ctx, Metric.registry["xp"], 
+                "total" if total else "biweek", snap, window)
+            return
+        pages = await self.make_xp_since_pages(ctx, sinceSnap)
+        if not pages:
+            return
         
         rMsg = RMessage(await ctx.send(pages[0]))
         await rMsg.add_pages(pages)
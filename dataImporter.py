@@ -0,0 +1,13 @@
+from state.state import State
+from state.sqlitestore import SQLiteStore
+from state.guildmember import GuildMember
+from state.statistic import Statistic
+
+
+# one-shot import of the pickled GuildMember and Statistic data into the sqlite store
+State.use_store(SQLiteStore())
+for targetCls in State.rowAttributes:
+    attrMap = State.import_pickle(targetCls)
+    for attr in State.rowAttributes[targetCls]:
+        print(f"{targetCls.__name__}.{attr}: {len(attrMap.get(attr, {}))} rows")
+State.store.close()
@@ -1,15 +1,33 @@
 class Event:
 
     _listeners = {}
+    # listeners that take every event of a batch at once, as a list of argument tuples
+    _batchListeners = {}
 
     @staticmethod
-    def listen(type_, callback):
-        if type_ not in Event._listeners:
-            Event._listeners[type_] = set()
-        Event._listeners[type_].add(callback)
+    def listen(type_, callback, batch=False):
+        listeners = Event._batchListeners if batch else Event._listeners
+        if type_ not in listeners:
+            listeners[type_] = set()
+        listeners[type_].add(callback)
     
     @staticmethod
     async def broadcast(type_, *args, **kwargs):
         if type_ in Event._listeners:
             for cb in Event._listeners[type_]:
-                await cb(*args, **kwargs)
\ No newline at end of file
+                await cb(*args, **kwargs)
+        if type_ in Event._batchListeners:
+            for cb in Event._batchListeners[type_]:
+                await cb([args])
+    
+    @staticmethod
+    async def broadcast_batch(type_, argsList):
+        if not argsList:
+            return
+        if type_ in Event._listeners:
+            for cb in Event._listeners[type_]:
+                for args in argsList:
+                    await cb(*args)
+        if type_ in Event._batchListeners:
+            for cb in Event._batchListeners[type_]:
+                await cb(argsList)
@@ -1,5 +1,7 @@
 from aiohttp import ClientSession
+from os import getenv
 from asyncio import run
+from time import perf_counter
 from colorama import Back, Fore, Style
 
 from discord import Activity, ActivityType
@@ -7,24 +9,31 @@ from discord.utils import find
 from discord.ext import commands
 
 from logger import Logger
+from wynnapi import APIEndpoint
 from msgmaker import make_alert, COLOR_ERROR
 from reactablemessage import RMessage
 from util.discordutil import Discord
 from state.state import State
+from state.sqlitestore import SQLiteStore
+from state.journal import Journal
 from state.config import Config
 from state.guildmember import GuildMember
 from state.statistic import Statistic
 from state.apistamp import APIStamp
+from state.playercache import PlayerCache
+from state.window import StatWindow
 from cog.datamanager import DataManager
 from cog.configuration import Configuration
 from cog.wynnapi import WynnAPI
 from cog.membermanager import MemberManager
 from cog.xptracker import XPTracker
+from cog.historytracker import HistoryTracker
 from cog.wartracker import WarTracker
 from cog.dateclock import DateClock
 from cog.remotedebugger import RemoteDebugger
 from cog.emeraldtracker import EmeraldTracker
 from cog.snapshotmanager import SnapshotManager
+from cog.leaderboards import Leaderboards
 from cog.claimtracker import ClaimTracker
 from cog.help import Help
 from cog.misc import Misc
@@ -36,7 +45,25 @@ class HaxBotJr(commands.Bot):
 
     session = None
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.isInitialized = False
+        self.startupTimes = {}
+
     async def on_ready(self):
+        # on_ready fires again after the gateway reconnects, everything is still in place then
+        if self.isInitialized:
+            Logger.bot.info(f"reconnected as {self.user}, resuming")
+            return
+        self.isInitialized = True
+
+        phaseTime = perf_counter()
+        def end_phase(name):
+            nonlocal phaseTime
+            curr = perf_counter()
+            self.startupTimes[name] = curr - phaseTime
+            phaseTime = curr
+
         await self.change_presence(activity=Activity(type=ActivityType.watching, name="you"))
 
         Logger.init()
@@ -44,18 +71,26 @@ class HaxBotJr(commands.Bot):
 
         Discord.init(self)
 
-        HaxBotJr.session = ClientSession()
+        if not HaxBotJr.session:
+            HaxBotJr.session = ClientSession()
+        end_phase("init")
+
+        if getenv("STATE_BACKEND") == "sqlite":
+            State.use_store(SQLiteStore())
+        Journal.open()
+        State.use_journal(Journal)
+        end_phase("journal")
 
-        await State.load(Config)
-        await State.load(GuildMember)
-        await State.load(Statistic)
-        await State.load(APIStamp)
+        await State.load_all(Config, GuildMember, Statistic, APIStamp, PlayerCache, StatWindow)
+        end_phase("state")
 
         self.add_cog(Configuration(self))
         self.add_cog(WynnAPI(self, HaxBotJr.session))
-        self.add_cog(SnapshotManager(self))
+        self.add_cog(await SnapshotManager(self).load())
+        self.add_cog(Leaderboards(self))
         self.add_cog(MemberManager(self))
         self.add_cog(XPTracker(self))
+        self.add_cog(HistoryTracker(self))
         self.add_cog(await DataManager.load(WarTracker(self)))
         self.add_cog(await DataManager.load(EmeraldTracker(self)))
         self.add_cog(await DataManager.load(ClaimTracker(self)))
@@ -67,7 +102,10 @@ class HaxBotJr(commands.Bot):
         self.add_cog(Misc(self))
         self.add_cog(await DataManager.load(Votation(self)))
         self.add_cog(DiscordTools(self))
+        end_phase("cogs")
 
+        Logger.bot.info("startup took %.2fs (%s)" % (sum(self.startupTimes.values()),
+            ", ".join("%s %.2fs" % phase for phase in self.startupTimes.items())))
         print("ready")
 
     @classmethod
@@ -75,6 +113,10 @@ class HaxBotJr(commands.Bot):
         Logger.bot.debug("exiting...")
         Logger.archive_logs()
         run(cls.session.close())
+        APIEndpoint.close_decode_pool()
+        Journal.close()
+        if State.store:
+            State.store.close()
 
     async def on_command_error(self, ctx: commands.Context, e: Exception):
         eStr = str(e)
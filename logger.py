@@ -6,6 +6,7 @@ from queue import Queue
 from sys import stdout
 
 from util.pickleutil import PickleUtil
+from util.aioutil import AIOUtil
 from util.timeutil import now
 
 
@@ -14,6 +15,7 @@ ARCHIVE_FOLDER = "./log/archive/"
 LOG_FILE = LOG_FOLDER + "latest.log"
 DEBUG_FILE = LOG_FOLDER + "debug.log"
 META_FILE = LOG_FOLDER + "meta"
+ROTATED_SUFFIX = ".rotated"
 
 MAX_DEBUG_ARCHIVE = 5
 
@@ -113,20 +115,20 @@ class Logger:
         cls._create_meta()
 
     @classmethod
-    def archive_logs(cls):
+    def archive_logs(cls, logFile=LOG_FILE, debugFile=DEBUG_FILE):
         today = now().date()
 
         (logDate, logVersion, archivedDebugs) = PickleUtil.load(META_FILE)
         archiveName = f"{logDate.strftime('%Y-%m-%d')}.{logVersion}.log.gz"
 
-        cls._archive_file(LOG_FILE, ARCHIVE_FOLDER + archiveName)
+        cls._archive_file(logFile, ARCHIVE_FOLDER + archiveName)
         
         if len(archivedDebugs) >= MAX_DEBUG_ARCHIVE:
             [delete, *archivedDebugs] = archivedDebugs
             os.remove(ARCHIVE_FOLDER + delete)
         
         debugArchiveName = "debug-" + archiveName
-        cls._archive_file(DEBUG_FILE, ARCHIVE_FOLDER + debugArchiveName)
+        cls._archive_file(debugFile, ARCHIVE_FOLDER + debugArchiveName)
         archivedDebugs.append(debugArchiveName)
 
         if today == logDate:
@@ -139,21 +141,36 @@ class Logger:
         return archiveName, debugArchiveName
     
     @classmethod
-    def reset(cls):
-        archiveNames = cls.archive_logs()
-
-        infoHandler.close()
-        with open(LOG_FILE, "w") as f:
-            f.write("")
-
-        debugHandler.close()
-        with open(DEBUG_FILE, "w") as f:
-            f.write("")
+    async def reset(cls):
+        # the files are renamed and reopened right away so no line is lost, the renamed
+        # ones are archived in the pool after.
+        rotated = [cls._rotate(handler) for handler in (infoHandler, debugHandler)]
+        archiveNames = await AIOUtil.run("log.archive", cls._archive_rotated, *rotated)
         
         cls._create_meta()
 
         return archiveNames
 
+    @staticmethod
+    def _rotate(handler: logging.FileHandler):
+        rotatedFile = handler.baseFilename + ROTATED_SUFFIX
+        handler.acquire()
+        try:
+            if handler.stream:
+                handler.stream.close()
+            os.replace(handler.baseFilename, rotatedFile)
+            handler.stream = handler._open()
+        finally:
+            handler.release()
+        return rotatedFile
+
+    @classmethod
+    def _archive_rotated(cls, logFile, debugFile):
+        archiveNames = cls.archive_logs(logFile, debugFile)
+        os.remove(logFile)
+        os.remove(debugFile)
+        return archiveNames
+
     @staticmethod
     def _create_meta():
         today = now().date()
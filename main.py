@@ -5,20 +5,24 @@ from discord import Intents, MemberCacheFlags
 # import uvloop
 
 from haxbotjr import HaxBotJr
+from wynnapi import APIEndpoint
 
 
-load_dotenv()
-# uvloop.install()
+# the decode processes are spawned and import this module, they must not start the bot
+if __name__ == "__main__":
+    load_dotenv()
+    # uvloop.install()
 
+    # started before the bot runs any threads
+    APIEndpoint.start_decode_pool()
 
-intents: Intents = Intents.none()
-intents.guilds = True
-intents.members = True
-intents.guild_messages = True
-intents.guild_reactions = True
+    intents: Intents = Intents.none()
+    intents.guilds = True
+    intents.members = True
+    intents.guild_messages = True
+    intents.guild_reactions = True
 
-
-haxBotJr = HaxBotJr(command_prefix="]", help_command=None, intents=intents,
-                    member_cache_flags=MemberCacheFlags.from_intents(intents))
-haxBotJr.run(getenv("BOT_TOKEN"))
-haxBotJr.exit()
\ No newline at end of file
+    haxBotJr = HaxBotJr(command_prefix="]", help_command=None, intents=intents,
+                        member_cache_flags=MemberCacheFlags.from_intents(intents))
+    haxBotJr.run(getenv("BOT_TOKEN"))
+    haxBotJr.exit()
\ No newline at end of file
@@ -29,8 +29,10 @@ def decorate_text(text, sh="haskell", title=None, info=None,
         endpoint=None, lastUpdate=None) -> str:
     text = text.strip()
     if endpoint:
-        updateTime = APIStamp.stamps[id(endpoint.params)][1]
+        updateTime = APIStamp.stamps[endpoint.name][1]
         text = f"{text}\n\nUpdated {trunc((now() - updateTime).total_seconds())}s ago."
+        if endpoint.isStale:
+            text += " Wynncraft API is unavailable, data may be outdated."
     elif lastUpdate:
         text = f"{text}\n\nLast updated at {lastUpdate}."
     if info:
@@ -65,14 +67,15 @@ def make_entry_pages(entries, maxEntries=MAX_ENTRY_PER_PAGE, **decoArgs):
 
 
 async def make_stat_entries(valGetter, nameGetter=None, group=True, filter_=None, rank=True,
-                            lb=None):
+                            lb=None, members=None):
     nameGetter = nameGetter or (lambda m: m.ign)
     data = []
     maxNameLen = -1
 
-    if lb:
-        members = map(GuildMember.members.get, lb)
-        for member in (filter(filter_, members) if filter_ else members):
+    if lb or members is not None:
+        members = members if members is not None else GuildMember.members
+        memberIter = map(members.get, lb) if lb is not None else members.values()
+        for member in (filter(filter_, memberIter) if filter_ else memberIter):
             name = nameGetter(member)
             maxNameLen = max(maxNameLen, len(name))
             data.append((name, valGetter(member)))
@@ -109,4 +112,11 @@ def format_act_dt(dt):
     minutes = seconds // 60 % 60
     seconds = seconds % 60
 
-    return f"{days:02} {hours:02}:{minutes:02}:{seconds:02}"
\ No newline at end of file
+    return f"{days:02} {hours:02}:{minutes:02}:{seconds:02}"
+
+def format_rank_move(prevRank, currRank):
+    if not prevRank:
+        return "new"
+    if prevRank == currRank:
+        return "-"
+    return ("▲%d" if currRank < prevRank else "▼%d") % abs(prevRank - currRank)
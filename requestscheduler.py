@@ -0,0 +1,131 @@
+import aiohttp
+from typing import Dict
+from time import monotonic
+from asyncio import Future, create_task, sleep
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+import heapq
+
+from logger import Logger
+
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# host -> (tokens per second, bucket capacity)
+HOST_LIMITS = {
+    "api.wynncraft.com": (1, 10),
+    "api.mojang.com": (1, 10)
+}
+DEFAULT_LIMIT = (1, 5)
+
+DEFAULT_RETRY_AFTER = 60  # in seconds, used when a 429 comes without Retry-After
+
+
+class HostBucket:
+
+    def __init__(self, host, rate, capacity):
+        self.host = host
+        self.rate = rate
+        self.capacity = capacity
+
+        self.tokens = capacity
+        self.lastRefill = monotonic()
+        self.blockedUntil = 0
+
+        self._waiters = []
+        self._waiterCount = 0
+        # kept so the loop can't collect it, a done pump is started again
+        self._pumpTask = None
+
+        self.requestCount = 0
+        self.throttledCount = 0
+        self.totalWaitTime = 0
+        self.maxWaitTime = 0
+
+    def __repr__(self):
+        return f"<HostBucket host={self.host} tokens={self.tokens:.2f} " + \
+            f"queued={self.queueDepth}>"
+
+    @property
+    def queueDepth(self):
+        return len(self._waiters)
+
+    @property
+    def avgWaitTime(self):
+        return self.totalWaitTime / self.requestCount if self.requestCount else 0
+
+    async def acquire(self, priority):
+        startTime = monotonic()
+        if self._waiters or not self._take():
+            future = Future()
+            self._waiterCount += 1
+            heapq.heappush(self._waiters, (priority, self._waiterCount, future))
+            if not self._pumpTask or self._pumpTask.done():
+                self._pumpTask = create_task(self._pump())
+            await future
+
+        waitTime = monotonic() - startTime
+        self.requestCount += 1
+        self.totalWaitTime += waitTime
+        self.maxWaitTime = max(self.maxWaitTime, waitTime)
+
+    def block(self, seconds):
+        Logger.bot.warning(f"{self.host} is rate limited for {seconds}s")
+        self.throttledCount += 1
+        self.blockedUntil = max(self.blockedUntil, monotonic() + seconds)
+
+    def _take(self):
+        curr = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (curr - self.lastRefill) * self.rate)
+        self.lastRefill = curr
+        if curr < self.blockedUntil or self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def _next_token_delay(self):
+        curr = monotonic()
+        return max(self.blockedUntil - curr, (1 - self.tokens) / self.rate, 0)
+
+    async def _pump(self):
+        while self._waiters:
+            if not self._take():
+                await sleep(self._next_token_delay())
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.cancelled():
+                self.tokens += 1
+            else:
+                future.set_result(None)
+
+
+class RequestScheduler:
+
+    buckets: Dict[str, HostBucket] = {}
+
+    @classmethod
+    def get_bucket(cls, url) -> HostBucket:
+        host = urlparse(url).hostname
+        if host not in cls.buckets:
+            cls.buckets[host] = HostBucket(host, *HOST_LIMITS.get(host, DEFAULT_LIMIT))
+        return cls.buckets[host]
+
+    @classmethod
+    @asynccontextmanager
+    async def request(cls, session: aiohttp.ClientSession, method, url,
+            priority=PRIORITY_NORMAL, **kwargs):
+        bucket = cls.get_bucket(url)
+        await bucket.acquire(priority)
+        async with session.request(method, url, **kwargs) as resp:
+            if resp.status == 429 or (resp.status == 503 and "Retry-After" in resp.headers):
+                bucket.block(cls._parse_retry_after(resp.headers.get("Retry-After")))
+            yield resp
+
+    @staticmethod
+    def _parse_retry_after(value):
+        try:
+            return max(float(value), 0)
+        except (TypeError, ValueError):
+            return DEFAULT_RETRY_AFTER
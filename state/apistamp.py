@@ -1,17 +1,87 @@
+from collections import deque
+from datetime import datetime
+
 from util.timeutil import now
 from state.state import State
 
 
-@State.register("stamps")
+LATENCY_SAMPLES = 512
+
+
+@State.register("stamps", "telemetry", tracked=True)
 class APIStamp:
 
+    # endpoint name -> (api timestamp, update time)
     stamps = {}
+    # endpoint name -> EndpointTelemetry
+    telemetry = {}
+
+    @classmethod
+    async def __loaded__(cls):
+        # stamps used to be keyed by id(params), which is meaningless after a restart.
+        cls.stamps = {k: v for k, v in cls.stamps.items() if type(k) == str}
 
     @classmethod
-    def set_stamp(cls, param, stamp):
-        id_ = id(param)
-        prevStamp = cls.stamps.get(id_, (None, None))[0]
+    def set_stamp(cls, name, stamp):
+        prevStamp = cls.stamps.get(name, (None, None))[0]
         if prevStamp is None or stamp > prevStamp:
-            cls.stamps[id_] = (stamp, now())
+            cls.stamps[name] = (stamp, now())
+            State.mark_dirty(cls, "stamps")
             return bool(prevStamp)
-        return False
\ No newline at end of file
+        return False
+    
+    @classmethod
+    def get_telemetry(cls, name):
+        if name not in cls.telemetry:
+            cls.telemetry[name] = EndpointTelemetry()
+            State.mark_dirty(cls, "telemetry")
+        return cls.telemetry[name]
+
+
+class EndpointTelemetry:
+
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.decodeTimes = deque(maxlen=LATENCY_SAMPLES)
+        self.lastSize = 0
+        self.totalBytes = 0
+
+        self.successes = 0
+        self.failures = 0
+        self.lastChanged: datetime = None
+    
+    def __repr__(self):
+        s = "<EndpointTelemetry"
+        properties = ["successes", "failures", "lastSize", "lastChanged"]
+        for p in properties:
+            s += f" {p}={getattr(self, p)}"
+        return s + ">"
+    
+    def record_success(self, latency, size):
+        self.successes += 1
+        self.latencies.append(latency)
+        self.lastSize = size
+        self.totalBytes += size
+        State.mark_dirty(APIStamp, "telemetry")
+    
+    def record_failure(self):
+        self.failures += 1
+        State.mark_dirty(APIStamp, "telemetry")
+    
+    def record_change(self, decodeTime):
+        self.decodeTimes.append(decodeTime)
+        self.lastChanged = now()
+        State.mark_dirty(APIStamp, "telemetry")
+    
+    def latency_percentile(self, percent):
+        return self._percentile(self.latencies, percent)
+    
+    def decode_percentile(self, percent):
+        return self._percentile(self.decodeTimes, percent)
+    
+    @staticmethod
+    def _percentile(samples, percent):
+        if not samples:
+            return 0
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
@@ -8,7 +8,7 @@ from state.state import State
 from util.discordutil import Discord
 
 
-@State.register("members")
+@State.register("members", rows=("members",))
 class GuildMember:
 
     ACTIVE = "active"
@@ -52,6 +52,7 @@ class GuildMember:
             cls.members[id_] = GuildMember(id_, dMember, ranks, ign)
             cls.ignIdMap[ign] = id_
             cls.discordIdMap[dMember.id] = id_
+            State.mark_rows_dirty(cls, "members", id_)
 
             await Event.broadcast("memberAdd", id_)
             
@@ -87,6 +88,7 @@ class GuildMember:
         if id_ not in cls.altMap:
             cls.altMap[id_] = set()
         cls.altMap[id_].add(altId_)
+        State.mark_rows_dirty(cls, "members", altId_)
 
         Logger.bot.info(f"Added alt {ign} to {cls.members[id_]}")
         await Event.broadcast("memberAltAdd", id_, altId_)
@@ -101,6 +103,7 @@ class GuildMember:
 
         prevOwnerId = member.ownerId
         member.ownerId = None
+        State.mark_rows_dirty(cls, "members", id_)
 
         Logger.bot.info(f"Removed alt {member.ign} from {cls.members[prevOwnerId]}")
         await Event.broadcast("memberAltRemove", prevOwnerId, id_)
@@ -111,6 +114,7 @@ class GuildMember:
         prevStatus = member.status
         if prevStatus != newStatus:
             member.status = newStatus
+            State.mark_rows_dirty(cls, "members", member.id)
             Logger.bot.info(f"{member.ign} status {prevStatus} -> {newStatus}")
             await Event.broadcast("memberStatusChange", id_, prevStatus)
     
@@ -131,6 +135,7 @@ class GuildMember:
             Logger.bot.info(f"{member.ign} discord change {prevDMember} -> {dMember}")
 
             member.discordId = discordId
+            State.mark_rows_dirty(cls, "members", member.id)
             if prevDiscordId is not None:
                 del cls.discordIdMap[prevDiscordId]
             if discordId is not None:
@@ -142,21 +147,27 @@ class GuildMember:
             Logger.bot.info(f"{member.ign} rank change {member.rank} -> {rank}")
             prevRank = member.rank
             member.rank = rank
+            State.mark_rows_dirty(cls, "members", member.id)
             await Event.broadcast("memberRankChange", id_, prevRank)
         
         if member.vRank != vRank:
             Logger.bot.info(f"{member.ign} vRank change {member.vRank} -> {vRank}")
             prevVRank = member.vRank
             member.vRank = vRank
+            State.mark_rows_dirty(cls, "members", member.id)
             await Event.broadcast("memberVRankChange", id_, prevVRank)
     
     @classmethod
-    async def ign_check(cls, id_):
-        currIgn = await WynnAPI.get_player_ign(id_)
+    async def ign_check(cls, id_, ign=None):
+        if ign and await WynnAPI.get_player_id(ign) == id_:
+            currIgn = ign
+        else:
+            currIgn = await WynnAPI.get_player_ign(id_)
         member = cls.members[id_]
         if member.ign != currIgn:
             prevIgn = member.ign
             member.ign = currIgn
+            State.mark_rows_dirty(cls, "members", member.id)
 
             del cls.ignIdMap[prevIgn]
             cls.ignIdMap[currIgn] = id_
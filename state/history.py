@@ -0,0 +1,287 @@
+from array import array
+from bisect import bisect_right
+from time import time
+from typing import Dict, Tuple
+import mmap
+import os
+
+from logger import Logger
+from state.metric import Metric
+
+
+HISTORY_FOLDER = "./history/"
+SAMPLE_INTERVAL = 60  # in seconds, samples within the same interval are merged
+
+TIMESTAMP_TYPE = "I"
+VALUE_TYPE = "d"
+
+METRICS = tuple(Metric.registry)
+
+
+class Series:
+
+    def __init__(self, path):
+        self.path = path
+        self.tsFile = path + ".ts"
+        self.valFile = path + ".val"
+
+        # samples that are not on disk yet, the first flushCount of them are being written
+        self.pendingTs = array(TIMESTAMP_TYPE)
+        self.pendingVals = array(VALUE_TYPE)
+        self.flushCount = 0
+
+        self._mapped = None
+        self._repaired = False
+        # until the last value on disk is read in the I/O pool, samples are relative to it
+        self.loaded = False
+        self.lastValue = 0
+
+    def _item_count(self):
+        return min(MappedColumns._item_count(self.tsFile, TIMESTAMP_TYPE),
+            MappedColumns._item_count(self.valFile, VALUE_TYPE))
+
+    def _repair(self):
+        # a flush cut between the two files leaves extra values, drop them before appending
+        count = self._item_count()
+        for path, typecode in ((self.tsFile, TIMESTAMP_TYPE), (self.valFile, VALUE_TYPE)):
+            size = count * array(typecode).itemsize
+            if os.path.isfile(path) and os.path.getsize(path) != size:
+                os.truncate(path, size)
+        self._repaired = True
+
+    def _read_last_value(self):
+        count = self._item_count()
+        if not count:
+            return 0
+        itemSize = array(VALUE_TYPE).itemsize
+        with open(self.valFile, "rb") as f:
+            f.seek((count - 1) * itemSize)
+            return array(VALUE_TYPE, f.read(itemSize))[0]
+
+    def append(self, timestamp, value):
+        timestamp -= timestamp % SAMPLE_INTERVAL
+        if len(self.pendingTs) > self.flushCount and self.pendingTs[-1] == timestamp:
+            self.pendingVals[-1] = value
+        else:
+            self.pendingTs.append(timestamp)
+            self.pendingVals.append(value)
+        self.lastValue = value
+
+    def accumulate(self, timestamp, diff):
+        self.append(timestamp, self.lastValue + diff)
+
+    def resolve(self, base):
+        if self.loaded:
+            return
+        for i in range(len(self.pendingVals)):
+            self.pendingVals[i] += base
+        self.lastValue += base
+        self.loaded = True
+
+    def begin_flush(self):
+        self.flushCount = len(self.pendingTs)
+        return self.pendingTs[:self.flushCount].tobytes(), \
+            self.pendingVals[:self.flushCount].tobytes()
+
+    def write(self, rawTs, rawVals):
+        # runs in the I/O pool. values go first so a cut write never leaves a timestamp
+        # without its value, a failed one is truncated back so its retry doesn't repeat it.
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if not self._repaired:
+            self._repair()
+        sizes = [(path, os.path.getsize(path) if os.path.isfile(path) else 0) 
+            for path in (self.valFile, self.tsFile)]
+        try:
+            with open(self.valFile, "ab") as f:
+                f.write(rawVals)
+            with open(self.tsFile, "ab") as f:
+                f.write(rawTs)
+        except OSError:
+            for path, size in sizes:
+                if os.path.isfile(path):
+                    os.truncate(path, size)
+            raise
+
+    def end_flush(self, written=True):
+        # the written samples are only dropped here, once they are on disk
+        if written:
+            del self.pendingTs[:self.flushCount]
+            del self.pendingVals[:self.flushCount]
+        self.flushCount = 0
+        return self.detach() if written else None
+
+    def map(self):
+        if self._mapped is None:
+            self._mapped = MappedColumns(self.tsFile, self.valFile)
+        return self._mapped
+
+    @property
+    def mapped(self):
+        return self._mapped is not None
+
+    def attach(self, mapped):
+        self._mapped = mapped
+
+    def unmap(self):
+        mapped = self.detach()
+        if mapped:
+            mapped.close()
+
+    def detach(self):
+        # the mapping only covers the samples on disk when it was made
+        mapped = self._mapped
+        self._mapped = None
+        return mapped
+
+    def value_at(self, timestamp):
+        if self.pendingTs and timestamp >= self.pendingTs[0]:
+            return self.pendingVals[bisect_right(self.pendingTs, timestamp) - 1]
+        mapped = self.map()
+        index = bisect_right(mapped.timestamps, timestamp) - 1
+        return mapped.values[index] if index >= 0 else 0
+
+    def samples(self, start, end):
+        mapped = self.map()
+        lo = bisect_right(mapped.timestamps, start)
+        hi = bisect_right(mapped.timestamps, end)
+        result = list(zip(mapped.timestamps[lo:hi], mapped.values[lo:hi]))
+        lo = bisect_right(self.pendingTs, start)
+        hi = bisect_right(self.pendingTs, end)
+        result.extend(zip(self.pendingTs[lo:hi], self.pendingVals[lo:hi]))
+        return result
+
+
+class MappedColumns:
+
+    def __init__(self, tsFile, valFile):
+        self._maps = []
+        self._views = []
+        # a flush can be cut between the two files, only whole samples are mapped
+        count = min(self._item_count(tsFile, TIMESTAMP_TYPE), 
+            self._item_count(valFile, VALUE_TYPE))
+        self.timestamps = self._map(tsFile, TIMESTAMP_TYPE, count)
+        self.values = self._map(valFile, VALUE_TYPE, count)
+
+    @staticmethod
+    def _item_count(path, typecode):
+        if not os.path.isfile(path):
+            return 0
+        return os.path.getsize(path) // array(typecode).itemsize
+
+    def _map(self, path, typecode, count):
+        if not count:
+            return array(typecode)
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        column = view[:count * array(typecode).itemsize].cast(typecode)
+        self._maps.append(mapped)
+        self._views.extend((column, view))
+        return column
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        for mapped in self._maps:
+            mapped.close()
+        self._views.clear()
+        self._maps.clear()
+
+
+class StatHistory:
+
+    folder = HISTORY_FOLDER
+    series: Dict[Tuple[str, str], Series] = {}
+
+    @classmethod
+    def get_series(cls, metric, id_) -> Series:
+        key = (metric, id_)
+        if key not in cls.series:
+            cls.series[key] = Series(os.path.join(cls.folder, metric, id_))
+        return cls.series[key]
+
+    @classmethod
+    def accumulate(cls, metric, id_, diff, timestamp=None):
+        cls.get_series(metric, id_).accumulate(int(timestamp or time()), diff)
+
+    @staticmethod
+    def read_bases(series):
+        # runs in the I/O pool
+        return [s._read_last_value() for s in series]
+
+    @staticmethod
+    def resolve(series, bases):
+        for s, base in zip(series, bases):
+            s.resolve(base)
+
+    @staticmethod
+    def open_mappings(series):
+        # runs in the I/O pool
+        return [MappedColumns(s.tsFile, s.valFile) for s in series]
+
+    @staticmethod
+    def attach(series, mappings):
+        for s, mapped in zip(series, mappings):
+            s.attach(mapped)
+
+    @classmethod
+    def unloaded(cls, series=None):
+        return [s for s in (cls.series.values() if series is None else series) if not s.loaded]
+
+    @staticmethod
+    def unmapped(series):
+        return [s for s in series if not s.mapped]
+
+    @classmethod
+    def load(cls, series=None):
+        unloaded = cls.unloaded(series)
+        cls.resolve(unloaded, cls.read_bases(unloaded))
+
+    @classmethod
+    def gained(cls, metric, id_, start, end=None):
+        series = cls.get_series(metric, id_)
+        endValue = series.value_at(end) if end else series.lastValue
+        return endValue - series.value_at(start)
+
+    @classmethod
+    def begin_flush(cls):
+        # only series whose last value on disk is known have absolute samples to write
+        jobs = []
+        for series in cls.series.values():
+            if series.loaded and series.pendingTs:
+                jobs.append((series, *series.begin_flush()))
+        return jobs
+
+    @classmethod
+    def write(cls, jobs):
+        # returns the series that were written, the others keep their samples for the next flush
+        written = []
+        for series, rawTs, rawVals in jobs:
+            try:
+                series.write(rawTs, rawVals)
+            except OSError as e:
+                Logger.bot.error(f"failed to write history {series.path}: {e!r}")
+                continue
+            written.append(series)
+        return written
+
+    @classmethod
+    def end_flush(cls, jobs, written):
+        # returns the mappings made stale by the flush, to be closed off the event loop
+        written = set(written)
+        stale = [series.end_flush(series in written) for series, *_ in jobs]
+        return [mapped for mapped in stale if mapped]
+
+    @staticmethod
+    def close_mapped(mappings):
+        for mapped in mappings:
+            mapped.close()
+
+    @classmethod
+    def flush(cls):
+        cls.load()
+        jobs = cls.begin_flush()
+        written = cls.write(jobs)
+        cls.close_mapped(cls.end_flush(jobs, written))
+        return sum(len(rawTs) + len(rawVals) for series, rawTs, rawVals in jobs 
+            if series in written)
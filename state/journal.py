@@ -0,0 +1,414 @@
+from asyncio import create_task, sleep, wait
+from datetime import timedelta
+from struct import Struct
+from threading import Lock
+from uuid import UUID
+from zlib import crc32
+import os
+import pickle
+
+from logger import Logger
+from event import Event
+from util.pickleutil import PickleUtil
+from util.aioutil import AIOUtil
+from state.state import State
+from state.guildmember import GuildMember
+from state.statistic import Statistic
+
+
+JOURNAL_FILE = "./data/state.journal"
+GROUP_COMMIT_DELAY = 1  # in seconds
+
+# body length, crc32 of body
+RECORD_HEADER = Struct("<HI")
+# kind, id length | id flags
+BODY_HEADER = Struct("<BB")
+# uuids are packed into 16 bytes, the flag tells how to format them back
+ID_HEX = 0x40
+ID_DASHED = 0x80
+ID_LENGTH_MASK = 0x3f
+
+STATUSES = (GuildMember.ACTIVE, GuildMember.IDLE, GuildMember.REMOVED)
+
+# event type -> (kind, payload format, class the record is replayed into),
+# a payload without a format is the raw rest of the record.
+RECORD_KINDS = {
+    "xpChange": (1, Struct("<qq"), Statistic),
+    "emeraldChange": (2, Struct("<qq"), Statistic),
+    "warIncrement": (3, Struct(""), Statistic),
+    "onlineTimeAccumulate": (4, Struct("<d"), Statistic),
+    "offline": (5, Struct(""), Statistic),
+    "memberStatusChange": (6, Struct("<B"), GuildMember),
+    "biweeklyReset": (7, Struct(""), Statistic),
+    "memberAdd": (8, None, GuildMember),
+    "memberAltAdd": (9, None, GuildMember),
+    "memberAltRemove": (10, Struct(""), GuildMember),
+    "memberDiscordChange": (11, Struct("<Q"), GuildMember),
+    "memberRankChange": (12, None, GuildMember),
+    "memberVRankChange": (13, None, GuildMember),
+    "memberIgnChange": (14, None, GuildMember)
+}
+KIND_NAMES = {kind: (name, payload) for name, (kind, payload, _) in RECORD_KINDS.items()}
+ROW_ATTRIBUTES = {GuildMember: "members", Statistic: "stats"}
+
+
+def encode_id(id_):
+    if not id_:
+        return 0, b""
+    hexId = id_.replace("-", "")
+    if len(hexId) == 32:
+        try:
+            return (ID_DASHED if "-" in id_ else ID_HEX) | 16, bytes.fromhex(hexId)
+        except ValueError:
+            pass
+    rawId = id_.encode()
+    return len(rawId), rawId
+
+
+def decode_id(idInfo, rawId):
+    if idInfo & ID_DASHED:
+        return str(UUID(bytes=rawId))
+    if idInfo & ID_HEX:
+        return rawId.hex()
+    return rawId.decode() or None
+
+
+def encode_text(text):
+    return text.encode() if text else b""
+
+
+def decode_text(raw):
+    return raw.decode() or None
+
+
+def encode_record(name, id_, *values):
+    kind, payload, _ = RECORD_KINDS[name]
+    idInfo, rawId = encode_id(id_)
+    rawValues = payload.pack(*values) if payload else values[0]
+    body = BODY_HEADER.pack(kind, idInfo) + rawId + rawValues
+    return RECORD_HEADER.pack(len(body), crc32(body)) + body
+
+
+def decode_records(raw):
+    records = []
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(raw):
+        length, checksum = RECORD_HEADER.unpack_from(raw, offset)
+        start = offset + RECORD_HEADER.size
+        body = raw[start:start + length]
+        # a torn or corrupted tail ends the journal
+        if len(body) < length or crc32(body) != checksum:
+            break
+        kind, idInfo = BODY_HEADER.unpack_from(body)
+        name, payload = KIND_NAMES[kind]
+        idEnd = BODY_HEADER.size + (idInfo & ID_LENGTH_MASK)
+        id_ = decode_id(idInfo, body[BODY_HEADER.size:idEnd])
+        values = payload.unpack_from(body, idEnd) if payload else (body[idEnd:],)
+        records.append((name, id_, values))
+        offset = start + length
+    return records, offset
+
+
+class Journal:
+
+    path = JOURNAL_FILE
+    records = []
+    # (segment, index of its first record) of every replayed segment
+    _segmentStarts = []
+
+    # the journal is split into numbered segments, a checkpoint seals the current one
+    # and only deletes it once the state it covers has been written.
+    _segment = 0
+    _file = None
+    _buffer = bytearray()
+    _commitTask = None
+    _inflight = None
+    _writeLock = Lock()
+
+    appended = 0
+    committed = 0
+    commitCount = 0
+
+    @classmethod
+    def make_segment_path(cls, segment):
+        return f"{cls.path}.{segment}"
+
+    @classmethod
+    def list_segments(cls):
+        folder, name = os.path.split(cls.path)
+        segments = []
+        for fileName in os.listdir(folder):
+            [base, _, suffix] = fileName.rpartition(".")
+            if base == name and suffix.isnumeric():
+                segments.append(int(suffix))
+        return sorted(segments)
+
+    @classmethod
+    def open(cls, path=JOURNAL_FILE):
+        cls.path = path
+        cls.records = []
+        cls._segmentStarts = []
+        segments = cls.list_segments()
+        for segment in segments:
+            with open(cls.make_segment_path(segment), "rb") as file:
+                raw = file.read()
+            records, validSize = decode_records(raw)
+            cls._segmentStarts.append((segment, len(cls.records)))
+            cls.records.extend(records)
+            if validSize < len(raw):
+                Logger.bot.warning(f"dropped {len(raw) - validSize} bytes of torn journal tail")
+
+        cls._segment = segments[-1] + 1 if segments else 0
+        cls._file = open(cls.make_segment_path(cls._segment), "ab")
+        Logger.bot.info(f"opened {path} with {len(cls.records)} records to replay")
+
+        for name in RECORD_KINDS:
+            Event.listen(name, getattr(cls, f"_on_{name}"))
+
+    @classmethod
+    def close(cls):
+        if cls._file:
+            cls._write(bytes(cls._buffer), cls._file)
+            cls._buffer.clear()
+            cls._file.close()
+            cls._file = None
+
+    @classmethod
+    def append(cls, name, id_, *values):
+        if not cls._file:
+            return
+        cls._buffer += encode_record(name, id_, *values)
+        cls.appended += 1
+        if not cls._commitTask:
+            cls._commitTask = create_task(cls._group_commit())
+
+    @classmethod
+    async def _group_commit(cls):
+        while cls._buffer:
+            await sleep(GROUP_COMMIT_DELAY)
+            raw = bytes(cls._buffer)
+            cls._buffer.clear()
+            cls._inflight = create_task(
+                AIOUtil.run("journal.write", cls._write, raw, cls._file))
+            await cls._inflight
+            cls._inflight = None
+        cls._commitTask = None
+
+    @classmethod
+    async def wait_inflight(cls):
+        if cls._inflight:
+            await wait([cls._inflight])
+
+    @classmethod
+    def _write(cls, raw, file):
+        with cls._writeLock:
+            if not raw or file.closed:
+                return
+            file.write(raw)
+            file.flush()
+            os.fsync(file.fileno())
+            cls.committed += len(raw)
+            cls.commitCount += 1
+
+    @classmethod
+    def seal(cls):
+        # must be called in the same step that serializes the state being checkpointed
+        if not cls._file:
+            return None
+        sealed = (cls._segment, cls._file, bytes(cls._buffer))
+        cls._buffer.clear()
+        cls._segment += 1
+        cls._file = open(cls.make_segment_path(cls._segment), "ab")
+        return sealed
+
+    @staticmethod
+    def get_segment(sealed):
+        return sealed[0]
+
+    @classmethod
+    def write_sealed(cls, sealed):
+        segment, file, raw = sealed
+        cls._write(raw, file)
+
+    @classmethod
+    def close_sealed(cls, sealed):
+        segment, file, _ = sealed
+        with cls._writeLock:
+            file.close()
+
+    @classmethod
+    def drop_sealed(cls, sealed):
+        segment = cls.get_segment(sealed)
+        cls.close_sealed(sealed)
+        for prevSegment in cls.list_segments():
+            if prevSegment <= segment:
+                os.remove(cls.make_segment_path(prevSegment))
+        cls.records = []
+        cls._segmentStarts = []
+
+    @classmethod
+    def replay(cls, targetCls, checkpoint=None):
+        # segments up to the checkpoint are already in the saved state of targetCls, they
+        # are left when a crash came between saving it and dropping them.
+        start = 0
+        if checkpoint is not None:
+            start = next((index for segment, index in cls._segmentStarts 
+                if segment > checkpoint), len(cls.records))
+        applied = 0
+        for name, id_, values in cls.records[start:]:
+            if RECORD_KINDS[name][2] is not targetCls:
+                continue
+            if getattr(cls, f"_replay_{name}")(id_, *values) is not False:
+                if id_:
+                    State.mark_rows_dirty(targetCls, ROW_ATTRIBUTES[targetCls], id_)
+                else:
+                    State.mark_dirty(targetCls)
+                applied += 1
+        if applied:
+            Logger.bot.info(f"replayed {applied} journal records into {targetCls.__name__}")
+        return applied
+
+    @classmethod
+    async def _on_xpChange(cls, id_, diff):
+        cls.append("xpChange", id_, diff, Statistic.stats[id_].xp.real)
+
+    @classmethod
+    async def _on_emeraldChange(cls, id_, diff):
+        cls.append("emeraldChange", id_, diff, Statistic.stats[id_].emerald.real)
+
+    @classmethod
+    async def _on_warIncrement(cls, id_, diff):
+        cls.append("warIncrement", id_)
+
+    @classmethod
+    async def _on_onlineTimeAccumulate(cls, id_, dt):
+        cls.append("onlineTimeAccumulate", id_, dt.total_seconds())
+
+    @classmethod
+    async def _on_offline(cls, id_, prev):
+        cls.append("offline", id_)
+
+    @classmethod
+    async def _on_memberStatusChange(cls, id_, prevStatus):
+        cls.append("memberStatusChange", id_, STATUSES.index(GuildMember.members[id_].status))
+
+    @classmethod
+    async def _on_biweeklyReset(cls):
+        cls.append("biweeklyReset", None)
+
+    @classmethod
+    async def _on_memberAdd(cls, id_):
+        cls.append("memberAdd", id_, PickleUtil.dumps(GuildMember.members[id_]))
+
+    @classmethod
+    async def _on_memberAltAdd(cls, id_, altId):
+        cls.append("memberAltAdd", altId, encode_text(id_))
+
+    @classmethod
+    async def _on_memberAltRemove(cls, prevOwnerId, id_):
+        cls.append("memberAltRemove", id_)
+
+    @classmethod
+    async def _on_memberDiscordChange(cls, id_, prevDiscordId):
+        cls.append("memberDiscordChange", id_, GuildMember.members[id_].discordId or 0)
+
+    @classmethod
+    async def _on_memberRankChange(cls, id_, prevRank):
+        cls.append("memberRankChange", id_, encode_text(GuildMember.members[id_].rank))
+
+    @classmethod
+    async def _on_memberVRankChange(cls, id_, prevVRank):
+        cls.append("memberVRankChange", id_, encode_text(GuildMember.members[id_].vRank))
+
+    @classmethod
+    async def _on_memberIgnChange(cls, id_, prevIgn):
+        cls.append("memberIgnChange", id_, encode_text(GuildMember.members[id_].ign))
+
+    @staticmethod
+    def _has_stat(id_):
+        # members added since the last save get their stat back with them
+        if id_ not in Statistic.stats and id_ in GuildMember.members:
+            Statistic.stats[id_] = Statistic(id_)
+        return id_ in Statistic.stats
+
+    @classmethod
+    def _replay_contribution(cls, name, id_, diff, real):
+        if not cls._has_stat(id_):
+            return False
+        accumulator = getattr(Statistic.stats[id_], name)
+        accumulator.accumulate(diff)
+        accumulator.real = real
+
+    @classmethod
+    def _replay_xpChange(cls, id_, diff, real):
+        return cls._replay_contribution("xp", id_, diff, real)
+
+    @classmethod
+    def _replay_emeraldChange(cls, id_, diff, real):
+        return cls._replay_contribution("emerald", id_, diff, real)
+
+    @classmethod
+    def _replay_warIncrement(cls, id_):
+        if not cls._has_stat(id_):
+            return False
+        Statistic.stats[id_].war.accumulate(1)
+
+    @classmethod
+    def _replay_onlineTimeAccumulate(cls, id_, seconds):
+        if not cls._has_stat(id_):
+            return False
+        Statistic.stats[id_].onlineTime.accumulate(timedelta(seconds=seconds))
+
+    @classmethod
+    def _replay_offline(cls, id_):
+        if not cls._has_stat(id_):
+            return False
+        Statistic.stats[id_].onlineTime.reset_entry("curr")
+
+    @staticmethod
+    def _replay_memberStatusChange(id_, status):
+        if id_ not in GuildMember.members:
+            return False
+        GuildMember.members[id_].status = STATUSES[status]
+
+    @staticmethod
+    def _replay_memberAdd(id_, raw):
+        if id_ in GuildMember.members:
+            return False
+        GuildMember.members[id_] = pickle.loads(raw)
+
+    @staticmethod
+    def _replay_member_field(id_, attr, val):
+        if id_ not in GuildMember.members:
+            return False
+        setattr(GuildMember.members[id_], attr, val)
+
+    @classmethod
+    def _replay_memberAltAdd(cls, id_, rawOwnerId):
+        return cls._replay_member_field(id_, "ownerId", decode_text(rawOwnerId))
+
+    @classmethod
+    def _replay_memberAltRemove(cls, id_):
+        return cls._replay_member_field(id_, "ownerId", None)
+
+    @classmethod
+    def _replay_memberDiscordChange(cls, id_, discordId):
+        return cls._replay_member_field(id_, "discordId", discordId or None)
+
+    @classmethod
+    def _replay_memberRankChange(cls, id_, rawRank):
+        return cls._replay_member_field(id_, "rank", decode_text(rawRank))
+
+    @classmethod
+    def _replay_memberVRankChange(cls, id_, rawVRank):
+        return cls._replay_member_field(id_, "vRank", decode_text(rawVRank))
+
+    @classmethod
+    def _replay_memberIgnChange(cls, id_, rawIgn):
+        return cls._replay_member_field(id_, "ign", decode_text(rawIgn))
+
+    @staticmethod
+    def _replay_biweeklyReset(id_):
+        for stat in Statistic.stats.values():
+            stat._reset_biweekly()
+
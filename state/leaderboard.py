@@ -0,0 +1,186 @@
+from bisect import bisect_left, insort
+from heapq import merge
+from typing import Callable, Dict, List
+
+
+BUCKET_SIZE = 128  # buckets are split once they grow to twice this size
+# past 1 / BULK_UPDATE_RATIO of the entries changed, one merge pass beats moving them one by one
+BULK_UPDATE_RATIO = 8
+
+
+class Leaderboard:
+    # ids ordered by a value, highest first. Entries are kept in sorted buckets with a
+    # fenwick tree over the bucket sizes, so updating an entry, finding the rank of an id
+    # and reading a rank are O(log n).
+
+    def __init__(self, valueGetter: Callable, ids=()):
+        self._get_value = valueGetter
+        # id -> (negated value, sequence number, id), ties keep the order they were placed in
+        self._keys: Dict[str, tuple] = {}
+        self._buckets: List[list] = []
+        self._maxes = []
+        self._tree = []
+        self._seq = 0
+        self.isSorted = True
+        self.load(ids)
+
+    def load(self, ids):
+        # ids are taken as the current order, only sorted when that is no longer right.
+        # also used to re-key every entry after their values changed all at once.
+        self._keys = {}
+        keys = []
+        for id_ in dict.fromkeys(ids):
+            keys.append(self._make_key(id_))
+            self._keys[id_] = keys[-1]
+        self.isSorted = all(prev < curr for prev, curr in zip(keys, keys[1:]))
+        if not self.isSorted:
+            keys.sort()
+        self._buckets = [keys[i:i + BUCKET_SIZE] for i in range(0, len(keys), BUCKET_SIZE)]
+        self._rebuild_index()
+
+    def _make_key(self, id_):
+        self._seq += 1
+        return (-self._get_value(id_), self._seq, id_)
+
+    def _rebuild_index(self):
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        size = len(self._buckets)
+        self._tree = [len(bucket) for bucket in self._buckets]
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                self._tree[parent - 1] += self._tree[i - 1]
+
+    def _tree_add(self, bucketIndex, delta):
+        i = bucketIndex + 1
+        while i <= len(self._tree):
+            self._tree[i - 1] += delta
+            i += i & -i
+
+    def _prefix(self, bucketIndex):
+        # number of entries in the buckets before bucketIndex
+        total = 0
+        i = bucketIndex
+        while i > 0:
+            total += self._tree[i - 1]
+            i -= i & -i
+        return total
+
+    def _locate(self, rank):
+        # bucket index and offset of the entry at the given 0-based rank
+        bucketIndex = 0
+        bit = 1 << len(self._tree).bit_length()
+        while bit:
+            nextIndex = bucketIndex + bit
+            if nextIndex <= len(self._tree) and self._tree[nextIndex - 1] <= rank:
+                bucketIndex = nextIndex
+                rank -= self._tree[nextIndex - 1]
+            bit >>= 1
+        return bucketIndex, rank
+
+    def _insert(self, key):
+        if not self._buckets:
+            self._buckets.append([key])
+            self._rebuild_index()
+            return
+        i = min(bisect_left(self._maxes, key), len(self._buckets) - 1)
+        bucket = self._buckets[i]
+        insort(bucket, key)
+        self._maxes[i] = bucket[-1]
+        if len(bucket) >= BUCKET_SIZE * 2:
+            self._buckets[i:i + 1] = [bucket[:BUCKET_SIZE], bucket[BUCKET_SIZE:]]
+            self._rebuild_index()
+        else:
+            self._tree_add(i, 1)
+
+    def _delete(self, key):
+        i = bisect_left(self._maxes, key)
+        bucket = self._buckets[i]
+        del bucket[bisect_left(bucket, key)]
+        if bucket:
+            self._maxes[i] = bucket[-1]
+            self._tree_add(i, -1)
+        else:
+            del self._buckets[i]
+            self._rebuild_index()
+
+    def add(self, id_):
+        if id_ in self._keys:
+            self.update(id_)
+            return
+        self._keys[id_] = self._make_key(id_)
+        self._insert(self._keys[id_])
+
+    def remove(self, id_):
+        self._delete(self._keys.pop(id_))
+
+    def update(self, id_):
+        # moves the id behind every entry of the same value, like a fresh insert
+        self._delete(self._keys[id_])
+        self._keys[id_] = self._make_key(id_)
+        self._insert(self._keys[id_])
+
+    def update_many(self, ids):
+        # same as updating (or adding) each id once, in order, ties end up in that order too
+        ids = list(dict.fromkeys(ids))
+        if len(ids) * BULK_UPDATE_RATIO < len(self):
+            for id_ in ids:
+                self.add(id_)
+            return
+        changed = set(ids)
+        kept = [key for bucket in self._buckets for key in bucket if key[2] not in changed]
+        for id_ in ids:
+            self._keys[id_] = self._make_key(id_)
+        keys = list(merge(kept, sorted(self._keys[id_] for id_ in ids)))
+        self._buckets = [keys[i:i + BUCKET_SIZE] for i in range(0, len(keys), BUCKET_SIZE)]
+        self._rebuild_index()
+
+    def index(self, id_):
+        if id_ not in self._keys:
+            raise ValueError(f"{id_} is not in leaderboard")
+        key = self._keys[id_]
+        i = bisect_left(self._maxes, key)
+        return self._prefix(i) + bisect_left(self._buckets[i], key)
+
+    def __getitem__(self, rank):
+        if isinstance(rank, slice):
+            start, stop, step = rank.indices(len(self))
+            if step != 1:
+                return list(self)[rank]
+            return list(self._iter_from(start, stop - start))
+        if rank < 0:
+            rank += len(self)
+        if not 0 <= rank < len(self):
+            raise IndexError("leaderboard index out of range")
+        bucketIndex, offset = self._locate(rank)
+        return self._buckets[bucketIndex][offset][2]
+
+    def _iter_from(self, rank, count):
+        if count <= 0:
+            return
+        bucketIndex, offset = self._locate(rank)
+        for bucket in self._buckets[bucketIndex:]:
+            for key in bucket[offset:offset + count]:
+                yield key[2]
+                count -= 1
+            if not count:
+                return
+            offset = 0
+
+    def __iter__(self):
+        for bucket in self._buckets:
+            for key in bucket:
+                yield key[2]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, id_):
+        return id_ in self._keys
+
+    def __repr__(self):
+        return f"<Leaderboard {list(self)}>"
+
+    def __reduce__(self):
+        # stored as a plain list of ids, the order is checked against the values on load
+        return list, (list(self),)
@@ -0,0 +1,83 @@
+from datetime import timedelta
+from typing import Dict
+
+
+FIELD_TITLES = {"biweek": "Bi-Weekly", "total": "Total", "curr": "Current"}
+
+
+class Metric:
+    # one tracked stat. Statistic builds its accumulators, leader boards, resets and events
+    # from these, snapshots and ]lb read them to store and render every metric the same way.
+
+    # a running sum of the diffs it is given
+    COUNTER = "counter"
+    # follows an ever growing value read from the api, see Statistic.ContributionAccumulator
+    CONTRIBUTION = "contribution"
+
+    registry: Dict[str, "Metric"] = {}
+
+    def __init__(self, name, kind, fields, lbs, event, title, valType=int, resets=("biweek",),
+                 snapFields=None, aliases=(), titles=None, legacyPaths=None):
+        self.name = name
+        self.kind = kind
+        # entries of the accumulator
+        self.fields = fields
+        # field -> name of its leader board on Statistic
+        self.lbs = lbs
+        # broadcast with (id, diff) whenever the metric changes
+        self.event = event
+        self.title = title
+        self.valType = valType
+        # fields cleared on the bi-weekly reset
+        self.resets = resets
+        # fields stored in snapshots, with their leader boards
+        self.snapFields = snapFields if snapFields is not None else tuple(lbs)
+        self.aliases = aliases
+        self.titles = titles or {}
+        # field -> where the output of its command is in version 1 snapshots
+        self.legacyPaths = legacyPaths or {}
+
+    def __repr__(self):
+        return f"<Metric {self.name}>"
+
+    @classmethod
+    def register(cls, *args, **kwargs):
+        metric = cls(*args, **kwargs)
+        cls.registry[metric.name] = metric
+        return metric
+
+    @classmethod
+    def get(cls, name):
+        for metric in cls.registry.values():
+            if name == metric.name or name in metric.aliases:
+                return metric
+        return None
+
+    @classmethod
+    def get_names(cls):
+        return tuple(name for metric in cls.registry.values()
+            for name in (metric.name, *metric.aliases))
+
+    def make_lb_title(self, field):
+        if field in self.titles:
+            return self.titles[field]
+        return f"{FIELD_TITLES.get(field, field)} {self.title} Leader Board"
+
+
+# the order of fields here is the order of stat tuples and leader boards in snapshots,
+# new metrics go at the end.
+Metric.register("xp", Metric.CONTRIBUTION, ("total", "biweek"),
+    {"biweek": "xpLb", "total": "xpTotalLb"}, "xpChange", "XP",
+    legacyPaths={"biweek": ("XPTracker", False), "total": ("XPTracker", True)})
+Metric.register("emerald", Metric.CONTRIBUTION, ("total", "biweek"),
+    {"biweek": "emeraldLb", "total": "emeraldTotalLb"}, "emeraldChange", "Emerald",
+    aliases=("em",),
+    legacyPaths={"biweek": ("EmeraldTracker", False), "total": ("EmeraldTracker", True)})
+Metric.register("war", Metric.COUNTER, ("biweek", "total"),
+    {"biweek": "warLb", "total": "warTotalLb"}, "warIncrement", "War", aliases=("wc",),
+    legacyPaths={"biweek": ("WarTracker", False), "total": ("WarTracker", True)})
+# the current session is cleared when the member goes offline
+Metric.register("onlineTime", Metric.COUNTER, ("biweek", "curr"),
+    {"biweek": "onlineTimeBwLb", "curr": "onlineTimeLb"}, "onlineTimeAccumulate", "Activity",
+    valType=timedelta, snapFields=("biweek",), aliases=("act",),
+    titles={"biweek": "Activities"}, legacyPaths={"biweek": ("ActivityTracker",)})
@@ -0,0 +1,57 @@
+from time import time
+
+from state.state import State
+
+
+ID_TTL = 7 * 24 * 3600  # in seconds
+IGN_TTL = 24 * 3600  # in seconds
+NEGATIVE_TTL = 3600  # in seconds
+
+
+@State.register("ids", "igns", tracked=True)
+class PlayerCache:
+
+    MISS = object()
+
+    # lower case ign -> (id or None, expire time)
+    ids = {}
+    # id -> (ign or None, expire time)
+    igns = {}
+
+    @classmethod
+    async def __loaded__(cls):
+        curr = time()
+        cls.ids = {k: v for k, v in cls.ids.items() if v[1] > curr}
+        cls.igns = {k: v for k, v in cls.igns.items() if v[1] > curr}
+
+    @classmethod
+    def get_id(cls, ign):
+        return cls._get(cls.ids, ign.lower())
+
+    @classmethod
+    def get_ign(cls, id_):
+        return cls._get(cls.igns, id_)
+
+    @classmethod
+    def set_id(cls, ign, id_):
+        cls.ids[ign.lower()] = (id_, time() + (ID_TTL if id_ else NEGATIVE_TTL))
+        if id_:
+            cls.igns[id_] = (ign, time() + IGN_TTL)
+        State.mark_dirty(cls)
+
+    @classmethod
+    def set_ign(cls, id_, ign):
+        cls.igns[id_] = (ign, time() + (IGN_TTL if ign else NEGATIVE_TTL))
+        if ign:
+            cls.ids[ign.lower()] = (id_, time() + ID_TTL)
+        State.mark_dirty(cls)
+
+    @staticmethod
+    def _get(cache, key):
+        entry = cache.get(key, None)
+        if not entry:
+            return PlayerCache.MISS
+        if entry[1] <= time():
+            del cache[key]
+            return PlayerCache.MISS
+        return entry[0]
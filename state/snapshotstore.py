@@ -0,0 +1,208 @@
+from datetime import datetime
+from struct import Struct
+from typing import Dict
+import lzma
+import os
+import pickle
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from util.pickleutil import PickleUtil
+
+
+SNAPSHOT_FOLDER = "./snapshot/"
+ARCHIVE_FOLDER = "./snapshot/archive/"
+LEGACY_FOLDER = "./snapshot/legacy/"
+INDEX_FILE = "./snapshot/snapshot.index"
+
+SNAPSHOT_EXT = ".snap"
+ARCHIVE_EXT = ".archive"
+LEGACY_EXT = ".snapshot"
+
+CODEC_LZMA = 0
+CODEC_ZSTD = 1
+DEFAULT_CODEC = CODEC_ZSTD if zstandard else CODEC_LZMA
+LZMA_PRESET = 6
+ZSTD_LEVEL = 10
+
+# a snapshot is a run of separately compressed parts followed by their table of contents
+# and this footer, which lets the index be rebuilt by walking a file from its end.
+FOOTER = Struct("<4sBQQ")  # magic, codec, toc offset, snapshot length
+MAGIC = b"SNAP"
+
+
+def compress(raw: bytes, codec) -> bytes:
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return lzma.compress(raw, preset=LZMA_PRESET)
+
+
+def decompress(raw: bytes, codec) -> bytes:
+    if codec == CODEC_ZSTD:
+        if not zstandard:
+            raise RuntimeError("zstandard is required to read this snapshot")
+        return zstandard.ZstdDecompressor().decompress(raw)
+    return lzma.decompress(raw)
+
+
+def parse_snapshot_id(snapId):
+    lower, upper = snapId.split("-")
+    return (datetime.strptime(lower, "%Y.%m.%d").date(),
+        datetime.strptime(upper, "%Y.%m.%d").date())
+
+
+def encode_snapshot(snapId, parts: dict, info: dict, codec=DEFAULT_CODEC):
+    raw = bytearray()
+    offsets = {}
+    for name, part in parts.items():
+        compressed = compress(PickleUtil.dumps(part), codec)
+        offsets[name] = (len(raw), len(compressed))
+        raw += compressed
+
+    toc = {**info, "id": snapId, "range": parse_snapshot_id(snapId), "parts": offsets}
+    tocOffset = len(raw)
+    raw += compress(PickleUtil.dumps(toc), codec)
+    raw += FOOTER.pack(MAGIC, codec, tocOffset, len(raw) + FOOTER.size)
+    return bytes(raw), toc
+
+
+def read_tocs(path):
+    # walks the snapshots of a file from its end, newest first
+    tocs = []
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        while end >= FOOTER.size:
+            f.seek(end - FOOTER.size)
+            magic, codec, tocOffset, length = FOOTER.unpack(f.read(FOOTER.size))
+            if magic != MAGIC or length > end:
+                break
+            start = end - length
+            f.seek(start + tocOffset)
+            toc = pickle.loads(decompress(f.read(length - FOOTER.size - tocOffset), codec))
+            tocs.append(make_entry(toc, path, start, length, codec))
+            end = start
+    return tocs
+
+
+def make_entry(toc, path, offset, size, codec):
+    return {**toc, "file": path, "offset": offset, "size": size, "codec": codec}
+
+
+class SnapshotStore:
+
+    # snapshot id -> index entry, which is the table of contents of the snapshot plus where it is
+    index: Dict[str, dict] = {}
+
+    @classmethod
+    def load_index(cls):
+        os.makedirs(ARCHIVE_FOLDER, exist_ok=True)
+        try:
+            index = PickleUtil.load(INDEX_FILE, {})
+        except Exception:
+            index = None
+
+        # a crash between writing a snapshot and the index leaves it unindexed
+        if index is not None:
+            files = {e["file"] for e in index.values()}
+            snapFiles = {SNAPSHOT_FOLDER + f for f in os.listdir(SNAPSHOT_FOLDER)
+                if f.endswith(SNAPSHOT_EXT)}
+            if files.issuperset(snapFiles) and all(map(os.path.isfile, files)):
+                return index, False
+        return cls.rebuild_index(), True
+
+    @classmethod
+    def rebuild_index(cls):
+        index = {}
+        paths = [ARCHIVE_FOLDER + f for f in sorted(os.listdir(ARCHIVE_FOLDER))
+            if f.endswith(ARCHIVE_EXT)]
+        paths += [SNAPSHOT_FOLDER + f for f in sorted(os.listdir(SNAPSHOT_FOLDER))
+            if f.endswith(SNAPSHOT_EXT)]
+        for path in paths:
+            # an archive can hold the same snapshot twice after a cut compaction
+            for entry in reversed(read_tocs(path)):
+                index[entry["id"]] = entry
+        return index
+
+    @classmethod
+    def set_index(cls, index):
+        cls.index = dict(sorted(index.items()))
+
+    @classmethod
+    def dump_index(cls) -> bytes:
+        return PickleUtil.dumps(cls.index)
+
+    @staticmethod
+    def write_index(raw: bytes):
+        return PickleUtil.write(INDEX_FILE, raw)
+
+    @staticmethod
+    def make_path(snapId):
+        return SNAPSHOT_FOLDER + snapId + SNAPSHOT_EXT
+
+    @classmethod
+    def write(cls, snapId, raw: bytes, toc: dict):
+        path = cls.make_path(snapId)
+        PickleUtil.write(path, raw)
+        return make_entry(toc, path, 0, len(raw), DEFAULT_CODEC)
+
+    @classmethod
+    def add(cls, entry):
+        cls.index[entry["id"]] = entry
+        cls.set_index(cls.index)
+
+    @staticmethod
+    def read_part(entry, name):
+        if name not in entry["parts"]:
+            return None
+        offset, length = entry["parts"][name]
+        with open(entry["file"], "rb") as f:
+            f.seek(entry["offset"] + offset)
+            return pickle.loads(decompress(f.read(length), entry["codec"]))
+
+    @classmethod
+    def get_compactable(cls, year):
+        # snapshots of bi-weeks that ended before the given year and are still in their own file
+        return [e for e in cls.index.values()
+            if e["range"][1].year < year and not e["file"].endswith(ARCHIVE_EXT)]
+
+    @staticmethod
+    def compact(entries):
+        moved = []
+        for entry in entries:
+            path = ARCHIVE_FOLDER + str(entry["range"][1].year) + ARCHIVE_EXT
+            with open(entry["file"], "rb") as f:
+                raw = f.read()
+            with open(path, "ab") as f:
+                offset = f.tell()
+                f.write(raw)
+                f.flush()
+                os.fsync(f.fileno())
+            moved.append({**entry, "file": path, "offset": offset})
+        return moved
+
+    @staticmethod
+    def remove_files(entries):
+        for entry in entries:
+            if os.path.isfile(entry["file"]):
+                os.remove(entry["file"])
+
+    @classmethod
+    def migrate_legacy(cls, split):
+        # converts whole pickled snapshots, split maps their data to (parts, info)
+        migrated = []
+        for f in sorted(os.listdir(SNAPSHOT_FOLDER)):
+            if not f.endswith(LEGACY_EXT):
+                continue
+            snapId = f[:-len(LEGACY_EXT)]
+            legacyPath = SNAPSHOT_FOLDER + f
+            with open(legacyPath, "rb") as file:
+                data = pickle.load(file)
+            raw, toc = encode_snapshot(snapId, *split(data))
+            migrated.append(cls.write(snapId, raw, toc))
+            # kept as a backup, a bad conversion can still be redone from it
+            os.makedirs(LEGACY_FOLDER, exist_ok=True)
+            os.replace(legacyPath, LEGACY_FOLDER + f)
+        return migrated
@@ -0,0 +1,108 @@
+from typing import List, Tuple
+import sqlite3
+from threading import RLock
+import pickle
+
+from logger import Logger
+from util.pickleutil import PickleUtil
+
+
+DATABASE_FILE = "./data/state.db"
+
+
+class SQLiteStore:
+
+    def __init__(self, path=DATABASE_FILE):
+        self.path = path
+        # shared by the io threads, every access goes through the lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = RLock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs (name TEXT PRIMARY KEY, data BLOB NOT NULL)")
+        self._conn.commit()
+        Logger.bot.debug(f"opened sqlite store {path}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def backup(self):
+        # consistent copy that includes pages still sitting in the WAL file
+        backupFile = self.path + ".backup"
+        dest = sqlite3.connect(backupFile)
+        with self._lock:
+            self._conn.backup(dest)
+        dest.close()
+        return backupFile
+
+    @staticmethod
+    def make_table_name(targetCls, attr):
+        return f"{targetCls.__name__}_{attr}"
+
+    def ensure_table(self, table):
+        self._conn.execute(
+            f'CREATE TABLE IF NOT EXISTS "{table}" (id TEXT PRIMARY KEY, data BLOB NOT NULL)')
+
+    def load_rows(self, table) -> dict:
+        return {id_: pickle.loads(data) for id_, data in self.get_rows(table)}
+
+    def get_rows(self, table) -> List[Tuple[str, bytes]]:
+        # fetched at once, a cursor held open would keep the lock from the writers
+        with self._lock:
+            self.ensure_table(table)
+            return self._conn.execute(
+                f'SELECT id, data FROM "{table}" ORDER BY id').fetchall()
+
+    def get_row(self, table, id_):
+        with self._lock:
+            self.ensure_table(table)
+            row = self._conn.execute(
+                f'SELECT data FROM "{table}" WHERE id = ?', (id_,)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def save_rows(self, table, rows: dict, keys=None):
+        upserts, removed = self.dump_rows(rows, keys)
+        return self.write_rows(table, upserts, removed, keys is None)
+
+    @staticmethod
+    def dump_rows(rows: dict, keys=None):
+        # keys=None dumps every row, keys missing from rows are deleted.
+        if keys is None:
+            keys = rows.keys()
+        upserts = [(k, PickleUtil.dumps(rows[k])) for k in keys if k in rows]
+        removed = [(k,) for k in keys if k not in rows]
+        return upserts, removed
+
+    def write_rows(self, table, upserts, removed=(), replaceAll=False):
+        return self.write_batch([(table, upserts, removed, replaceAll)])
+
+    def write_batch(self, tables, blobs=()):
+        # rows of several tables and blobs in one transaction, a crash keeps all or none
+        written = 0
+        with self._lock, self._conn:
+            for table, upserts, removed, replaceAll in tables:
+                self.ensure_table(table)
+                if replaceAll:
+                    self._conn.execute(f'DELETE FROM "{table}"')
+                self._conn.executemany(
+                    f'INSERT OR REPLACE INTO "{table}" (id, data) VALUES (?, ?)', upserts)
+                self._conn.executemany(f'DELETE FROM "{table}" WHERE id = ?', removed)
+                written += sum(len(data) for _, data in upserts)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO blobs (name, data) VALUES (?, ?)", blobs)
+            written += sum(len(raw) for _, raw in blobs)
+        return written
+
+    def load_blob(self, name):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM blobs WHERE name = ?", (name,)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def save_blob(self, name, raw: bytes):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blobs (name, data) VALUES (?, ?)", (name, raw))
+        return len(raw)
@@ -1,28 +1,104 @@
+from asyncio import gather
+
 from logger import Logger
 from util.pickleutil import PickleUtil
+from util.aioutil import AIOUtil
+
+
+# the last journal segment a saved class already includes, saved in the same write as it
+CHECKPOINT_KEY = "__checkpoint__"
+CHECKPOINT_SUFFIX = ".checkpoint"
 
 
 class State:
 
     registry = {}
+    # classes that report their own changes through mark_dirty().
+    trackedClasses = set()
+    # attributes that are dicts of rows, stored row by row when a store is in use.
+    rowAttributes = {}
+    store = None
+    journal = None
+
+    # targetCls -> {row attribute: set of dirty keys, or None when every row is dirty}.
+    # a class is in it once anything of it changed, its other attributes are always
+    # serialized together so they aren't tracked one by one.
+    _dirty = {}
+    _digests = {}
 
     @classmethod
-    def register(cls, *attributes):
+    def register(cls, *attributes, tracked=False, rows=()):
         def wrapper(targetCls):
             cls.registry[targetCls] = attributes
+            if tracked or rows:
+                cls.trackedClasses.add(targetCls)
+            if rows:
+                cls.rowAttributes[targetCls] = set(rows)
             return targetCls
         return wrapper
+
+    @classmethod
+    def use_store(cls, store):
+        Logger.bot.info(f"using {store.path} as state store")
+        cls.store = store
+    
+    @classmethod
+    def use_journal(cls, journal):
+        cls.journal = journal
+    
+    @classmethod
+    def mark_dirty(cls, targetCls, *attributes):
+        dirty = cls._dirty.setdefault(targetCls, {})
+        rowAttrs = cls.rowAttributes.get(targetCls, ())
+        for attr in attributes or cls.registry[targetCls]:
+            if attr in rowAttrs:
+                dirty[attr] = None
+    
+    @classmethod
+    def mark_rows_dirty(cls, targetCls, attribute, *keys):
+        if targetCls not in cls._dirty:
+            cls._dirty[targetCls] = {}
+        dirtyKeys = cls._dirty[targetCls].setdefault(attribute, set())
+        if dirtyKeys is not None:
+            dirtyKeys.update(keys)
     
     @classmethod
     def make_file_path(cls, targetCls):
         return f"./data/{targetCls.__name__}.data"
 
+    @classmethod
+    def is_stored(cls, targetCls):
+        return cls.store is not None and targetCls in cls.rowAttributes
+
     @classmethod
     async def load(cls, targetCls):
-        dataFile = cls.make_file_path(targetCls)
-        Logger.bot.debug(f"Loading {dataFile}")
+        await cls._apply_loaded(targetCls, await cls._read(targetCls))
+
+    @classmethod
+    async def load_all(cls, *targetClasses):
+        # reading runs in parallel, applying keeps the given order since __loaded__ hooks
+        # may depend on classes before them.
+        attrMaps = await gather(*map(cls._read, targetClasses))
+        for targetCls, attrMap in zip(targetClasses, attrMaps):
+            await cls._apply_loaded(targetCls, attrMap)
+
+    @classmethod
+    async def _read(cls, targetCls):
+        if cls.is_stored(targetCls):
+            Logger.bot.debug(f"Loading {targetCls.__name__} from {cls.store.path}")
+            attrMap = await AIOUtil.run("store.load", cls._load_from_store, targetCls)
+            if attrMap is None:
+                Logger.bot.info(f"{targetCls.__name__} is not in the store yet, importing")
+                attrMap = await AIOUtil.run("store.import", cls.import_pickle, targetCls)
+        else:
+            dataFile = cls.make_file_path(targetCls)
+            Logger.bot.debug(f"Loading {dataFile}")
+            attrMap = await AIOUtil.run("state.load", PickleUtil.load, dataFile)
+        return attrMap
 
-        attrMap = PickleUtil.load(dataFile)
+    @classmethod
+    async def _apply_loaded(cls, targetCls, attrMap):
+        checkpoint = attrMap.pop(CHECKPOINT_KEY, None) if attrMap else None
         if attrMap:
             Logger.bot.debug(f"data found: {attrMap}")
 
@@ -32,14 +108,178 @@ class State:
         else:
             Logger.bot.debug(f"data not found")
         
+        if cls.journal:
+            cls.journal.replay(targetCls, checkpoint)
+
         if hasattr(targetCls, "__loaded__"):
             await getattr(targetCls, "__loaded__")()
     
+    @classmethod
+    def _load_from_store(cls, targetCls):
+        # the blob of non-row attributes doubles as the marker of an imported class.
+        attrMap = cls.store.load_blob(targetCls.__name__)
+        if attrMap is None:
+            return None
+        for attr in cls.rowAttributes[targetCls]:
+            table = cls.store.make_table_name(targetCls, attr)
+            attrMap[attr] = cls.store.load_rows(table)
+        attrMap[CHECKPOINT_KEY] = cls.store.load_blob(targetCls.__name__ + CHECKPOINT_SUFFIX)
+        return attrMap
+    
+    @classmethod
+    def import_pickle(cls, targetCls):
+        attrMap = PickleUtil.load(cls.make_file_path(targetCls)) or {}
+        for attr in cls.rowAttributes[targetCls]:
+            table = cls.store.make_table_name(targetCls, attr)
+            cls.store.save_rows(table, attrMap.get(attr, {}))
+        cls._write_blob(targetCls, *cls._dump_blob(targetCls))
+        Logger.bot.info(f"imported {targetCls.__name__} into {cls.store.path}")
+        return attrMap
+    
     @classmethod
     def save(cls):
+        jobs, sealed = cls.prepare_save()
+        written = 0
+        failed = False
+        for op, restore, func, *args in jobs:
+            try:
+                written += func(*args) or 0
+            except Exception as e:
+                failed = True
+                cls._on_job_failed(op, restore, e)
+        if sealed and failed:
+            cls.journal.close_sealed(sealed)
+        elif sealed:
+            cls.journal.drop_sealed(sealed)
+        return written
+    
+    @classmethod
+    async def save_async(cls):
+        jobs, sealed = cls.prepare_save()
+        if cls.journal:
+            await cls.journal.wait_inflight()
+        written = 0
+        failed = False
+        for op, restore, func, *args in jobs:
+            try:
+                written += await AIOUtil.run(op, func, *args) or 0
+            except Exception as e:
+                failed = True
+                cls._on_job_failed(op, restore, e)
+        # the sealed segment is only dropped once everything it covers has been written,
+        # otherwise it is kept and replayed into the classes that failed.
+        if sealed and failed:
+            cls.journal.close_sealed(sealed)
+        elif sealed:
+            await AIOUtil.run("journal.checkpoint", cls.journal.drop_sealed, sealed)
+        return written
+    
+    @classmethod
+    def _on_job_failed(cls, op, restore, e):
+        Logger.bot.error(f"failed {op} of {restore[0].__name__ if restore else 'journal'}: {e!r}")
+        if not restore:
+            return
+        # the changes are marked dirty again so the next save writes them
+        targetCls, dirty = restore
+        currDirty = cls._dirty.setdefault(targetCls, {})
+        for attr, keys in dirty.items():
+            if attr not in currDirty:
+                currDirty[attr] = keys
+            elif currDirty[attr] is None or keys is None:
+                currDirty[attr] = None
+            else:
+                currDirty[attr].update(keys)
+    
+    @classmethod
+    def prepare_save(cls):
+        # everything is serialized here, in one step, so the jobs can run off the event loop
+        # while the state keeps changing. A job is (op, (class, its dirty marks) to restore
+        # if it fails, func, *args).
+        jobs = []
+        sealed = cls.journal.seal() if cls.journal else None
+        checkpoint = None
+        if sealed:
+            jobs.append(("journal.write", None, cls.journal.write_sealed, sealed))
+            checkpoint = cls.journal.get_segment(sealed)
+
         for targetCls, attributes in cls.registry.items():
+            # untracked classes are only written when their serialized data changed.
+            if targetCls in cls.trackedClasses and targetCls not in cls._dirty:
+                continue
+            dirty = cls._dirty.pop(targetCls, {})
+            # only tracked classes are written whenever they changed, so only they can tell
+            # which journal records they include.
+            classCheckpoint = checkpoint if targetCls in cls.trackedClasses else None
+
+            if cls.is_stored(targetCls):
+                jobs.extend(cls._prepare_store_save(targetCls, dirty, classCheckpoint))
+                continue
+
             attrMap = {attr: getattr(targetCls, attr) for attr in attributes \
                 if hasattr(targetCls, attr)}
+            if classCheckpoint is not None:
+                attrMap[CHECKPOINT_KEY] = classCheckpoint
+            raw = PickleUtil.dumps(attrMap)
+            digest = PickleUtil.digest(raw)
+            if cls._digests.get(targetCls) == digest:
+                continue
+
             dataFile = cls.make_file_path(targetCls)
             Logger.bot.debug(f"saving {dataFile} with {attrMap}")
-            PickleUtil.save(dataFile, attrMap)
\ No newline at end of file
+            jobs.append(("state.write", (targetCls, dirty), cls._write_file, targetCls, 
+                dataFile, raw, digest))
+        return jobs, sealed
+    
+    @classmethod
+    def _write_file(cls, targetCls, dataFile, raw, digest):
+        written = PickleUtil.write(dataFile, raw)
+        cls._digests[targetCls] = digest
+        return written
+    
+    @classmethod
+    def _prepare_store_save(cls, targetCls, dirty, checkpoint=None):
+        # the rows, the blob and the checkpoint of a class go into one transaction
+        tables = []
+        rowAttrs = cls.rowAttributes[targetCls]
+        for attr, keys in dirty.items():
+            if attr in rowAttrs and hasattr(targetCls, attr):
+                table = cls.store.make_table_name(targetCls, attr)
+                rows = getattr(targetCls, attr)
+                Logger.bot.debug(f"saving {len(rows) if keys is None else len(keys)} " + \
+                    f"rows into {table}")
+                upserts, removed = cls.store.dump_rows(rows, keys)
+                tables.append((table, upserts, removed, keys is None))
+
+        raw, digest = cls._dump_blob(targetCls)
+        if cls._digests.get(targetCls) == digest:
+            raw = digest = None
+        if not tables and raw is None and checkpoint is None:
+            return []
+        return [("store.write", (targetCls, dirty), cls._write_stored, targetCls, tables, raw,
+            digest, checkpoint)]
+    
+    @classmethod
+    def _dump_blob(cls, targetCls):
+        rowAttrs = cls.rowAttributes[targetCls]
+        attrMap = {attr: getattr(targetCls, attr) for attr in cls.registry[targetCls] \
+            if attr not in rowAttrs and hasattr(targetCls, attr)}
+        raw = PickleUtil.dumps(attrMap)
+        return raw, PickleUtil.digest(raw)
+    
+    @classmethod
+    def _write_stored(cls, targetCls, tables, raw, digest, checkpoint):
+        blobs = []
+        if raw is not None:
+            blobs.append((targetCls.__name__, raw))
+        if checkpoint is not None:
+            blobs.append((targetCls.__name__ + CHECKPOINT_SUFFIX, PickleUtil.dumps(checkpoint)))
+        written = cls.store.write_batch(tables, blobs)
+        if raw is not None:
+            cls._digests[targetCls] = digest
+        return written
+    
+    @classmethod
+    def _write_blob(cls, targetCls, raw, digest):
+        written = cls.store.save_blob(targetCls.__name__, raw)
+        cls._digests[targetCls] = digest
+        return written
@@ -0,0 +1,126 @@
+from datetime import timedelta
+from typing import Dict, List
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+INITIAL_CAPACITY = 256  # member slots, doubled whenever they run out
+TIMEDELTA_UNIT = timedelta(microseconds=1)
+
+
+class ColumnEntries:
+    # the entries of one Accumulator, read from and written to the engine columns.
+    # timedeltas are kept as integer microseconds.
+
+    __slots__ = ("_engine", "_attr", "_fields", "_slot", "_valType")
+
+    def __init__(self, engine, attr, fields, slot, valType):
+        self._engine = engine
+        self._attr = attr
+        self._fields = fields
+        self._slot = slot
+        self._valType = valType
+
+    def __getitem__(self, field):
+        val = int(self._engine.columns[self._attr, field][self._slot])
+        return val * TIMEDELTA_UNIT if self._valType is timedelta else val
+
+    def __setitem__(self, field, val):
+        if field not in self._fields:
+            self._fields += (field,)
+            self._engine.add_column(self._attr, field)
+        if self._valType is timedelta:
+            val //= TIMEDELTA_UNIT
+        self._engine.columns[self._attr, field][self._slot] = val
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __contains__(self, field):
+        return field in self._fields
+
+    def keys(self):
+        return self._fields
+
+    def items(self):
+        return [(field, self[field]) for field in self._fields]
+
+
+class StatEngine:
+    # every accumulator entry of every member in one numpy column per (attribute, field),
+    # indexed by member slot, so guild wide operations run vectorized.
+
+    available = numpy is not None
+
+    def __init__(self):
+        self.slots: Dict[str, int] = {}
+        self.ids: List[str] = []
+        self.valTypes = {}
+        self.capacity = INITIAL_CAPACITY
+        self.columns = {}
+
+    def add_column(self, attr, field):
+        if (attr, field) not in self.columns:
+            self.columns[attr, field] = numpy.zeros(self.capacity, dtype=numpy.int64)
+
+    def bind(self, stat, *attrs):
+        # moves the entries of the given accumulators into the columns
+        if stat.id not in self.slots:
+            if len(self.ids) == self.capacity:
+                self._grow()
+            self.slots[stat.id] = len(self.ids)
+            self.ids.append(stat.id)
+        slot = self.slots[stat.id]
+
+        for attr in attrs:
+            accumulator = getattr(stat, attr)
+            values = accumulator.entries.items()
+            self.valTypes[attr] = accumulator.valType
+            accumulator.entries = ColumnEntries(self, attr, (), slot, accumulator.valType)
+            for field, val in values:
+                accumulator.entries[field] = val
+
+    def _grow(self):
+        self.capacity *= 2
+        for key, column in self.columns.items():
+            grown = numpy.zeros(self.capacity, dtype=numpy.int64)
+            grown[:len(column)] = column
+            self.columns[key] = grown
+
+    def column(self, attr, field):
+        return self.columns[attr, field][:len(self.ids)]
+
+    def _to_value(self, attr, val):
+        return int(val) * TIMEDELTA_UNIT if self.valTypes[attr] is timedelta else int(val)
+
+    def reset(self, attr, field):
+        if (attr, field) in self.columns:
+            self.columns[attr, field][:len(self.ids)] = 0
+
+    def total(self, attr, field):
+        return self._to_value(attr, self.column(attr, field).sum())
+
+    def percentile(self, id_, attr, field):
+        column = self.column(attr, field)
+        return float(numpy.count_nonzero(column < column[self.slots[id_]]) * 100 / len(column))
+
+    def order(self, attr, field):
+        # ids from the highest value, ties in slot order
+        ranked = numpy.argsort(-self.column(attr, field), kind="stable")
+        return [self.ids[slot] for slot in ranked.tolist()]
+
+    def rows(self, fields):
+        # id -> values of the given (attribute, field) pairs, timedeltas in seconds
+        columns = []
+        for attr, field in fields:
+            column = self.column(attr, field)
+            if self.valTypes[attr] is timedelta:
+                column = column / (timedelta(seconds=1) // TIMEDELTA_UNIT)
+            columns.append(column.tolist())
+        return dict(zip(self.ids, zip(*columns)))
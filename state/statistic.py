@@ -1,79 +1,133 @@
+from contextlib import asynccontextmanager
 from datetime import timedelta
-import bisect
+from itertools import groupby
 
 from logger import Logger
 from event import Event
 from state.guildmember import GuildMember
+from state.leaderboard import Leaderboard
+from state.statengine import StatEngine
+from state.metric import Metric
 from state.state import State
 
 
-@State.register("stats")
+METRICS = Metric.registry
+# leader board -> the stat it is sorted by
+LB_FIELDS = {lbName: (metric.name, field) for metric in METRICS.values() 
+    for field, lbName in metric.lbs.items()}
+ACCUMULATORS = tuple(METRICS)
+
+
+@State.register("stats", *LB_FIELDS, rows=("stats",))
 class Statistic:
 
     stats = {}
 
-    xpLb = []
-    warLb = []
-    emeraldLb = []
+    # every leader board of LB_FIELDS is a class attribute, set below the class
 
-    xpTotalLb = []
-    warTotalLb = []
-    emeraldTotalLb = []
-    
-    onlineTimeLb = []
-    onlineTimeBwLb = []
+    # column store of every accumulator, only when numpy is installed
+    engine: StatEngine = None
+
+    # while a batch is open: leader board name -> changed ids, and the held back events
+    _batchLbIds = None
+    _batchEvents = None
 
     @classmethod
     async def __loaded__(cls):
-        ids = cls.stats.keys()
-        cls.xpLb = sorted(ids, key=lambda id_: -cls.stats[id_].xp["biweek"])
-        cls.xpTotalLb = sorted(ids, key=lambda id_: -cls.stats[id_].xp["total"])
-        cls.warLb = sorted(ids, key=lambda id_: -cls.stats[id_].war["biweek"])
-        cls.warTotalLb = sorted(ids, key=lambda id_: -cls.stats[id_].war["total"])
-        cls.emeraldLb = sorted(ids, key=lambda id_: -cls.stats[id_].emerald["biweek"])
-        cls.emeraldTotalLb = sorted(ids, key=lambda id_: -cls.stats[id_].emerald["total"])
-        cls.onlineTimeLb = sorted(ids, key=lambda id_: -cls.stats[id_].onlineTime["curr"])
-        cls.onlineTimeBwLb = sorted(ids, key=lambda id_: -cls.stats[id_].onlineTime["biweek"])
-
-        Event.listen("memberAdd", cls._on_member_add)
-        Event.listen("memberStatusChange", cls._on_member_status_change)
+        # members added since the last save are only restored from the journal
+        for id_ in GuildMember.members.keys() - cls.stats.keys():
+            cls.stats[id_] = Statistic(id_)
+            State.mark_rows_dirty(cls, "stats", id_)
 
-    @classmethod
-    def reset_biweekly(cls):
+        # stats saved before a metric was added get its accumulator
         for stat in cls.stats.values():
-            stat._reset_biweekly()
+            for name in ACCUMULATORS:
+                if not hasattr(stat, name):
+                    setattr(stat, name, Statistic.make_accumulator(METRICS[name]))
 
-    @classmethod
-    def _update_lb(cls, lb, id_, attr, field):
-        lb.remove(id_)
+        if StatEngine.available:
+            cls.engine = StatEngine()
+            for stat in cls.stats.values():
+                cls.engine.bind(stat, *ACCUMULATORS)
 
-        lo = 0
-        hi = len(lb)
-        val = getattr(cls.stats[id_], attr)[field]
+        resorted = 0
+        for name, (attr, field) in LB_FIELDS.items():
+            lb = cls._restore_lb(getattr(cls, name), attr, field)
+            setattr(cls, name, lb)
+            resorted += not lb.isSorted
+        Logger.bot.debug(f"{resorted} of {len(LB_FIELDS)} leader boards had to be re-sorted")
 
-        while lo < hi:
-            mid = (lo + hi) // 2
-            if val > getattr(cls.stats[lb[mid]], attr)[field]:
-                hi = mid
+        Event.listen("memberAdd", cls._on_member_add)
+        Event.listen("memberStatusChange", cls._on_member_status_change)
+
+    @classmethod
+    def _restore_lb(cls, lb, attr, field):
+        # the saved order is checked instead of sorting from scratch, it can be stale
+        # after journal replay or a crash, then sorting it keeps the saved order of ties.
+        ids = cls.stats.keys()
+        if len(lb) != len(ids) or not ids >= set(lb):
+            if cls.engine and ids:
+                lb = cls.engine.order(attr, field)
             else:
-                lo = mid + 1
+                lb = [id_ for id_ in dict.fromkeys(lb) if id_ in ids]
+                lb += ids - set(lb)
+        return Leaderboard(lambda id_: getattr(cls.stats[id_], attr)[field], lb)
 
-        lb.insert(lo, id_)
+    @classmethod
+    async def reset_biweekly(cls):
+        if cls.engine and cls.stats:
+            for metric in METRICS.values():
+                for field in metric.resets:
+                    cls.engine.reset(metric.name, field)
+        else:
+            for stat in cls.stats.values():
+                stat._reset_biweekly()
+        for name, (attr, field) in LB_FIELDS.items():
+            if field in METRICS[attr].resets:
+                lb = getattr(cls, name)
+                lb.load(list(lb))
+        State.mark_dirty(cls, "stats")
+        await Event.broadcast("biweeklyReset")
 
     @classmethod
     async def _on_member_add(cls, id_):
         if id_ not in cls.stats:
             cls.stats[id_] = Statistic(id_)
+            if cls.engine:
+                cls.engine.bind(cls.stats[id_], *ACCUMULATORS)
+            State.mark_rows_dirty(cls, "stats", id_)
 
-            cls.xpLb.append(id_)
-            cls.xpTotalLb.append(id_)
-            cls.warLb.append(id_)
-            cls.warTotalLb.append(id_)
-            cls.emeraldLb.append(id_)
-            cls.emeraldTotalLb.append(id_)
-            cls.onlineTimeLb.append(id_)
-            cls.onlineTimeBwLb.append(id_)
+            for name in LB_FIELDS:
+                getattr(cls, name).add(id_)
     
+    @classmethod
+    def total(cls, attr, field):
+        if cls.engine and cls.stats:
+            return cls.engine.total(attr, field)
+        values = (getattr(stat, attr)[field] for stat in cls.stats.values())
+        return sum(values, METRICS[attr].valType())
+
+    @classmethod
+    def percentile(cls, id_, attr, field):
+        # share of the guild with a lower value, in percent
+        if cls.engine:
+            return cls.engine.percentile(id_, attr, field)
+        val = getattr(cls.stats[id_], attr)[field]
+        below = sum(getattr(stat, attr)[field] < val for stat in cls.stats.values())
+        return below * 100 / len(cls.stats)
+
+    @classmethod
+    def value_rows(cls, fields):
+        # id -> values of the given (attribute, field) pairs, timedeltas in seconds
+        if cls.engine and cls.stats:
+            return cls.engine.rows(fields)
+        rows = {}
+        for id_, stat in cls.stats.items():
+            values = (getattr(stat, attr)[field] for attr, field in fields)
+            rows[id_] = tuple(v.total_seconds() if isinstance(v, timedelta) else v 
+                for v in values)
+        return rows
+
     @classmethod
     async def _on_member_status_change(cls, id_, prevStatus):
         if GuildMember.members[id_].status != GuildMember.ACTIVE:
@@ -82,76 +136,117 @@ class Statistic:
     def __init__(self, id_):
         self.id = id_
 
-        self.xp = Statistic.ContributionAccumulator()
-        self.war = Statistic.Accumulator("biweek", "total")
-        self.emerald = Statistic.ContributionAccumulator()
-        self.onlineTime = Statistic.Accumulator("biweek", "curr", valType=timedelta)
+        for metric in METRICS.values():
+            setattr(self, metric.name, Statistic.make_accumulator(metric))
 
         self.world = None
     
     def __repr__(self):
         s = "<Statistic"
-        properties = ["xp", "war", "emerald", "onlineTime", "world"]
+        properties = [*ACCUMULATORS, "world"]
         for p in properties:
             if hasattr(self, p):
                 s += f" {p}={getattr(self, p)}"
         return s + ">"
 
     async def update_xp(self, val):
-        return await self._update_contribution("xp", val)
+        return await self.update_contribution("xp", val)
     
     async def update_emerald(self, val):
-        return await self._update_contribution("emerald", val)
+        return await self.update_contribution("emerald", val)
     
-    async def _update_contribution(self, name, val):
+    async def update_contribution(self, name, val):
+        metric = METRICS[name]
         accumulator = getattr(self, name)
 
-        prev = self.xp.real
-        diff = self.xp.update(val)
+        prev = accumulator.real
+        diff = accumulator.update(val)
+        State.mark_rows_dirty(Statistic, "stats", self.id)
         if diff:
-            Statistic._update_lb(Statistic.xpLb, self.id, name, "biweek")
-            Statistic._update_lb(Statistic.xpTotalLb, self.id, name, "total")
+            Statistic._update_lbs(self.id, *metric.lbs.values())
 
             ign = GuildMember.members[self.id].ign
-            Logger.bot.info(f"{ign} {name} {prev} -> {self.xp.real}")
-            await Event.broadcast(name + "Change", self.id, diff)
+            Logger.bot.info(f"{ign} {name} {prev} -> {accumulator.real}")
+            await Statistic._emit(metric.event, self.id, diff)
         return diff
     
+    async def accumulate(self, name, diff):
+        metric = METRICS[name]
+        getattr(self, name).accumulate(diff)
+        State.mark_rows_dirty(Statistic, "stats", self.id)
+
+        Statistic._update_lbs(self.id, *metric.lbs.values())
+
+        await Statistic._emit(metric.event, self.id, diff)
+    
     async def increment_war(self):
-        self.war.accumulate(1)
-        Statistic._update_lb(self.warLb, self.id, "war", "biweek")
-        Statistic._update_lb(self.warTotalLb, self.id, "war", "total")
+        await self.accumulate("war", 1)
 
         ign = GuildMember.members[self.id].ign
         Logger.bot.info(f"{ign} war count incremented to {self.war['total']}")
-        await Event.broadcast("warIncrement", self.id)
     
     async def update_world(self, newWorld):
         if newWorld != self.world:
             prev = self.world
             self.world = newWorld
-            await Event.broadcast("worldChange", self.id, prev)
+            State.mark_rows_dirty(Statistic, "stats", self.id)
+            await Statistic._emit("worldChange", self.id, prev)
             if newWorld is None:
                 prev = self.onlineTime["curr"]
                 self.onlineTime.reset_entry("curr")
-                Statistic.onlineTimeLb.remove(self.id)
-                Statistic.onlineTimeLb.append(self.id)
+                Statistic._update_lbs(self.id, "onlineTimeLb")
 
-                await Event.broadcast("offline", self.id, prev)
+                await Statistic._emit("offline", self.id, prev)
     
     async def accumulate_online_time(self, dt):
-        self.onlineTime.accumulate(dt)
-
-        Statistic._update_lb(Statistic.onlineTimeLb, self.id, "onlineTime", "curr")
-        Statistic._update_lb(Statistic.onlineTimeBwLb, self.id, "onlineTime", "biweek")
-
-        await Event.broadcast("onlineTimeAccumulate", self.id, dt)
+        await self.accumulate("onlineTime", dt)
+    
+    @classmethod
+    @asynccontextmanager
+    async def batch(cls):
+        # updates made inside move every changed id on a leader board once, on exit, and
+        # their events go out together, one broadcast_batch per run of the same event.
+        if cls._batchLbIds is not None:
+            yield
+            return
+        cls._batchLbIds = {}
+        cls._batchEvents = []
+        try:
+            yield
+        finally:
+            lbIds, events = cls._batchLbIds, cls._batchEvents
+            cls._batchLbIds = cls._batchEvents = None
+            for name, ids in lbIds.items():
+                getattr(cls, name).update_many(ids)
+            # runs keep the order of events, journal replay depends on it
+            for type_, run in groupby(events, key=lambda event: event[0]):
+                await Event.broadcast_batch(type_, [args for _, args in run])
+    
+    @classmethod
+    def _update_lbs(cls, id_, *names):
+        for name in names:
+            if cls._batchLbIds is None:
+                getattr(cls, name).update(id_)
+            else:
+                cls._batchLbIds.setdefault(name, {})[id_] = None
+    
+    @classmethod
+    async def _emit(cls, type_, *args):
+        if cls._batchEvents is None:
+            await Event.broadcast(type_, *args)
+        else:
+            cls._batchEvents.append((type_, args))
     
     def _reset_biweekly(self):
-        self.xp.reset_entry("biweek")
-        self.war.reset_entry("biweek")
-        self.emerald.reset_entry("biweek")
-        self.onlineTime.reset_entry("biweek")
+        for metric in METRICS.values():
+            for field in metric.resets:
+                getattr(self, metric.name).reset_entry(field)
+
+    @staticmethod
+    def make_accumulator(metric: Metric):
+        if metric.kind == Metric.CONTRIBUTION:
+            return Statistic.ContributionAccumulator(*metric.fields)
+        return Statistic.Accumulator(*metric.fields, valType=metric.valType)
 
     class Accumulator:
 
@@ -174,11 +269,15 @@ class Statistic:
         
         def reset_entry(self, entry):
             self.entries[entry] = self.valType()
+        
+        def __getstate__(self):
+            # entries bound to the engine columns are stored as a plain dict
+            return {**self.__dict__, "entries": dict(self.entries.items())}
     
     class ContributionAccumulator(Accumulator):
 
-        def __init__(self):
-            super().__init__("total", "biweek")
+        def __init__(self, *entries):
+            super().__init__(*(entries or ("total", "biweek")))
             self.real = None
         
         def __repr__(self):
@@ -203,4 +302,8 @@ class Statistic:
                 if diff > 0:
                     self.accumulate(diff)
 
-            return diff
\ No newline at end of file
+            return diff
+
+
+for lbName in LB_FIELDS:
+    setattr(Statistic, lbName, [])
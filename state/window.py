@@ -0,0 +1,169 @@
+from array import array
+from datetime import timedelta
+from time import time
+from typing import Dict
+
+from logger import Logger
+from event import Event
+from state.leaderboard import Leaderboard
+from state.metric import Metric
+from state.state import State
+from state.statengine import TIMEDELTA_UNIT
+
+
+BUCKET_SECONDS = 3600
+# window -> number of hourly buckets it covers
+WINDOWS = {"24h": 24, "7d": 7 * 24, "30d": 30 * 24}
+LONGEST_WINDOW = max(WINDOWS, key=WINDOWS.get)
+BUCKET_COUNT = WINDOWS[LONGEST_WINDOW]
+BUCKET_TYPE = "q"
+
+
+def current_hour():
+    return int(time() // BUCKET_SECONDS)
+
+
+class RingCounter:
+    # the last BUCKET_COUNT hours of one metric of one member, one bucket per hour,
+    # with a running sum per window so reading a window is O(1).
+
+    __slots__ = ("buckets", "hour", "sums")
+
+    def __init__(self, hour):
+        self.buckets = array(BUCKET_TYPE, bytes(array(BUCKET_TYPE).itemsize * BUCKET_COUNT))
+        # hour of the newest bucket
+        self.hour = hour
+        self.sums = dict.fromkeys(WINDOWS, 0)
+
+    def advance(self, hour):
+        # buckets falling out of a window are taken off its sum, then reused
+        steps = hour - self.hour
+        if steps <= 0:
+            return False
+        if steps >= BUCKET_COUNT:
+            self.buckets = array(BUCKET_TYPE, bytes(len(self.buckets) * self.buckets.itemsize))
+            self.sums = dict.fromkeys(WINDOWS, 0)
+        else:
+            for curr in range(self.hour + 1, hour + 1):
+                for name, size in WINDOWS.items():
+                    self.sums[name] -= self.buckets[(curr - size) % BUCKET_COUNT]
+                self.buckets[curr % BUCKET_COUNT] = 0
+        self.hour = hour
+        return True
+
+    def add(self, hour, val):
+        self.advance(hour)
+        if hour <= self.hour - BUCKET_COUNT:
+            return
+        self.buckets[hour % BUCKET_COUNT] += val
+        for name, size in WINDOWS.items():
+            if hour > self.hour - size:
+                self.sums[name] += val
+
+    def __getstate__(self):
+        # only the non-empty buckets are stored, most members are idle most hours
+        return self.hour, {h: self.buckets[h % BUCKET_COUNT]
+            for h in range(self.hour - BUCKET_COUNT + 1, self.hour + 1)
+            if self.buckets[h % BUCKET_COUNT]}
+
+    def __setstate__(self, state):
+        hour, filled = state
+        self.__init__(hour)
+        for h, val in filled.items():
+            self.add(h, val)
+
+
+@State.register("windows", rows=("windows",))
+class StatWindow:
+    # rolling window totals of every metric. Members only have counters while they had
+    # something in the last BUCKET_COUNT hours, so memory is bounded by the active members.
+
+    # id -> metric name -> RingCounter
+    windows: Dict[str, Dict[str, RingCounter]] = {}
+    # (metric name, window) -> Leaderboard, rebuilt on load
+    lbs = {}
+    hour = 0
+    # timedelta counters hold integer TIMEDELTA_UNITs
+
+    @classmethod
+    async def __loaded__(cls):
+        cls.hour = current_hour()
+        for counters in cls.windows.values():
+            for counter in counters.values():
+                counter.advance(cls.hour)
+        cls._drop_idle(list(cls.windows))
+
+        for metric in Metric.registry.values():
+            for window in WINDOWS:
+                cls.lbs[metric.name, window] = Leaderboard(cls._make_getter(metric.name, window),
+                    [id_ for id_, counters in cls.windows.items() if metric.name in counters])
+            Event.listen(metric.event, cls._make_listener(metric), batch=True)
+        Logger.bot.debug(f"{len(cls.windows)} members have rolling window stats")
+
+    @classmethod
+    def _make_getter(cls, name, window):
+        return lambda id_: cls.get(id_, name, window)
+
+    @classmethod
+    def _make_listener(cls, metric: Metric):
+        async def on_change(changes):
+            cls.roll()
+            for id_, diff in changes:
+                cls.add(metric.name, id_, diff)
+            # ids whose diff was empty have no counter to rank
+            ids = [id_ for id_, _ in changes if metric.name in cls.windows.get(id_, ())]
+            for window in WINDOWS:
+                cls.lbs[metric.name, window].update_many(ids)
+        return on_change
+
+    @classmethod
+    def get(cls, id_, name, window):
+        counter = cls.windows.get(id_, {}).get(name)
+        return counter.sums[window] if counter else 0
+
+    @classmethod
+    def get_value(cls, id_, name, window):
+        val = cls.get(id_, name, window)
+        return val * TIMEDELTA_UNIT if Metric.registry[name].valType is timedelta else val
+
+    @classmethod
+    def add(cls, name, id_, diff):
+        if isinstance(diff, timedelta):
+            diff //= TIMEDELTA_UNIT
+        if not diff:
+            return
+        counters = cls.windows.setdefault(id_, {})
+        if name not in counters:
+            counters[name] = RingCounter(cls.hour)
+        counters[name].add(cls.hour, diff)
+        State.mark_rows_dirty(StatWindow, "windows", id_)
+
+    @classmethod
+    def roll(cls):
+        # moves every counter to the current hour, once per hour
+        hour = current_hour()
+        if hour <= cls.hour:
+            return
+        cls.hour = hour
+        for counters in cls.windows.values():
+            for counter in counters.values():
+                counter.advance(hour)
+        cls._drop_idle(list(cls.windows))
+        for lb in cls.lbs.values():
+            lb.load(list(lb))
+
+    @classmethod
+    def _drop_idle(cls, ids):
+        # counters that emptied out are freed, and members without any counter left
+        for id_ in ids:
+            counters = cls.windows[id_]
+            idle = [name for name, counter in counters.items() if not counter.sums[LONGEST_WINDOW]]
+            for name in idle:
+                del counters[name]
+                for window in WINDOWS:
+                    if id_ in cls.lbs.get((name, window), ()):
+                        cls.lbs[name, window].remove(id_)
+            if not counters:
+                del cls.windows[id_]
+            if idle:
+                State.mark_rows_dirty(StatWindow, "windows", id_)
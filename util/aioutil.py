@@ -0,0 +1,71 @@
+from asyncio import get_running_loop
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Dict
+
+
+MAX_IO_WORKERS = 4
+LATENCY_SAMPLES = 256
+
+
+class IOStats:
+
+    def __init__(self):
+        # time from submitting to finishing, which includes waiting for a worker
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.count = 0
+        self.failures = 0
+        self.maxLatency = 0
+
+    def record(self, latency, failed):
+        self.count += 1
+        self.failures += failed
+        self.latencies.append(latency)
+        self.maxLatency = max(self.maxLatency, latency)
+
+    def percentile(self, percent):
+        if not self.latencies:
+            return 0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class AIOUtil:
+
+    executor = ThreadPoolExecutor(max_workers=MAX_IO_WORKERS, thread_name_prefix="io")
+    stats: Dict[str, IOStats] = {}
+    pending = 0
+
+    @classmethod
+    async def run(cls, op, func, *args):
+        if op not in cls.stats:
+            cls.stats[op] = IOStats()
+        startTime = perf_counter()
+        failed = True
+        cls.pending += 1
+        try:
+            result = await get_running_loop().run_in_executor(cls.executor, func, *args)
+            failed = False
+            return result
+        finally:
+            cls.pending -= 1
+            cls.stats[op].record(perf_counter() - startTime, failed)
+
+    @classmethod
+    async def read_text(cls, path, op="file.read"):
+        return await cls.run(op, cls._read_text, path)
+
+    @classmethod
+    async def read_bytes(cls, path, op="file.read"):
+        return await cls.run(op, cls._read_bytes, path)
+
+    @staticmethod
+    def _read_text(path):
+        with open(path, "r") as f:
+            return f.read()
+
+    @staticmethod
+    def _read_bytes(path):
+        with open(path, "rb") as f:
+            return f.read()
@@ -16,6 +16,7 @@ class CatchableArgumentParser(ArgumentParser):
 "arg..."                    extend argument
 ["arg..."]                  flag extend argument
 "-arg"                      flag argument
+"--arg-name"                long only flag argument, stored as argName
 ["arg", ("choice", ...)]    choice argument
 [["arg"], ("choice", ...)]  flag choice argument
 "arg*"                      optional positional argument
@@ -30,6 +31,12 @@ def parser(name, *args, isGroup=False, parent=None, **destMap):
                 arg = arg[:-3]
                 argParser.add_argument(
                     dest=destMap.pop(arg, arg), action="extend", nargs="+", type=str)
+            #  "--arg-name"
+            elif arg.startswith("--"):
+                arg = arg[2:]
+                words = arg.split("-")
+                dest = words[0] + "".join(map(str.capitalize, words[1:]))
+                argParser.add_argument(f"--{arg}", action="store", dest=destMap.pop(arg, dest))
             #  "-arg"
             elif arg[0] == "-":
                 arg = arg[1:]
@@ -0,0 +1,92 @@
+from asyncio import Task, create_task, shield
+from collections import OrderedDict
+from time import time
+from typing import Dict
+
+
+class LRUCache:
+
+    def __init__(self, maxBytes, ttl=None):
+        self.maxBytes = maxBytes
+        self.ttl = ttl  # in seconds, entries never expire when None
+
+        # key -> (value, size, expire time)
+        self._entries = OrderedDict()
+        self._loading: Dict[object, Task] = {}
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.sharedLoads = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not None
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] is not None and entry[2] <= time():
+            self._drop(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+
+    def get(self, key, default=None):
+        entry = self._lookup(key)
+        return entry[0] if entry else default
+
+    def put(self, key, value, size):
+        if key in self._entries:
+            self._drop(key)
+        # an entry that can never fit would only flush everything else out
+        if size > self.maxBytes:
+            return
+        expireTime = time() + self.ttl if self.ttl else None
+        self._entries[key] = (value, size, expireTime)
+        self.size += size
+        while self.size > self.maxBytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def pop(self, key):
+        if key in self._entries:
+            self._drop(key)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    async def get_or_load(self, key, loader):
+        # loader is an async callable returning (value, size), concurrent callers
+        # asking for the same key share a single load.
+        entry = self._lookup(key)
+        if entry:
+            self.hits += 1
+            return entry[0]
+
+        if key in self._loading:
+            self.sharedLoads += 1
+        else:
+            self.misses += 1
+            self._loading[key] = create_task(self._load(key, loader))
+        # shielded so a cancelled caller doesn't cancel the load for the others
+        return await shield(self._loading[key])
+
+    async def _load(self, key, loader):
+        try:
+            value, size = await loader()
+            self.put(key, value, size)
+            return value
+        finally:
+            del self._loading[key]
@@ -0,0 +1,38 @@
+from sys import getsizeof
+import os
+
+
+def deep_sizeof(obj) -> int:
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        curr = stack.pop()
+        if id(curr) in seen:
+            continue
+        seen.add(id(curr))
+        size += getsizeof(curr)
+        if isinstance(curr, dict):
+            stack.extend(curr.keys())
+            stack.extend(curr.values())
+        elif isinstance(curr, (list, tuple, set, frozenset)):
+            stack.extend(curr)
+        elif not isinstance(curr, type):
+            # instances hold their attributes in __dict__ or __slots__, which aren't
+            # part of their own size
+            if hasattr(curr, "__dict__"):
+                stack.append(curr.__dict__)
+            for cls in type(curr).__mro__:
+                slots = getattr(cls, "__slots__", ())
+                for slot in (slots,) if isinstance(slots, str) else slots:
+                    if hasattr(curr, slot):
+                        stack.append(getattr(curr, slot))
+    return size
+
+
+def get_rss() -> int:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
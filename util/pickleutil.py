@@ -1,3 +1,4 @@
+from hashlib import blake2b
 import pickle
 import os
 
@@ -5,10 +6,31 @@ import os
 class PickleUtil:
     
 
+    @staticmethod
+    def dumps(data) -> bytes:
+        return pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+    
+
+    @staticmethod
+    def digest(raw: bytes) -> bytes:
+        return blake2b(raw, digest_size=16).digest()
+    
+
     @staticmethod
     def save(path, data):
-        with open(path, "wb") as file:
-            pickle.dump(data, file, pickle.HIGHEST_PROTOCOL)
+        return PickleUtil.write(path, PickleUtil.dumps(data))
+    
+
+    @staticmethod
+    def write(path, raw: bytes):
+        # write to a temp file first so a crash mid-write never leaves a corrupted file.
+        tmpPath = path + ".tmp"
+        with open(tmpPath, "wb") as file:
+            file.write(raw)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmpPath, path)
+        return len(raw)
     
 
     @staticmethod
@@ -20,4 +42,4 @@ class PickleUtil:
         obj = None
         with open(path, "rb") as file:
             obj = pickle.load(file)
-        return obj
\ No newline at end of file
+        return obj
@@ -1,12 +1,25 @@
 import aiohttp
-from typing import Union
+from typing import Union, Dict, Tuple
 from datetime import timedelta, datetime
-from time import time
-import backoff
+from time import monotonic
+from asyncio import Semaphore, Event, Future, create_task, gather, sleep, get_running_loop
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from hashlib import blake2b
+import json
+import re
+
+try:
+    import orjson
+    DEFAULT_DECODER = orjson.loads
+except ImportError:
+    DEFAULT_DECODER = json.loads
 
 from util.timeutil import now
 from logger import Logger
-from state.apistamp import APIStamp
+from requestscheduler import RequestScheduler, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from state.apistamp import APIStamp, EndpointTelemetry
+from state.playercache import PlayerCache
 
 
 LEGACY_URL_BASE = "https://api.wynncraft.com/public_api.php"
@@ -15,63 +28,386 @@ V2_URL_BASE = "https://api.wynncraft.com/v2/"
 
 MOJANG_UUID_URL = "https://api.mojang.com/users/profiles/minecraft/%s?at=%s"
 MOJANG_IGN_URL = "https://api.mojang.com/user/profiles/%s/names"
+MOJANG_BULK_UUID_URL = "https://api.mojang.com/profiles/minecraft"
+
+MOJANG_BULK_SIZE = 10  # max number of names per bulk uuid request
+MOJANG_BULK_DELAY = 0.1  # Number of seconds to wait for more names to batch up.
+
+
+MAX_CONCURRENT_REQUESTS = 2
+
+# request.timestamp, other timestamp fields of the body are data
+TIMESTAMP_PATTERN = re.compile(rb'"request"\s*:\s*\{[^{}]*?"timestamp"\s*:\s*([0-9.]+)')
+
+BREAKER_FAILURE_THRESHOLD = 3  # consecutive failures before the circuit opens
+BREAKER_COOLDOWN = 30  # Number of seconds the circuit stays open before a probe.
+BREAKER_MAX_COOLDOWN = 300
+PROBE_TIMEOUT = 5  # in seconds
+
+OFF_LOOP_DECODE_SIZE = 32 * 1024  # bodies at least this many bytes are decoded in a process
+DECODE_WORKERS = 1
+
+
+def project_guild_stats(data: dict) -> Dict[str, int]:
+    return {m["name"]: m["contributed"] for m in data["members"]}
+
+
+def project_server_list(data: dict) -> Dict[str, tuple]:
+    return {w: tuple(sorted(players)) for w, players in data.items() if w != "request"}
+
+
+def project_territory_list(data: dict) -> Dict[str, Tuple[str, str]]:
+    return {terr: (info["guild"], info["acquired"]) 
+        for terr, info in data["territories"].items()}
+
+
+def decode_projected(decoder, projection, body: bytes):
+    # runs in the decode process, only the projected data is sent back
+    startTime = monotonic()
+    data = projection(decoder(body))
+    return data, monotonic() - startTime
+
+
+class GuildStatsDelta:
+
+    def __init__(self, prev: Union[Dict[str, int], None], curr: Dict[str, int]):
+        self.isInitial = prev is None
+        self.members = curr
+
+        prev = prev or {}
+        self.joined = curr.keys() - prev.keys()
+        self.left = prev.keys() - curr.keys()
+        self.contributed = {ign: contributed for ign, contributed in curr.items() 
+            if prev.get(ign) != contributed}
+
+    def __repr__(self):
+        return f"<GuildStatsDelta joined={self.joined} left={self.left} " + \
+            f"contributed={len(self.contributed)}>"
+
+
+class ServerListDelta:
+
+    def __init__(self, prev: Union[Dict[str, tuple], None], curr: Dict[str, tuple]):
+        self.isInitial = prev is None
+        self.worlds = curr
+
+        prev = prev or {}
+        self.created = curr.keys() - prev.keys()
+        self.removed = prev.keys() - curr.keys()
+
+        self.joined = {}
+        self.left = {}
+        for world, players in curr.items():
+            prevPlayers = prev.get(world, ())
+            if players == prevPlayers:
+                continue
+            joined = set(players).difference(prevPlayers)
+            left = set(prevPlayers).difference(players)
+            if joined:
+                self.joined[world] = joined
+            if left:
+                self.left[world] = left
+        for world in self.removed:
+            if prev[world]:
+                self.left[world] = set(prev[world])
+
+    def __repr__(self):
+        return f"<ServerListDelta created={self.created} removed={self.removed} " + \
+            f"joined={len(self.joined)} left={len(self.left)}>"
+
+
+class TerritoryListDelta:
+
+    def __init__(self, prev: Union[Dict[str, tuple], None], curr: Dict[str, tuple]):
+        self.isInitial = prev is None
+        self.territories = curr
+
+        prev = prev or {}
+        self.changed = {terr for terr, info in curr.items() if prev.get(terr) != info}
+
+    def __repr__(self):
+        return f"<TerritoryListDelta changed={len(self.changed)}>"
+
+
+class StaleNotice:
+
+    def __init__(self, isStale):
+        self.isStale = isStale
+    
+    def __repr__(self):
+        return f"<StaleNotice isStale={self.isStale}>"
+
+
+class CircuitBreaker:
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self):
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        self.cooldown = BREAKER_COOLDOWN
+        self.retryAt = 0
+
+    def allow(self):
+        if self.state == CircuitBreaker.OPEN and monotonic() >= self.retryAt:
+            self.state = CircuitBreaker.HALF_OPEN
+        return self.state != CircuitBreaker.OPEN
+    
+    def record_success(self):
+        wasClosed = self.state == CircuitBreaker.CLOSED
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        self.cooldown = BREAKER_COOLDOWN
+        return not wasClosed
+    
+    def record_failure(self):
+        self.failures += 1
+        if self.state == CircuitBreaker.HALF_OPEN:
+            self.cooldown = min(self.cooldown * 2, BREAKER_MAX_COOLDOWN)
+        elif self.state == CircuitBreaker.OPEN or self.failures < BREAKER_FAILURE_THRESHOLD:
+            return False
+        wasClosed = self.state == CircuitBreaker.CLOSED
+        self.state = CircuitBreaker.OPEN
+        self.retryAt = monotonic() + self.cooldown
+        return wasClosed
 
 
 class APIEndpoint:
 
-    def __init__(self, **params):
+    # json decoding holds the GIL for the whole body, a thread wouldn't free the loop
+    _decodePool: ProcessPoolExecutor = None
+
+    def __init__(self, name, interval, projection, deltaCls, priority=PRIORITY_NORMAL, 
+            decoder=None, **params):
         self._data: dict = None
         self._receivers = set()
+        self.name = name
+        self.projection = projection
+        self.deltaCls = deltaCls
+        self.priority = priority
+        self.decoder = decoder or DEFAULT_DECODER
         self.url = LEGACY_URL_BASE
         self.params = params
+
+        self.interval = interval
+        self.nextUpdate = 0
+        self.isUpdating = False
+
+        self._fingerprint: bytes = None
+        self.fingerprintHits = 0
+        self.fingerprintMisses = 0
+
+        self.breaker = CircuitBreaker()
+    
+    @property
+    def isStale(self):
+        return self.breaker.state != CircuitBreaker.CLOSED
+
+    def is_due(self):
+        return not self.isUpdating and monotonic() >= self.nextUpdate
+
+    def set_interval(self, interval):
+        self.nextUpdate += interval - self.interval
+        self.interval = interval
     
-    @backoff.on_exception(backoff.expo, aiohttp.ClientError, max_tries=3)
+    @property
+    def telemetry(self) -> EndpointTelemetry:
+        return APIStamp.get_telemetry(self.name)
+
     async def _update(self, session: aiohttp.ClientSession):
-        async with session.get(self.url, params=self.params, raise_for_status=True) as resp:
+        # a probe of an open circuit gets a short timeout so a dead API fails fast.
+        kwargs = {"timeout": aiohttp.ClientTimeout(total=PROBE_TIMEOUT)} \
+            if self.breaker.state == CircuitBreaker.HALF_OPEN else {}
+        startTime = monotonic()
+        async with RequestScheduler.request(session, "GET", self.url, 
+                priority=self.priority, params=self.params, **kwargs) as resp:
+            resp.raise_for_status()
             if resp.status != 200:
                 Logger.bot.warning(f"failed request {self.params} with {resp.status}")
                 return
-            resp = await resp.json()
-            if APIStamp.set_stamp(self.params, resp["request"]["timestamp"]):
-                self._data = resp
-                for receiver in self._receivers:
-                    receiver._isUpdated = True
+            body = await resp.read()
+        self.telemetry.record_success(monotonic() - startTime, len(body))
+
+        stampMatch = TIMESTAMP_PATTERN.search(body)
+        if not stampMatch or not APIStamp.set_stamp(self.name, float(stampMatch.group(1))):
+            return
+
+        # the request timestamp changes on every poll even if nothing else did, so it is
+        # left out of the fingerprint.
+        fingerprint = blake2b(body[:stampMatch.start(1)] + body[stampMatch.end(1):], 
+            digest_size=16).digest()
+        if fingerprint == self._fingerprint:
+            self.fingerprintHits += 1
+            return
+        self.fingerprintMisses += 1
+        self._fingerprint = fingerprint
+
+        if len(body) >= OFF_LOOP_DECODE_SIZE:
+            data, decodeTime = await get_running_loop().run_in_executor(
+                self.start_decode_pool(), decode_projected, self.decoder, self.projection, body)
+        else:
+            data, decodeTime = decode_projected(self.decoder, self.projection, body)
+        prev = self._data
+        self._data = data
+        delta = self.deltaCls(prev, data)
+        self.telemetry.record_change(decodeTime)
+
+        for receiver in self._receivers:
+            receiver._push_data(prev, data, delta)
+    
+    @classmethod
+    def start_decode_pool(cls):
+        # spawned, a forked child of the threaded bot could inherit held locks
+        if cls._decodePool is None:
+            cls._decodePool = ProcessPoolExecutor(max_workers=DECODE_WORKERS, 
+                mp_context=get_context("spawn"))
+        return cls._decodePool
+
+    @classmethod
+    def close_decode_pool(cls):
+        if cls._decodePool:
+            cls._decodePool.shutdown(wait=False)
+            cls._decodePool = None
     
-    def create_receiver(self):
-        receiver = APIEndpoint.Receiver(self)
+    def _notify_stale(self, isStale):
+        notice = StaleNotice(isStale)
+        for receiver in self._receivers:
+            if receiver.notifyStale:
+                receiver._push_notice(notice)
+
+    def create_receiver(self, notifyStale=False):
+        receiver = APIEndpoint.Receiver(self, notifyStale)
         self._receivers.add(receiver)
         return receiver
     
+    async def subscribe(self, notifyStale=False):
+        receiver = self.create_receiver(notifyStale)
+        if self._data is not None:
+            receiver._push_data(None, self._data, None)
+        try:
+            while True:
+                yield await receiver.receive()
+        finally:
+            self._receivers.discard(receiver)
+    
     class Receiver:
+        # holds at most the newest data and the newest stale notice. A consumer that falls
+        # behind gets one delta from the data it received last to the newest data, instead
+        # of every payload it missed.
         
-        def __init__(self, endpoint):
-            self._isUpdated = False
-            self._endpoint = endpoint 
+        def __init__(self, endpoint, notifyStale):
+            self._endpoint = endpoint
+            self.notifyStale = notifyStale
+
+            self._ready = Event()
+            # last data received by the consumer, pending data and its delta
+            self._consumed = None
+            self._data = None
+            self._delta = None
+            self._notice: StaleNotice = None
+            self._wasStale = False
         
-        def getData(self) -> Union[dict, None]:
-            if self._isUpdated:
-                self._isUpdated = False
-                return self._endpoint._data
-            return None
+        @property
+        def isStale(self):
+            return self._endpoint.isStale
+        
+        def _push_data(self, prev, data, delta):
+            # the delta of the endpoint is only right if nothing is pending in between
+            self._delta = delta if self._data is None and prev is self._consumed else None
+            self._data = data
+            self._ready.set()
+        
+        def _push_notice(self, notice):
+            self._notice = notice
+            self._ready.set()
+        
+        async def receive(self):
+            while True:
+                # pending data was fetched before a pending notice was sent, it goes first
+                if self._data is not None:
+                    data, delta = self._data, self._delta
+                    self._data = self._delta = None
+                    if delta is None:
+                        delta = self._endpoint.deltaCls(self._consumed, data)
+                    self._consumed = data
+                    return delta
+                if self._notice is not None:
+                    notice, self._notice = self._notice, None
+                    if notice.isStale != self._wasStale:
+                        self._wasStale = notice.isStale
+                        return notice
+                    continue
+                self._ready.clear()
+                await self._ready.wait()
 
 
 class WynnAPI:
 
-    guildStats = APIEndpoint(action="guildStats", command="HackForums")
-    serverList = APIEndpoint(action="onlinePlayers")
-    terrList = APIEndpoint(action="territoryList")
+    guildStats = APIEndpoint("guildStats", 10, project_guild_stats, GuildStatsDelta, 
+        action="guildStats", command="HackForums")
+    serverList = APIEndpoint("serverList", 3, project_server_list, ServerListDelta, 
+        priority=PRIORITY_HIGH, action="onlinePlayers")
+    terrList = APIEndpoint("terrList", 10, project_territory_list, TerritoryListDelta, 
+        action="territoryList")
+
+    endpoints: Dict[str, APIEndpoint] = {
+        ep.name: ep for ep in (guildStats, serverList, terrList)}
 
     _session: aiohttp.ClientSession = None
+    _semaphore: Semaphore = None
+
+    _idBatch = []
+    _pendingIds: Dict[str, Future] = {}
+    _pendingIgns: Dict[str, Future] = {}
+    # the loop only keeps weak references to tasks, running ones are kept here
+    _tasks = set()
 
     @classmethod
     def init(cls, session):
         cls._session = session
+        cls._semaphore = Semaphore(MAX_CONCURRENT_REQUESTS)
 
     @classmethod
-    async def update(cls):
-        await cls.guildStats._update(cls._session)
-        await cls.serverList._update(cls._session)
-        await cls.terrList._update(cls._session)
+    def schedule(cls):
+        for endpoint in cls.endpoints.values():
+            if endpoint.is_due():
+                endpoint.isUpdating = True
+                cls._keep_task(create_task(cls._update_endpoint(endpoint)))
+
+    @classmethod
+    def _keep_task(cls, task):
+        cls._tasks.add(task)
+        task.add_done_callback(cls._on_task_done)
+
+    @classmethod
+    def _on_task_done(cls, task):
+        cls._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            Logger.bot.error(f"{task.get_coro().__qualname__} failed: {task.exception()!r}")
+
+    @classmethod
+    async def _update_endpoint(cls, endpoint: APIEndpoint):
+        startTime = monotonic()
+        try:
+            if not endpoint.breaker.allow():
+                return
+            async with cls._semaphore:
+                await endpoint._update(cls._session)
+        except Exception as e:
+            Logger.bot.warning(f"failed to update {endpoint.name}: {e!r}")
+            endpoint.telemetry.record_failure()
+            if endpoint.breaker.record_failure():
+                Logger.bot.warning(f"{endpoint.name} circuit opened, data is now stale")
+                endpoint._notify_stale(True)
+        else:
+            if endpoint.breaker.record_success():
+                Logger.bot.info(f"{endpoint.name} circuit closed, data is fresh again")
+                endpoint._notify_stale(False)
+        finally:
+            endpoint.nextUpdate = startTime + endpoint.interval
+            endpoint.isUpdating = False
     
     @classmethod
     async def get_player_stats(cls, mcId):
@@ -79,28 +415,80 @@ class WynnAPI:
         for i in [8, 13, 18, 23]:
             mcId.insert(i, "-")
         mcId = "".join(mcId)
-        async with cls._session.get(f"{V2_URL_BASE}player/{mcId}/stats") as resp:
+        async with RequestScheduler.request(cls._session, "GET", 
+                f"{V2_URL_BASE}player/{mcId}/stats") as resp:
             if resp.status != 200:
                 Logger.bot.warning(
                     f"failed request player stat of {mcId} with {resp.status}")
                 return None
             return await resp.json()
     
+    @classmethod
+    async def get_player_ids(cls, igns):
+        igns = list(igns)
+        return dict(zip(igns, await gather(*map(cls.get_player_id, igns))))
+    
     @classmethod
     async def get_player_id(cls, ign):
-        timestamp = int(time())
-        async with cls._session.get(MOJANG_UUID_URL % (ign, timestamp)) as resp:
-            if resp.status != 200:
-                Logger.bot.warning(
-                    f"failed request player id of {ign} with {resp.status}")
-                return None
-            return (await resp.json())["id"]
+        id_ = PlayerCache.get_id(ign)
+        if id_ is not PlayerCache.MISS:
+            return id_
+
+        key = ign.lower()
+        if key not in cls._pendingIds:
+            cls._pendingIds[key] = Future()
+            cls._idBatch.append(ign)
+            if len(cls._idBatch) == 1:
+                cls._keep_task(create_task(cls._flush_id_batch()))
+        return await cls._pendingIds[key]
+    
+    @classmethod
+    async def _flush_id_batch(cls):
+        await sleep(MOJANG_BULK_DELAY)
+        while cls._idBatch:
+            batch = cls._idBatch[:MOJANG_BULK_SIZE]
+            cls._idBatch = cls._idBatch[MOJANG_BULK_SIZE:]
+
+            ids = {}
+            try:
+                async with RequestScheduler.request(cls._session, "POST", 
+                        MOJANG_BULK_UUID_URL, priority=PRIORITY_LOW, json=batch) as resp:
+                    if resp.status == 200:
+                        ids = {p["name"].lower(): p["id"] for p in await resp.json()}
+                        for ign in batch:
+                            PlayerCache.set_id(ign, ids.get(ign.lower(), None))
+                    else:
+                        Logger.bot.warning(
+                            f"failed request player ids of {batch} with {resp.status}")
+            except Exception as e:
+                Logger.bot.warning(f"failed request player ids of {batch}: {e!r}")
+            finally:
+                # every waiting lookup is resolved, names that failed resolve to None
+                for ign in batch:
+                    cls._pendingIds.pop(ign.lower()).set_result(ids.get(ign.lower(), None))
     
     @classmethod
     async def get_player_ign(cls, mcId):
-        async with cls._session.get(MOJANG_IGN_URL % mcId) as resp:
-            if resp.status != 200:
-                Logger.bot.warning(
-                    f"failed request player ign of {mcId} with {resp.status}")
-                return None
-            return (await resp.json())[-1]["name"]
\ No newline at end of file
+        ign = PlayerCache.get_ign(mcId)
+        if ign is not PlayerCache.MISS:
+            return ign
+
+        if mcId in cls._pendingIgns:
+            return await cls._pendingIgns[mcId]
+        cls._pendingIgns[mcId] = Future()
+
+        ign = None
+        try:
+            async with RequestScheduler.request(cls._session, "GET", 
+                    MOJANG_IGN_URL % mcId, priority=PRIORITY_LOW) as resp:
+                if resp.status == 200:
+                    ign = (await resp.json())[-1]["name"]
+                    PlayerCache.set_ign(mcId, ign)
+                elif resp.status == 204:
+                    PlayerCache.set_ign(mcId, None)
+                else:
+                    Logger.bot.warning(
+                        f"failed request player ign of {mcId} with {resp.status}")
+        finally:
+            cls._pendingIgns.pop(mcId).set_result(ign)
+        return ign